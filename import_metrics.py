@@ -0,0 +1,192 @@
+# Stage level instrumentation, shared by neo4j/import_kb.py and postgres/import_db.py.
+# Every stage records duration, processed rows, throughput, peak memory of process and neo4j summary counters.
+# Metrics are written to <metrics_dir>/<importer>.prom (Prometheus text format, suitable for textfile collector)
+# and every finished stage is appended as json line to <metrics_dir>/<importer>.log.jsonl
+import os
+import json
+import time
+import datetime
+import resource
+import threading
+import contextlib
+
+
+DEFAULT_METRICS_DIR = "import_metrics"
+METRICS_PREFIX = "kb_import"
+NEO4J_COUNTERS = [
+    "nodes_created", "nodes_deleted", "relationships_created", "relationships_deleted", "properties_set",
+    "labels_added", "labels_removed", "indexes_added", "indexes_removed", "constraints_added", "constraints_removed"
+]
+
+
+def peak_rss_bytes(who=resource.RUSAGE_SELF):
+    # ru_maxrss is in kilobytes on linux
+    return resource.getrusage(who).ru_maxrss * 1024
+
+
+class StageMetrics:
+    def __init__(self, stage_name):
+        self.stage_name = stage_name
+        self.duration = 0.0
+        self.rows = None
+        self.neo4j_counters = {}
+        self.peak_rss_bytes = 0
+        self.calls = 0
+
+    def add_rows(self, rows_amount):
+        self.rows = (self.rows or 0) + rows_amount
+
+    def add_neo4j_summary(self, summary):
+        # summary is neo4j.ResultSummary (returned by result.consume()), list of summaries or None
+        if summary is None:
+            return
+        if isinstance(summary, (list, tuple)):
+            for single_summary in summary:
+                self.add_neo4j_summary(single_summary)
+            return
+        for counter in NEO4J_COUNTERS:
+            value = getattr(summary.counters, counter, 0)
+            if value:
+                self.neo4j_counters[counter] = self.neo4j_counters.get(counter, 0) + value
+
+    @property
+    def rows_per_second(self):
+        if self.rows is None or self.duration <= 0:
+            return None
+        return self.rows / self.duration
+
+    def as_dict(self):
+        return {
+            "stage": self.stage_name,
+            "duration_seconds": round(self.duration, 6),
+            "rows": self.rows,
+            "rows_per_second": None if self.rows_per_second is None else round(self.rows_per_second, 3),
+            "neo4j_counters": dict(self.neo4j_counters),
+            "peak_rss_bytes": self.peak_rss_bytes,
+            "calls": self.calls
+        }
+
+
+class ImportMetrics:
+    # Stages with the same name are accumulated (e.g. stages of pipeline, which run once per batch).
+    # Stages may be recorded from several threads
+
+    def __init__(self, importer_name, metrics_dir=DEFAULT_METRICS_DIR):
+        # metrics_dir is empty - nothing is written
+        self.importer_name = importer_name
+        self.metrics_dir = metrics_dir
+        self.started = time.time()
+        self.stages = {}
+        self._lock = threading.Lock()
+        if self.metrics_dir:
+            os.makedirs(self.metrics_dir, exist_ok=True)
+        self.log_event("import_started")
+
+    @contextlib.contextmanager
+    def stage(self, stage_name, log=True):
+        # Yields StageMetrics, rows and neo4j summaries of stage are added to it.
+        # log=False - stage is written to json log only in summary of import (use it for per batch stages)
+        with self._lock:
+            stage_metrics = self.stages.setdefault(stage_name, StageMetrics(stage_name))
+        started = time.perf_counter()
+        try:
+            yield stage_metrics
+        finally:
+            duration = time.perf_counter() - started
+            with self._lock:
+                stage_metrics.duration += duration
+                stage_metrics.calls += 1
+                stage_metrics.peak_rss_bytes = peak_rss_bytes()
+            if log:
+                self.log_event("stage_finished", **stage_metrics.as_dict())
+
+    def log_event(self, event, **fields):
+        if not self.metrics_dir:
+            return
+        line = json.dumps(
+            {
+                "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="milliseconds"),
+                "importer": self.importer_name,
+                "event": event,
+                **fields
+            },
+            ensure_ascii=False
+        )
+        with self._lock:
+            with open(
+                os.path.join(self.metrics_dir, f"{self.importer_name}.log.jsonl"), "a", encoding="utf-8"
+            ) as log_file:
+                log_file.write(line + "\n")
+
+    def prometheus_text(self, success):
+        labels = f'importer="{self.importer_name}"'
+        lines = []
+
+        def add_metric(name, metric_type, help_text, samples):
+            lines.append(f"# HELP {METRICS_PREFIX}_{name} {help_text}")
+            lines.append(f"# TYPE {METRICS_PREFIX}_{name} {metric_type}")
+            for sample_labels, value in samples:
+                lines.append(f"{METRICS_PREFIX}_{name}{{{sample_labels}}} {value}")
+
+        with self._lock:
+            stages = [stage_metrics for stage_metrics in self.stages.values()]
+
+        def stage_labels(stage_metrics):
+            return f'{labels},stage="{stage_metrics.stage_name}"'
+
+        add_metric(
+            "stage_duration_seconds", "gauge", "Time spent in stage of the last import.",
+            [(stage_labels(stage_metrics), stage_metrics.duration) for stage_metrics in stages]
+        )
+        add_metric(
+            "stage_rows", "gauge", "Rows processed by stage of the last import.",
+            [(stage_labels(stage_metrics), stage_metrics.rows) for stage_metrics in stages
+             if stage_metrics.rows is not None]
+        )
+        add_metric(
+            "stage_rows_per_second", "gauge", "Throughput of stage of the last import.",
+            [(stage_labels(stage_metrics), stage_metrics.rows_per_second) for stage_metrics in stages
+             if stage_metrics.rows_per_second is not None]
+        )
+        add_metric(
+            "stage_peak_rss_bytes", "gauge", "Peak resident memory of importer process at the end of stage.",
+            [(stage_labels(stage_metrics), stage_metrics.peak_rss_bytes) for stage_metrics in stages]
+        )
+        add_metric(
+            "stage_neo4j_counter", "gauge", "Neo4j summary counters of stage of the last import.",
+            [
+                (f'{stage_labels(stage_metrics)},counter="{counter}"', value)
+                for stage_metrics in stages for counter, value in stage_metrics.neo4j_counters.items()
+            ]
+        )
+        add_metric(
+            "duration_seconds", "gauge", "Duration of the last import.", [(labels, time.time() - self.started)]
+        )
+        add_metric(
+            "peak_rss_bytes", "gauge", "Peak resident memory of importer process.", [(labels, peak_rss_bytes())]
+        )
+        add_metric(
+            "children_peak_rss_bytes", "gauge", "Peak resident memory of finished child processes of importer.",
+            [(labels, peak_rss_bytes(resource.RUSAGE_CHILDREN))]
+        )
+        add_metric("success", "gauge", "1 if the last import has finished successfully.", [(labels, int(success))])
+        add_metric(
+            "last_run_timestamp_seconds", "gauge", "Time of the end of the last import.", [(labels, time.time())]
+        )
+        return "\n".join(lines) + "\n"
+
+    def finish(self, success=True):
+        # Writes prometheus file (replaced atomically, so collector never reads half written file)
+        self.log_event(
+            "import_finished",
+            success=success,
+            duration_seconds=round(time.time() - self.started, 6),
+            peak_rss_bytes=peak_rss_bytes(),
+            stages=[stage_metrics.as_dict() for stage_metrics in self.stages.values()]
+        )
+        if not self.metrics_dir:
+            return
+        prometheus_path = os.path.join(self.metrics_dir, f"{self.importer_name}.prom")
+        with open(prometheus_path + ".tmp", "w", encoding="utf-8") as prometheus_file:
+            prometheus_file.write(self.prometheus_text(success))
+        os.replace(prometheus_path + ".tmp", prometheus_path)
@@ -0,0 +1,461 @@
+# Offline build of fresh knowledge base with "neo4j-admin database import full".
+# mode=build - json files are converted to csv files of nodes and relationships with every computed property
+# (keys of regions, locations, id_codes and paths, IN_SECTOR relationships), csv files are loaded by neo4j-admin.
+# Neo4j server must be stopped, database must not exist (or overwrite_destination=True).
+# mode=schema - constraints and indexes are created, neo4j server must be running.
+# The graph is the same as the one built by import_kb.py (with save_existing_id_codes=True) on empty database.
+# Fresh knowledge base:
+#   python3 ./neo4j/bulk_build.py mode=build regions_filename=regions.json landmarks_filename=landmarks.json
+#       map_sectors_filename=map_sectors.json base_dir=landmarks_dirs
+#   neo4j start
+#   python3 ./neo4j/bulk_build.py mode=schema user=neo4j password=... host=localhost port=7687
+import os
+import sys
+import csv
+import time
+import pathlib
+import datetime
+import subprocess
+from neo4j import GraphDatabase, exceptions
+
+sys.path.append(str(pathlib.Path(__file__).resolve().parent.parent))  # import_metrics is shared by both importers
+from import_metrics import ImportMetrics, DEFAULT_METRICS_DIR
+from sector_index import SectorGrid
+from import_kb import create_constraints, create_indexes, check_connection, MAP_SECTORS_COUNTRY_NAME
+import unwind_import
+
+
+MODES_ARGS = {
+    "build": ["regions_filename", "landmarks_filename", "map_sectors_filename", "base_dir"],
+    "schema": ["user", "password", "host", "port"]
+}
+OPTIONAL_ARGS = {
+    "csv_dir": "bulk_import_csv",  # csv files for neo4j-admin
+    "database": "neo4j",
+    "neo4j_admin": "neo4j-admin",  # path to neo4j-admin executable
+    "overwrite_destination": "False",  # True - existing database is replaced
+    "connection_timeout": "120",  # seconds to wait for started neo4j server (mode=schema)
+    "metrics_dir": DEFAULT_METRICS_DIR  # prometheus and json log files of build stages, empty - not written
+}
+
+
+def none_last(value):
+    # ORDER BY of neo4j places nulls after all values
+    return value is None, value
+
+
+def build_graph(regions_rows, landmarks_rows, map_sectors_rows, country_name=MAP_SECTORS_COUNTRY_NAME):
+    # Applies rows of unwind_import in the same order as import_kb.py, so MERGE and MATCH semantics are kept:
+    # relationships are created only between existing nodes, nodes are identified by name.
+    # Returns dict of nodes and relationships, regions are identified by name, landmarks by index
+    regions = {
+        row["name"]: {
+            "name": row["name"],
+            "key": row["key"],
+            "labels": ["Region"] + [
+                label for region_type, label in unwind_import.REGION_TYPES_LABELS.items() if row[f"is_{region_type}"]
+            ]
+        }
+        for row in regions_rows["regions"]
+    }
+    names_by_key = {region["key"]: name for name, region in regions.items()}
+    includes = {}
+    for row in regions_rows["includes"]:
+        if row["parent_key"] in names_by_key and row["key"] in names_by_key:
+            includes[(names_by_key[row["parent_key"]], names_by_key[row["key"]])] = None
+    neighbour_regions = [
+        (names_by_key[row["key"]], names_by_key[row["neighbour_key"]]) for row in regions_rows["neighbours"]
+        if row["key"] in names_by_key and row["neighbour_key"] in names_by_key
+    ]
+
+    # Map sectors are imported only if country exists. Landmarks are imported after map sectors,
+    # so on empty database explicit coordinates of sectors don't match anything
+    # and IN_SECTOR relationships are found by rectangles of sectors only
+    map_sectors = {}
+    neighbour_sectors = []
+    country_map_sectors = unwind_import.region_key(country_name) in names_by_key
+    if country_map_sectors:
+        for row in map_sectors_rows["sectors"]:
+            map_sectors[row["name"]] = row
+        for row in map_sectors_rows["neighbours"]:
+            for sector_name in (row["name"], row["neighbour_name"]):
+                map_sectors.setdefault(sector_name, {"name": sector_name})
+            neighbour_sectors.append((row["name"], row["neighbour_name"]))
+
+    landmarks = [dict(row) for row in landmarks_rows["landmarks"]]
+    landmarks_indexes = {
+        (landmark["name"], landmark["latitude"], landmark["longitude"]): landmark_index
+        for landmark_index, landmark in enumerate(landmarks)
+    }
+    landmarks_categories = [
+        (
+            landmarks_indexes[(row["name"], row["latitude"], row["longitude"])],
+            row["category_name"],
+            row["main_category_flag"]
+        )
+        for row in landmarks_rows["landmarks_categories"]
+    ]
+    for row in landmarks_rows["cities"]:
+        if row["district_key"] not in names_by_key:
+            continue
+        if row["name"] in regions:
+            regions[row["name"]]["key"] = row["key"]  # ON CREATE SET city:City is skipped for existing region
+        else:
+            regions[row["name"]] = {"name": row["name"], "key": row["key"], "labels": ["Region", "City"]}
+        includes[(names_by_key[row["district_key"]], row["name"])] = None
+        names_by_key[row["key"]] = row["name"]
+    landmarks_located = {}
+    for row in landmarks_rows["landmarks_located"]:
+        if row["region_key"] in names_by_key:
+            landmarks_located[
+                (landmarks_indexes[(row["name"], row["latitude"], row["longitude"])], names_by_key[row["region_key"]])
+            ] = None
+
+    sectors_with_bounds = [
+        (sector["name"], sector["tl_latitude"], sector["tl_longitude"], sector["br_latitude"], sector["br_longitude"])
+        for sector in map_sectors.values() if "tl_latitude" in sector
+    ]
+    points_indexes, sectors_names = SectorGrid(sectors_with_bounds).assign(
+        [landmark["latitude"] for landmark in landmarks], [landmark["longitude"] for landmark in landmarks]
+    )
+    landmarks_sectors = list(zip(points_indexes.tolist(), sectors_names.tolist()))
+
+    return {
+        "regions": regions,
+        "includes": list(includes),
+        "neighbour_regions": neighbour_regions,
+        "landmarks": landmarks,
+        "categories": [row["name"] for row in landmarks_rows["categories"]],
+        "landmarks_categories": landmarks_categories,
+        "landmarks_located": list(landmarks_located),
+        "country_map_sectors": country_map_sectors,
+        "country_name": names_by_key.get(unwind_import.region_key(country_name)),
+        "map_sectors": list(map_sectors.values()),
+        "neighbour_sectors": neighbour_sectors,
+        "landmarks_sectors": landmarks_sectors
+    }
+
+
+def encode_hierarchy(graph, base_dir):
+    # Sets id_code of regions and id_code and path of landmarks in the same order as
+    # encoding_regions_and_landmarks_no_change_id_code of import_kb.py does, existing id_codes are kept
+    # (checked by tests/test_bulk_build.py and tests/test_encoding.py).
+    # Returns amount of hierarchy records
+    regions = graph["regions"]
+    landmarks = graph["landmarks"]
+    children, parents = {}, {}
+    for parent_name, child_name in graph["includes"]:
+        children.setdefault(parent_name, []).append(child_name)
+        parents.setdefault(child_name, []).append(parent_name)
+    landmarks_of_regions = {}
+    for landmark_index, region_name in graph["landmarks_located"]:
+        landmarks_of_regions.setdefault(region_name, []).append(landmark_index)
+
+    def included(parent_name, label):
+        if parent_name is None:
+            return [None]
+        return [name for name in children.get(parent_name, []) if label in regions[name]["labels"]] or [None]
+
+    records = set()
+    for country_name, country in regions.items():
+        if "Country" not in country["labels"]:
+            continue
+        for state_name in included(country_name, "State"):
+            for district_name in included(state_name, "District"):
+                for city_name in included(district_name, "City"):
+                    region_name = city_name if city_name is not None else district_name
+                    for landmark_index in landmarks_of_regions.get(region_name, [None]):
+                        records.add((country_name, state_name, district_name, city_name, landmark_index))
+
+    def record_order(record):
+        landmark = None if record[4] is None else landmarks[record[4]]
+        return (
+            none_last(record[0]), none_last(record[1]), none_last(record[2]), none_last(record[3]),
+            none_last(None if landmark is None else landmark["name"]),
+            none_last(None if landmark is None else landmark["latitude"]),
+            none_last(None if landmark is None else landmark["longitude"])
+        )
+
+    counters_of_members = {}  # region name or landmark index -> keys of counters, the member is counted by
+    for region_name, region in regions.items():
+        counters_keys = [("country", None)] if "Country" in region["labels"] else []
+        for label, level in [("State", "state"), ("District", "district"), ("City", "city")]:
+            if label in region["labels"]:
+                counters_keys.extend((level, parent_name) for parent_name in parents.get(region_name, []))
+        counters_of_members[region_name] = counters_keys
+    for landmark_index, region_name in graph["landmarks_located"]:
+        counters_of_members.setdefault(landmark_index, []).append(("landmark", region_name))
+    last_used_id_codes = {}
+
+    def use_id_code(member, id_code):
+        for counter_key in counters_of_members.get(member, []):
+            if id_code > last_used_id_codes.get(counter_key, 0):
+                last_used_id_codes[counter_key] = id_code
+
+    # New id_codes follow the existing ones of the same parent
+    for region_name, region in regions.items():
+        if "id_code" in region:
+            use_id_code(region_name, region["id_code"])
+    for landmark_index, landmark in enumerate(landmarks):
+        if "id_code" in landmark:
+            use_id_code(landmark_index, landmark["id_code"])
+
+    def region_id_code(region_name, counter_key):
+        if region_name is None:
+            return 0
+        if "id_code" not in regions[region_name]:
+            id_code = last_used_id_codes.get(counter_key, 0) + 1
+            last_used_id_codes[counter_key] = id_code
+            use_id_code(region_name, id_code)
+            regions[region_name]["id_code"] = id_code
+        return regions[region_name]["id_code"]
+
+    records = sorted(records, key=record_order)
+    for country_name, state_name, district_name, city_name, landmark_index in records:
+        country_id_code = region_id_code(country_name, ("country", None))
+        state_id_code = region_id_code(state_name, ("state", country_name))
+        district_id_code = region_id_code(district_name, ("district", state_name))
+        city_id_code = region_id_code(city_name, ("city", district_name))
+        # Landmark, located in several regions, is encoded only in the first of them
+        if landmark_index is not None and "id_code" not in landmarks[landmark_index]:
+            counter_key = ("landmark", district_name if city_name is None else city_name)
+            landmark_id_code = last_used_id_codes.get(counter_key, 0) + 1
+            last_used_id_codes[counter_key] = landmark_id_code
+            use_id_code(landmark_index, landmark_id_code)
+            landmarks[landmark_index]["id_code"] = landmark_id_code
+            landmarks[landmark_index]["path"] = os.path.join(
+                base_dir, f"{country_id_code}/{state_id_code}/{district_id_code}/{city_id_code}/{landmark_id_code}"
+            )
+    return len(records)
+
+
+def write_csv(csv_dir, filename, header, rows):
+    # Returns path of file and amount of rows. Empty field is not set as property by neo4j-admin
+    path = os.path.join(csv_dir, filename)
+    rows_amount = 0
+    with open(path, "w", encoding="utf-8", newline="") as csv_file:
+        writer = csv.writer(csv_file)
+        writer.writerow(header)
+        for row in rows:
+            writer.writerow(["" if value is None else value for value in row])
+            rows_amount += 1
+    return path, rows_amount
+
+
+def write_csv_files(graph, csv_dir):
+    # Returns (nodes files, relationships files, amount of rows)
+    os.makedirs(csv_dir, exist_ok=True)
+    nodes_files = [
+        write_csv(
+            csv_dir, "regions.csv", ["name:ID(Region)", "key", "id_code:long", ":LABEL"],
+            (
+                [region["name"], region["key"], region.get("id_code"), ";".join(region["labels"])]
+                for region in graph["regions"].values()
+            )
+        ),
+        write_csv(
+            csv_dir, "landmarks.csv",
+            [
+                ":ID(Landmark)", "name", "latitude:double", "longitude:double", "location:point{crs:WGS-84}",
+                "id_code:long", "path", ":LABEL"
+            ],
+            (
+                [
+                    landmark_index, landmark["name"], repr(landmark["latitude"]), repr(landmark["longitude"]),
+                    f"{{latitude: {landmark['latitude']!r}, longitude: {landmark['longitude']!r}}}",
+                    landmark.get("id_code"), landmark.get("path"), "Landmark"
+                ]
+                for landmark_index, landmark in enumerate(graph["landmarks"])
+            )
+        ),
+        write_csv(
+            csv_dir, "landmark_categories.csv", ["name:ID(LandmarkCategory)", ":LABEL"],
+            ([category_name, "LandmarkCategory"] for category_name in graph["categories"])
+        ),
+        write_csv(
+            csv_dir, "map_sectors.csv",
+            [
+                "name:ID(MapSector)", "tl_latitude:double", "tl_longitude:double",
+                "br_latitude:double", "br_longitude:double", ":LABEL"
+            ],
+            (
+                [
+                    sector["name"], sector.get("tl_latitude"), sector.get("tl_longitude"),
+                    sector.get("br_latitude"), sector.get("br_longitude"), "MapSector"
+                ]
+                for sector in graph["map_sectors"]
+            )
+        ),
+        write_csv(
+            csv_dir, "country_map_sectors.csv", [":ID(CountryMapSectors)", ":LABEL"],
+            [[0, "CountryMapSectors"]] if graph["country_map_sectors"] else []
+        )
+    ]
+    relationships_files = [
+        write_csv(
+            csv_dir, "regions_relationships.csv", [":START_ID(Region)", ":END_ID(Region)", ":TYPE"],
+            [[parent_name, name, "INCLUDE"] for parent_name, name in graph["includes"]] +
+            [[name, neighbour_name, "NEIGHBOUR_REGION"] for name, neighbour_name in graph["neighbour_regions"]]
+        ),
+        write_csv(
+            csv_dir, "landmarks_located.csv", [":START_ID(Landmark)", ":END_ID(Region)", ":TYPE"],
+            ([landmark_index, region_name, "LOCATED"] for landmark_index, region_name in graph["landmarks_located"])
+        ),
+        write_csv(
+            csv_dir, "landmarks_categories.csv",
+            [":START_ID(Landmark)", ":END_ID(LandmarkCategory)", "main_category_flag:boolean", ":TYPE"],
+            (
+                [landmark_index, category_name, str(main_category_flag).lower(), "REFERS"]
+                for landmark_index, category_name, main_category_flag in graph["landmarks_categories"]
+            )
+        ),
+        write_csv(
+            csv_dir, "landmarks_sectors.csv", [":START_ID(Landmark)", ":END_ID(MapSector)", ":TYPE"],
+            ([landmark_index, sector_name, "IN_SECTOR"] for landmark_index, sector_name in graph["landmarks_sectors"])
+        ),
+        write_csv(
+            csv_dir, "country_divided_on_sectors.csv", [":START_ID(Region)", ":END_ID(CountryMapSectors)", ":TYPE"],
+            [[graph["country_name"], 0, "DIVIDED_ON_SECTORS"]] if graph["country_map_sectors"] else []
+        ),
+        write_csv(
+            csv_dir, "map_sectors_include.csv", [":START_ID(CountryMapSectors)", ":END_ID(MapSector)", ":TYPE"],
+            ([0, sector["name"], "INCLUDE_SECTOR"] for sector in graph["map_sectors"] if "tl_latitude" in sector)
+        ),
+        write_csv(
+            csv_dir, "map_sectors_neighbours.csv", [":START_ID(MapSector)", ":END_ID(MapSector)", ":TYPE"],
+            ([name, neighbour_name, "NEIGHBOUR_SECTOR"] for name, neighbour_name in graph["neighbour_sectors"])
+        )
+    ]
+    rows_amount = sum(rows for _, rows in nodes_files) + sum(rows for _, rows in relationships_files)
+    return [path for path, _ in nodes_files], [path for path, _ in relationships_files], rows_amount
+
+
+def neo4j_admin_import(neo4j_admin, database, nodes_files, relationships_files, overwrite_destination):
+    command = [neo4j_admin, "database", "import", "full"]
+    command.extend(f"--nodes={path}" for path in nodes_files)
+    command.extend(f"--relationships={path}" for path in relationships_files)
+    if overwrite_destination:
+        command.append("--overwrite-destination=true")
+    command.append(database)
+    print(" ".join(command), flush=True)
+    subprocess.run(command, check=True)
+
+
+def build(
+    regions_filename, landmarks_filename, map_sectors_filename, base_dir,
+    csv_dir, database, neo4j_admin, overwrite_destination, metrics
+):
+    print("Parsing json files...", flush=True)
+    with metrics.stage("parse_json") as stage:
+        regions_rows = unwind_import.parse_regions(unwind_import.load_json(regions_filename))
+        landmarks_rows = unwind_import.parse_landmarks(unwind_import.load_json(landmarks_filename))
+        map_sectors_rows = unwind_import.parse_map_sectors(unwind_import.load_json(map_sectors_filename))
+    print(f"Json files have been parsed in {datetime.timedelta(seconds=stage.duration)}", flush=True)
+
+    print("Building graph...", flush=True)
+    with metrics.stage("build_graph") as stage:
+        graph = build_graph(regions_rows, landmarks_rows, map_sectors_rows)
+        stage.add_rows(len(graph["regions"]) + len(graph["landmarks"]) + len(graph["map_sectors"]))
+    print(f"Graph has been built in {datetime.timedelta(seconds=stage.duration)}", flush=True)
+
+    print("Encoding regions and landmarks...", flush=True)
+    with metrics.stage("encoding_regions_and_landmarks") as stage:
+        stage.add_rows(encode_hierarchy(graph, base_dir))
+    print(
+        f"Landmarks and regions have been encoded in {datetime.timedelta(seconds=stage.duration)}", flush=True
+    )
+
+    print(f"Writing csv files to \"{csv_dir}\"...", flush=True)
+    with metrics.stage("write_csv") as stage:
+        nodes_files, relationships_files, rows_amount = write_csv_files(graph, csv_dir)
+        stage.add_rows(rows_amount)
+    print(f"Csv files have been written in {datetime.timedelta(seconds=stage.duration)}", flush=True)
+
+    print(f"Importing csv files to database \"{database}\"...", flush=True)
+    with metrics.stage("neo4j_admin_import") as stage:
+        neo4j_admin_import(neo4j_admin, database, nodes_files, relationships_files, overwrite_destination)
+    print(f"Csv files have been imported in {datetime.timedelta(seconds=stage.duration)}", flush=True)
+
+
+def wait_for_connection(driver, timeout):
+    started = time.monotonic()
+    while True:
+        try:
+            check_connection(driver)
+            return
+        except exceptions.ServiceUnavailable:
+            if time.monotonic() - started > timeout:
+                raise
+            time.sleep(1)
+
+
+def create_schema(user, password, host, port, connection_timeout, metrics):
+    print("Trying to connect to the knowledge base...", flush=True)
+    with GraphDatabase.driver(f'bolt://{host}:{port}', auth=(user, password)) as driver:
+        wait_for_connection(driver, connection_timeout)
+        print("Knowledge base is successfully connected", flush=True)
+
+        print("Creating constraints...", flush=True)
+        with metrics.stage("create_constraints") as stage:
+            stage.add_neo4j_summary(create_constraints(driver))
+        print(f"Constraints are created in {datetime.timedelta(seconds=stage.duration)}", flush=True)
+
+        print("Creating indexes...", flush=True)
+        with metrics.stage("create_indexes") as stage:
+            stage.add_neo4j_summary(create_indexes(driver))
+        print(f"Indexes created in {datetime.timedelta(seconds=stage.duration)}", flush=True)
+
+
+def bulk_function(mode, metrics_dir, connection_timeout, overwrite_destination, **args):
+    start = datetime.datetime.now()
+    metrics = ImportMetrics(f"neo4j_bulk_{mode}", metrics_dir)
+    success = False
+    try:
+        if mode == "build":
+            build(
+                args["regions_filename"], args["landmarks_filename"], args["map_sectors_filename"], args["base_dir"],
+                args["csv_dir"], args["database"], args["neo4j_admin"], overwrite_destination, metrics
+            )
+        else:
+            create_schema(
+                args["user"], args["password"], args["host"], args["port"], connection_timeout, metrics
+            )
+        print(f"Bulk {mode} is complete in {datetime.datetime.now() - start}", flush=True)
+        success = True
+    except Exception as e:
+        metrics.log_event("import_failed", error=str(e), error_type=type(e).__name__)
+        raise
+    finally:
+        metrics.finish(success)
+
+
+def main():
+    args = {}
+    for arg in sys.argv[1:]:
+        arg_pair = arg.split("=")
+        if len(arg_pair) != 2:
+            raise AttributeError(
+                f"Invalid argument \"{arg}\"."
+            )
+        args[arg_pair[0].strip()] = arg_pair[1].strip()
+    if args.get("mode") not in MODES_ARGS:
+        raise AttributeError(f"Available values for mode are: {', '.join(MODES_ARGS)}.")
+    for arg in args:
+        if arg != "mode" and arg not in MODES_ARGS[args["mode"]] and arg not in OPTIONAL_ARGS:
+            raise AttributeError(f"Invalid argument: \"{arg}\".")
+    if any(arg not in args for arg in MODES_ARGS[args["mode"]]):
+        raise AttributeError("Not all required attributes are given.")
+    for arg, default_value in OPTIONAL_ARGS.items():
+        args.setdefault(arg, default_value)
+    if args["overwrite_destination"].lower() == "true" or args["overwrite_destination"].lower() == 't':
+        args["overwrite_destination"] = True
+    elif args["overwrite_destination"].lower() == "false" or args["overwrite_destination"].lower() == 'f':
+        args["overwrite_destination"] = False
+    else:
+        raise AttributeError("Available values for overwrite_destination are: True, T to set param to True; False, F to set param to False (case insensitive).")
+    args["connection_timeout"] = float(args["connection_timeout"])
+    bulk_function(**args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,453 @@
+# Delta import: only records changed since the last import are written.
+# Every source record (region by canonical key, landmark by name and coordinates, map sector by name) is fingerprinted
+# together with relationships it owns. Fingerprints are compared with source_hash of nodes, so created, changed and
+# removed records are found without writing the whole dataset. Nodes without source_hash (imported by other engines)
+# are never removed. source_hash is written after the record is applied, so failed import is repeated next time.
+import os
+import json
+import hashlib
+
+import unwind_import
+
+
+REGIONS_HASHES_QUERY = """
+    MATCH (region: Region)
+        WHERE region.source_hash IS NOT null
+    RETURN region.key AS key, region.source_hash AS source_hash
+"""
+LANDMARKS_HASHES_QUERY = """
+    MATCH (landmark: Landmark)
+        WHERE landmark.source_hash IS NOT null
+    RETURN
+        landmark.name AS name,
+        landmark.latitude AS latitude,
+        landmark.longitude AS longitude,
+        landmark.source_hash AS source_hash
+"""
+MAP_SECTORS_HASHES_QUERY = """
+    MATCH (sector: MapSector)
+        WHERE sector.source_hash IS NOT null
+    RETURN sector.name AS name, sector.source_hash AS source_hash
+"""
+REMOVE_REGIONS_QUERY = """
+    UNWIND $batch AS row
+    MATCH (region: Region {key: row.key})
+    DETACH DELETE region
+"""
+RESET_REGIONS_QUERY = """
+    UNWIND $batch AS row
+    MATCH (region: Region {key: row.key})
+    REMOVE region:Country:State:District:City
+    WITH region
+    OPTIONAL MATCH (region)-[neighbour:NEIGHBOUR_REGION]-(: Region)
+    DELETE neighbour
+    WITH DISTINCT region
+    OPTIONAL MATCH (: Region)-[include:INCLUDE]->(region)
+    DELETE include
+"""
+REMOVE_MAP_SECTORS_QUERY = """
+    UNWIND $batch AS row
+    MATCH (sector: MapSector {name: row.name})
+    DETACH DELETE sector
+"""
+RESET_MAP_SECTORS_QUERY = """
+    // Landmarks of changed sector lose all their sectors and are connected again by rectangles of sectors
+    UNWIND $batch AS row
+    MATCH (sector: MapSector {name: row.name})
+    OPTIONAL MATCH (sector)-[neighbour:NEIGHBOUR_SECTOR]-(: MapSector)
+    DELETE neighbour
+    WITH DISTINCT sector
+    OPTIONAL MATCH (landmark: Landmark)-[:IN_SECTOR]->(sector)
+    WITH DISTINCT landmark
+    OPTIONAL MATCH (landmark)-[in_sector:IN_SECTOR]->(: MapSector)
+    DELETE in_sector
+"""
+REMOVE_LANDMARKS_QUERY = """
+    UNWIND $batch AS row
+    MATCH (landmark: Landmark {name: row.name, latitude: row.latitude, longitude: row.longitude})
+    DETACH DELETE landmark
+"""
+RESET_LANDMARKS_QUERY = """
+    // id_code and path are kept only if landmark is located in the same regions
+    UNWIND $batch AS row
+    MATCH (landmark: Landmark {name: row.name, latitude: row.latitude, longitude: row.longitude})
+    OPTIONAL MATCH (landmark)-[refer:REFERS]->(: LandmarkCategory)
+    DELETE refer
+    WITH DISTINCT row, landmark
+    OPTIONAL MATCH (landmark)-[located:LOCATED]->(region: Region)
+    WITH row, landmark, collect(located) AS located_relationships, collect(region.key) AS old_regions_keys
+    FOREACH (located IN located_relationships | DELETE located)
+    WITH row, landmark, old_regions_keys,
+        all(key IN row.regions_keys WHERE key IN old_regions_keys) AND
+        all(key IN old_regions_keys WHERE key IN row.regions_keys) AS same_regions
+    SET
+        landmark.id_code = CASE WHEN same_regions THEN landmark.id_code ELSE null END,
+        landmark.path = CASE WHEN same_regions THEN landmark.path ELSE null END
+"""
+SET_REGIONS_HASHES_QUERY = """
+    UNWIND $batch AS row
+    MATCH (region: Region {key: row.key})
+    SET region.source_hash = row.source_hash
+"""
+SET_LANDMARKS_HASHES_QUERY = """
+    UNWIND $batch AS row
+    MATCH (landmark: Landmark {name: row.name, latitude: row.latitude, longitude: row.longitude})
+    SET landmark.source_hash = row.source_hash
+"""
+SET_MAP_SECTORS_HASHES_QUERY = """
+    UNWIND $batch AS row
+    MATCH (sector: MapSector {name: row.name})
+    SET sector.source_hash = row.source_hash
+"""
+UNENCODED_REGIONS_QUERY = """
+    // Regions without id_code in the same places of hierarchy, where full encoding finds them
+    MATCH (country: Country)
+    OPTIONAL MATCH (country)-[:INCLUDE]->(state: State)
+    OPTIONAL MATCH (state)-[:INCLUDE]->(district: District)
+    OPTIONAL MATCH (district)-[:INCLUDE]->(city: City)
+    UNWIND [member IN [country, state, district, city] WHERE member IS NOT null AND member.id_code IS null] AS region
+    RETURN count(DISTINCT region) AS unencoded_amount
+"""
+NEW_LANDMARKS_QUERY = """
+    // Landmarks without id_code in the same places of hierarchy, where full encoding finds them:
+    // in city of district or in district without cities
+    MATCH (landmark: Landmark)-[:LOCATED]->(region: Region)
+        WHERE landmark.id_code IS null
+    OPTIONAL MATCH (cityDistrict: District)-[:INCLUDE]->(region)
+        WHERE region:City
+    WITH landmark, region, cityDistrict, coalesce(cityDistrict, region) AS district
+        WHERE district:District AND (cityDistrict IS NOT null OR NOT EXISTS { (district)-[:INCLUDE]->(:City) })
+    MATCH (country: Country)-[:INCLUDE]->(state: State)-[:INCLUDE]->(district)
+    OPTIONAL MATCH (encodedLandmark: Landmark)-[:LOCATED]->(region)
+        WHERE encodedLandmark.id_code IS NOT null
+    RETURN
+        landmark.name AS landmark_name,
+        landmark.latitude AS landmark_latitude,
+        landmark.longitude AS landmark_longitude,
+        region.name AS region_name,
+        country.name AS country_name,
+        country.id_code AS country_id_code,
+        state.name AS state_name,
+        state.id_code AS state_id_code,
+        district.name AS district_name,
+        district.id_code AS district_id_code,
+        CASE WHEN cityDistrict IS null THEN null ELSE region.name END AS city_name,
+        CASE WHEN cityDistrict IS null THEN 0 ELSE region.id_code END AS city_id_code,
+        max(encodedLandmark.id_code) AS last_used_id_code
+    ORDER BY
+        country_name ASC,
+        state_name ASC,
+        district_name ASC,
+        city_name ASC,
+        landmark_name ASC
+"""
+
+
+def fingerprint(value):
+    return hashlib.sha1(json.dumps(value, ensure_ascii=False, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def landmark_key(row):
+    return row["name"], row["latitude"], row["longitude"]
+
+
+def regions_records(regions_rows):
+    # key -> {"source_hash": ..., "row": ...}. Region owns its labels, INCLUDE from parents and NEIGHBOUR_REGION
+    parents, neighbours = {}, {}
+    for row in regions_rows["includes"]:
+        parents.setdefault(row["key"], []).append(row["parent_key"])
+    for row in regions_rows["neighbours"]:
+        neighbours.setdefault(row["key"], []).append(row["neighbour_key"])
+        neighbours.setdefault(row["neighbour_key"], []).append(row["key"])
+    return {
+        row["key"]: {
+            "source_hash": fingerprint(
+                {
+                    "row": row,
+                    "parents": sorted(parents.get(row["key"], [])),
+                    "neighbours": sorted(neighbours.get(row["key"], []))
+                }
+            ),
+            "row": row
+        }
+        for row in regions_rows["regions"]
+    }
+
+
+def landmarks_records(landmarks_rows):
+    # (name, latitude, longitude) -> {"source_hash": ..., "row": ..., "regions_keys": [...]}.
+    # Landmark owns REFERS, LOCATED and city, which is created for it
+    cities = {row["key"]: row for row in landmarks_rows["cities"]}
+    categories, regions_keys = {}, {}
+    for row in landmarks_rows["landmarks_categories"]:
+        categories.setdefault(landmark_key(row), []).append([row["category_name"], row["main_category_flag"]])
+    for row in landmarks_rows["landmarks_located"]:
+        regions_keys.setdefault(landmark_key(row), []).append(row["region_key"])
+    records = {}
+    for row in landmarks_rows["landmarks"]:
+        key = landmark_key(row)
+        records[key] = {
+            "source_hash": fingerprint(
+                {
+                    "categories": sorted(categories.get(key, [])),
+                    "regions_keys": sorted(regions_keys.get(key, [])),
+                    "cities": sorted(
+                        [cities[region_key] for region_key in regions_keys.get(key, []) if region_key in cities],
+                        key=lambda city: city["key"]
+                    )
+                }
+            ),
+            "row": row,
+            "regions_keys": sorted(regions_keys.get(key, []))
+        }
+    return records
+
+
+def map_sectors_records(map_sectors_rows):
+    # name -> {"source_hash": ..., "row": ...}. Sector owns its bounds, NEIGHBOUR_SECTOR and listed landmarks
+    neighbours, landmarks = {}, {}
+    for row in map_sectors_rows["neighbours"]:
+        neighbours.setdefault(row["name"], []).append(row["neighbour_name"])
+        neighbours.setdefault(row["neighbour_name"], []).append(row["name"])
+    for row in map_sectors_rows["sectors_landmarks"]:
+        landmarks.setdefault(row["sector_name"], []).append([row["latitude"], row["longitude"]])
+    return {
+        row["name"]: {
+            "source_hash": fingerprint(
+                {
+                    "row": row,
+                    "neighbours": sorted(neighbours.get(row["name"], [])),
+                    "landmarks": sorted(landmarks.get(row["name"], []))
+                }
+            ),
+            "row": row
+        }
+        for row in map_sectors_rows["sectors"]
+    }
+
+
+def compare(records, stored_hashes):
+    # Returns (created, changed, removed) keys
+    created = [key for key in records if key not in stored_hashes]
+    changed = [
+        key for key in records if key in stored_hashes and stored_hashes[key] != records[key]["source_hash"]
+    ]
+    removed = [key for key in stored_hashes if key not in records]
+    return created, changed, removed
+
+
+def import_delta(driver, regions_rows, landmarks_rows, map_sectors_rows, country_key):
+    # Returns (amounts of created, changed and removed records, summaries of writes)
+    write_batches = unwind_import.write_batches
+    summaries = []
+    stats = {}
+    regions = regions_records(regions_rows)
+    landmarks = landmarks_records(landmarks_rows)
+    map_sectors = map_sectors_records(map_sectors_rows)
+
+    with driver.session() as session:
+        stored_regions = {
+            record.get("key"): record.get("source_hash") for record in session.run(REGIONS_HASHES_QUERY)
+        }
+        stored_landmarks = {
+            (record.get("name"), record.get("latitude"), record.get("longitude")): record.get("source_hash")
+            for record in session.run(LANDMARKS_HASHES_QUERY)
+        }
+        stored_map_sectors = {
+            record.get("name"): record.get("source_hash") for record in session.run(MAP_SECTORS_HASHES_QUERY)
+        }
+
+        # Regions
+        created, changed, removed = compare(regions, stored_regions)
+        stats["regions"] = {"created": len(created), "changed": len(changed), "removed": len(removed)}
+        touched_regions = set(created) | set(changed)
+        summaries.extend(write_batches(session, REMOVE_REGIONS_QUERY, [{"key": key} for key in removed]))
+        summaries.extend(write_batches(session, RESET_REGIONS_QUERY, [{"key": key} for key in changed]))
+        summaries.extend(
+            write_batches(session, unwind_import.REGIONS_QUERY, [regions[key]["row"] for key in created + changed])
+        )
+        summaries.extend(
+            write_batches(
+                session, unwind_import.NEIGHBOUR_REGIONS_QUERY,
+                [
+                    row for row in regions_rows["neighbours"]
+                    if row["key"] in touched_regions or row["neighbour_key"] in touched_regions
+                ]
+            )
+        )
+        summaries.extend(
+            write_batches(
+                session, unwind_import.INCLUDE_REGIONS_QUERY,
+                [
+                    row for row in regions_rows["includes"]
+                    if row["key"] in touched_regions or row["parent_key"] in touched_regions
+                ]
+            )
+        )
+
+        # Map sectors (only if country exists, as in full import)
+        created, changed, removed = compare(map_sectors, stored_map_sectors)
+        stats["map_sectors"] = {"created": len(created), "changed": len(changed), "removed": len(removed)}
+        summaries.extend(write_batches(session, REMOVE_MAP_SECTORS_QUERY, [{"name": name} for name in removed]))
+        applied_map_sectors = []
+        if created or changed:
+            result = session.run(unwind_import.COUNTRY_MAP_SECTORS_QUERY, country_key=country_key)
+            countries_amount = result.single()["countries_amount"]
+            summaries.append(result.consume())
+            if countries_amount:
+                applied_map_sectors = created + changed
+        touched_map_sectors = set(applied_map_sectors)
+        summaries.extend(
+            write_batches(
+                session, RESET_MAP_SECTORS_QUERY, [{"name": name} for name in changed if name in touched_map_sectors]
+            )
+        )
+        summaries.extend(
+            write_batches(
+                session, unwind_import.MAP_SECTORS_QUERY, [map_sectors[name]["row"] for name in applied_map_sectors]
+            )
+        )
+        summaries.extend(
+            write_batches(
+                session, unwind_import.SECTORS_LANDMARKS_QUERY,
+                [row for row in map_sectors_rows["sectors_landmarks"] if row["sector_name"] in touched_map_sectors]
+            )
+        )
+        summaries.extend(
+            write_batches(
+                session, unwind_import.NEIGHBOUR_SECTORS_QUERY,
+                [
+                    row for row in map_sectors_rows["neighbours"]
+                    if row["name"] in touched_map_sectors or row["neighbour_name"] in touched_map_sectors
+                ]
+            )
+        )
+
+        # Landmarks. Unchanged landmarks, located in created or changed regions, are connected with them again
+        created, changed, removed = compare(landmarks, stored_landmarks)
+        stats["landmarks"] = {"created": len(created), "changed": len(changed), "removed": len(removed)}
+        applied_landmarks = set(created) | set(changed)
+        summaries.extend(
+            write_batches(
+                session, REMOVE_LANDMARKS_QUERY,
+                [{"name": name, "latitude": latitude, "longitude": longitude} for name, latitude, longitude in removed]
+            )
+        )
+        summaries.extend(
+            write_batches(
+                session, RESET_LANDMARKS_QUERY,
+                [{**landmarks[key]["row"], "regions_keys": landmarks[key]["regions_keys"]} for key in changed]
+            )
+        )
+        summaries.extend(
+            write_batches(session, unwind_import.LANDMARKS_QUERY, [landmarks[key]["row"] for key in created + changed])
+        )
+        categories_names = {
+            row["category_name"] for row in landmarks_rows["landmarks_categories"]
+            if landmark_key(row) in applied_landmarks
+        }
+        summaries.extend(
+            write_batches(
+                session, unwind_import.LANDMARK_CATEGORIES_QUERY,
+                [row for row in landmarks_rows["categories"] if row["name"] in categories_names]
+            )
+        )
+        summaries.extend(
+            write_batches(
+                session, unwind_import.LANDMARKS_CATEGORIES_QUERY,
+                [row for row in landmarks_rows["landmarks_categories"] if landmark_key(row) in applied_landmarks]
+            )
+        )
+        applied_cities = {
+            row["region_key"] for row in landmarks_rows["landmarks_located"] if landmark_key(row) in applied_landmarks
+        }
+        cities_of_touched_regions = {
+            row["key"] for row in landmarks_rows["cities"] if row["district_key"] in touched_regions
+        }
+        summaries.extend(
+            write_batches(
+                session, unwind_import.CITIES_QUERY,
+                [
+                    row for row in landmarks_rows["cities"]
+                    if row["key"] in applied_cities or row["district_key"] in touched_regions
+                ]
+            )
+        )
+        summaries.extend(
+            write_batches(
+                session, unwind_import.LANDMARKS_LOCATED_QUERY,
+                [
+                    row for row in landmarks_rows["landmarks_located"]
+                    if landmark_key(row) in applied_landmarks or row["region_key"] in touched_regions or
+                    row["region_key"] in cities_of_touched_regions
+                ]
+            )
+        )
+
+        # Fingerprints of applied records
+        summaries.extend(
+            write_batches(
+                session, SET_REGIONS_HASHES_QUERY,
+                [{"key": key, "source_hash": regions[key]["source_hash"]} for key in touched_regions]
+            )
+        )
+        summaries.extend(
+            write_batches(
+                session, SET_MAP_SECTORS_HASHES_QUERY,
+                [{"name": name, "source_hash": map_sectors[name]["source_hash"]} for name in applied_map_sectors]
+            )
+        )
+        summaries.extend(
+            write_batches(
+                session, SET_LANDMARKS_HASHES_QUERY,
+                [{**landmarks[key]["row"], "source_hash": landmarks[key]["source_hash"]} for key in applied_landmarks]
+            )
+        )
+    return stats, summaries
+
+
+def needs_full_encoding(session, delta_stats):
+    # Only full encoding assigns id_codes of regions, so it is needed, if regions are created by delta
+    # or regions of hierarchy have no id_code (e.g. cities, created for new landmarks)
+    if delta_stats["regions"]["created"]:
+        return True
+    return session.run(UNENCODED_REGIONS_QUERY).single()["unencoded_amount"] > 0
+
+
+def new_landmarks_id_codes(session, base_dir):
+    # id_codes and paths of landmarks without id_code, the same as full encoding with save_existing_id_codes=True
+    # assigns, if all regions above them are already encoded. Returns rows for write_landmarks_id_codes_and_paths
+    # and amount of records or None, if there are regions without id_code (full encoding is needed)
+    rows = []
+    last_used_id_codes = {}  # region name -> the last used id_code of landmarks located in region
+    landmarks_regions = {}
+    records = list(session.run(NEW_LANDMARKS_QUERY))
+    for record in records:
+        key = (record.get("landmark_name"), record.get("landmark_latitude"), record.get("landmark_longitude"))
+        landmarks_regions.setdefault(key, []).append(record.get("region_name"))
+        last_used_id_codes[record.get("region_name")] = record.get("last_used_id_code") or 0
+
+    assigned_landmarks = set()
+    for record in records:
+        chain_id_codes = [
+            record.get("country_id_code"), record.get("state_id_code"),
+            record.get("district_id_code"), record.get("city_id_code")
+        ]
+        if any(id_code is None for id_code in chain_id_codes):
+            return None
+        key = (record.get("landmark_name"), record.get("landmark_latitude"), record.get("landmark_longitude"))
+        # Landmark, located in several regions, is encoded only in the first of them
+        if key in assigned_landmarks:
+            continue
+        assigned_landmarks.add(key)
+        landmark_id_code = last_used_id_codes[record.get("region_name")] + 1
+        for region_name in landmarks_regions[key]:
+            last_used_id_codes[region_name] = max(last_used_id_codes[region_name], landmark_id_code)
+        rows.append({
+            "name": key[0],
+            "latitude": key[1],
+            "longitude": key[2],
+            "id_code": landmark_id_code,
+            "path": os.path.join(base_dir, "/".join(str(id_code) for id_code in chain_id_codes + [landmark_id_code]))
+        })
+    return rows, len(records)
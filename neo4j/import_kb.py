@@ -5,12 +5,36 @@ import os
 import pathlib
 from neo4j import GraphDatabase, Driver, exceptions
 
+sys.path.append(str(pathlib.Path(__file__).resolve().parent.parent))  # import_metrics is shared by both importers
+from import_metrics import ImportMetrics, DEFAULT_METRICS_DIR
+from sector_index import SectorGrid
+from unwind_import import region_key
+import unwind_import
+import parallel_import
+import delta_import
+
 
 AVAILABLE_ARGS = [
     "user", "password", "host", "port",
     "regions_filename", "landmarks_filename", "map_sectors_filename",
     "base_dir", "save_existing_id_codes"
 ]
+OPTIONAL_ARGS = {
+    "metrics_dir": DEFAULT_METRICS_DIR,  # prometheus and json log files of import stages, empty - not written
+    # apoc - json files are loaded by neo4j server from its import directory,
+    # python - json files are parsed by importer and written with UNWIND batches (see unwind_import.py),
+    # delta - only records changed since the last delta import are written (see delta_import.py)
+    "import_engine": "apoc",
+    # threads of import_engine=python, > 1 - map sectors and landmarks are imported concurrently,
+    # landmarks are written by partitions (see parallel_import.py)
+    "workers": "1"
+}
+IMPORT_ENGINES = ["apoc", "python", "delta"]
+
+
+ENCODING_WRITE_BATCH_SIZE = 1000  # id_codes written with one UNWIND query
+SECTORS_WRITE_BATCH_SIZE = 5000  # IN_SECTOR relationships written with one UNWIND query
+MAP_SECTORS_COUNTRY_NAME = "Беларусь"  # country, which is divided on map sectors
 
 
 CONSTRAINTS_QUERIES = [
@@ -18,6 +42,8 @@ CONSTRAINTS_QUERIES = [
             FOR (landmark: Landmark) REQUIRE (landmark.name, landmark.longitude, landmark.latitude) IS UNIQUE;""",
     """CREATE CONSTRAINT region_name_uniqueness IF NOT EXISTS
             FOR (region: Region) REQUIRE region.name IS UNIQUE;""",
+    """CREATE CONSTRAINT region_key_uniqueness IF NOT EXISTS
+            FOR (region: Region) REQUIRE region.key IS UNIQUE;""",
     """CREATE CONSTRAINT landmark_category_name_uniqueness IF NOT EXISTS
             FOR (landmarkCategory: LandmarkCategory) REQUIRE landmarkCategory.name IS UNIQUE;""",
     """CREATE CONSTRAINT map_sector_name_uniqueness IF NOT EXISTS
@@ -71,6 +97,11 @@ INDEXES_QUERIES = [
     );
     """,
     """
+    CREATE POINT INDEX landmark_location_point_index IF NOT EXISTS
+    FOR (landmark: Landmark)
+    ON (landmark.location);
+    """,
+    """
     CREATE TEXT INDEX map_sector_name_text_index IF NOT EXISTS
     FOR (mapSector: MapSector)
     ON (mapSector.name);
@@ -108,20 +139,18 @@ INDEXES_QUERIES = [
 
 def create_constraints(driver):
     with driver.session() as session:
-        for query in CONSTRAINTS_QUERIES:
-            session.run(query)
+        return [session.run(query).consume() for query in CONSTRAINTS_QUERIES]
 
 
 def create_indexes(driver):
     with driver.session() as session:
-        for query in INDEXES_QUERIES:
-            session.run(query)
+        return [session.run(query).consume() for query in INDEXES_QUERIES]
 
 
 def import_regions(driver, filename):
     filename = f"file:///{filename}"
     with driver.session() as session:
-        session.run(
+        return session.run(
             """
             // Imports regions from json file (Regions of types: Country, State, District)
             CALL apoc.load.json($filename) YIELD value
@@ -148,8 +177,16 @@ def import_regions(driver, filename):
                             WHEN region_json.part_of.state IS null OR region_json.part_of.state = ''  // If state
                                 THEN ' (' + region_json.part_of.country + ')'  
                             ELSE ' (' + region_json.part_of.country + ', ' + region_json.part_of.state + ')'  // If district
-                        END AS name_postscript
+                        END AS name_postscript,
+                        apoc.text.join(
+                            [
+                                name IN [region_json.part_of.country, region_json.part_of.state, region_json.name]
+                                    WHERE name IS NOT null AND name <> '' | toLower(trim(name))
+                            ],
+                            '/'
+                        ) AS region_key
                     MERGE (region: Region {name: region_json.name + name_postscript})
+                        SET region.key = region_key
                     WITH region_json, regionType, region
                     CALL apoc.create.addLabels(region, regionType) YIELD node AS labeledRegion
                     WITH region_json, labeledRegion
@@ -184,8 +221,19 @@ def import_regions(driver, filename):
                                     WHEN borderedRegionJSON.part_of.state IS null OR borderedRegionJSON.part_of.state = ''  // If state
                                         THEN ' (' + borderedRegionJSON.part_of.country + ')'  
                                     ELSE ' (' + borderedRegionJSON.part_of.country + ', ' + borderedRegionJSON.part_of.state + ')'  // If district
-                                END AS name_postscript
+                                END AS name_postscript,
+                                apoc.text.join(
+                                    [
+                                        name IN [
+                                            borderedRegionJSON.part_of.country,
+                                            borderedRegionJSON.part_of.state,
+                                            borderedRegionJSON.name
+                                        ] WHERE name IS NOT null AND name <> '' | toLower(trim(name))
+                                    ],
+                                    '/'
+                                ) AS bordered_region_key
                             MERGE (borderedRegion: Region {name: borderedRegionJSON.name + name_postscript})
+                                SET borderedRegion.key = bordered_region_key
                             WITH labeledRegion, borderedRegionType, borderedRegion
                             CALL apoc.create.addLabels(borderedRegion, borderedRegionType) YIELD node AS labeledBorderedRegion
                             WITH labeledRegion, labeledBorderedRegion
@@ -203,13 +251,13 @@ def import_regions(driver, filename):
             } IN TRANSACTIONS RETURN res, has_neighbour
             """,
             filename=filename
-        )
+        ).consume()
 
 
 def import_include_from_import_regions(driver, filename="regions.json"):
     filename = f"file:///{filename}"
     with driver.session() as session:
-        session.run(
+        return session.run(
             """
             // Imports regions from json file (Regions of types: Country, State, District)
             CALL apoc.load.json($filename) YIELD value
@@ -218,21 +266,17 @@ def import_include_from_import_regions(driver, filename="regions.json"):
                 UNWIND value AS region_json  // For region in regions list
                     WITH 
                         region_json,
-                        CASE
-                            WHEN region_json.part_of.country IS null OR region_json.part_of.country = ''  // If country
-                                THEN ''
-                            WHEN region_json.part_of.state IS null OR region_json.part_of.state = ''  // If state
-                                THEN ' (' + region_json.part_of.country + ')'  
-                            ELSE ' (' + region_json.part_of.country + ', ' + region_json.part_of.state + ')'  // If district
-                        END AS name_postscript
-                    CALL {
-                        WITH region_json, name_postscript
-                        MATCH (region: Region)
-                            WHERE region.name STARTS WITH region_json.name + name_postscript
-                        RETURN region
-                            ORDER BY region.name
-                            LIMIT 1
-                    }
+                        apoc.text.join(
+                            [
+                                name IN [region_json.part_of.country, region_json.part_of.state, region_json.name]
+                                    WHERE name IS NOT null AND name <> '' | toLower(trim(name))
+                            ],
+                            '/'
+                        ) AS region_key,
+                        toLower(trim(region_json.part_of.country)) AS country_key,
+                        toLower(trim(region_json.part_of.country)) + '/' + toLower(trim(region_json.part_of.state))
+                            AS state_key
+                    MATCH (region: Region {key: region_key})
                     CALL apoc.do.case(  
                         // Create [:INCLUDE] for countries, states and districts
                         // (or Cities with labels of country, state, district)
@@ -242,14 +286,7 @@ def import_include_from_import_regions(driver, filename="regions.json"):
                                 AND
                             (region_json.part_of.country IS NOT null AND region_json.part_of.country <> ''),
                             "
-                                CALL {
-                                    WITH region_json
-                                    MATCH (country: Region)
-                                        WHERE country.name STARTS WITH region_json.part_of.country
-                                    RETURN country
-                                        ORDER BY country.name
-                                        LIMIT 1
-                                }
+                                MATCH (country: Region {key: country_key})
                                 MERGE (country)-[:INCLUDE]->(region)
                                 RETURN 'state'
                             ",
@@ -257,22 +294,8 @@ def import_include_from_import_regions(driver, filename="regions.json"):
                                 AND
                             (region_json.part_of.country IS NOT null AND region_json.part_of.country <> ''),
                             "
-                                CALL {
-                                    WITH region_json
-                                    MATCH (country: Region)
-                                        WHERE country.name STARTS WITH region_json.part_of.country
-                                    RETURN country
-                                        ORDER BY country.name
-                                        LIMIT 1
-                                }
-                                CALL {
-                                    WITH region_json
-                                    MATCH (state: Region)
-                                        WHERE state.name STARTS WITH region_json.part_of.state + ' (' + region_json.part_of.country + ')'
-                                    RETURN state
-                                        ORDER BY state.name
-                                        LIMIT 1
-                                }
+                                MATCH (country: Region {key: country_key})
+                                MATCH (state: Region {key: state_key})
                                 MERGE (country)-[:INCLUDE]->(state)
                                 WITH state, region
                                 MERGE (state)-[:INCLUDE]->(region)
@@ -281,8 +304,9 @@ def import_include_from_import_regions(driver, filename="regions.json"):
                         ],
                         "RETURN 'country'",  // If region is country
                         {
-                            region_json: region_json,
-                            region: region
+                            region: region,
+                            country_key: country_key,
+                            state_key: state_key
                         }
                     ) YIELD value as region_type
                     WITH region_json
@@ -299,18 +323,21 @@ def import_include_from_import_regions(driver, filename="regions.json"):
                         "
                             WITH
                                 borderedRegionJSON,
-                                CASE
-                                    WHEN borderedRegionJSON.part_of.country IS null OR borderedRegionJSON.part_of.country = ''  // If country
-                                        THEN ''  
-                                    WHEN borderedRegionJSON.part_of.state IS null OR borderedRegionJSON.part_of.state = ''  // If state 
-                                        THEN ' (' + borderedRegionJSON.part_of.country + ')'  
-                                    ELSE ' (' + borderedRegionJSON.part_of.country + ', ' + borderedRegionJSON.part_of.state + ')'  // If district
-                                END AS bordered_region_name_postscript,
+                                apoc.text.join(
+                                    [
+                                        name IN [
+                                            borderedRegionJSON.part_of.country,
+                                            borderedRegionJSON.part_of.state,
+                                            borderedRegionJSON.name
+                                        ] WHERE name IS NOT null AND name <> '' | toLower(trim(name))
+                                    ],
+                                    '/'
+                                ) AS bordered_region_key,
                                 CASE 
                                     WHEN borderedRegionJSON.part_of.country IS NOT null AND borderedRegionJSON.part_of.country <> ''
-                                        THEN borderedRegionJSON.part_of.country  
-                                    ELSE borderedRegionJSON.part_of.name
-                                END AS bordered_country_name,
+                                        THEN toLower(trim(borderedRegionJSON.part_of.country))
+                                    ELSE toLower(trim(borderedRegionJSON.part_of.name))
+                                END AS bordered_country_key,
                                 CASE
                                     WHEN (borderedRegionJSON.part_of.state IS null OR borderedRegionJSON.part_of.state = '')
                                             AND
@@ -319,74 +346,32 @@ def import_include_from_import_regions(driver, filename="regions.json"):
                                     WHEN (borderedRegionJSON.part_of.state IS null OR borderedRegionJSON.part_of.state = '')
                                             AND 
                                          (borderedRegionJSON.part_of.country IS NOT null AND borderedRegionJSON.part_of.country <> '')
-                                            THEN borderedRegionJSON.name + ' (' + borderedRegionJSON.part_of.country + ')'
+                                            THEN toLower(trim(borderedRegionJSON.part_of.country)) + '/' + toLower(trim(borderedRegionJSON.name))
                                     WHEN borderedRegionJSON.part_of.state IS NOT null AND borderedRegionJSON.part_of.state <> ''
-                                        THEN borderedRegionJSON.part_of.state + ' (' + borderedRegionJSON.part_of.country + ')'
-                                END AS bordered_state_name,
+                                        THEN toLower(trim(borderedRegionJSON.part_of.country)) + '/' + toLower(trim(borderedRegionJSON.part_of.state))
+                                END AS bordered_state_key,
                                 CASE 
                                     WHEN borderedRegionJSON.part_of.state IS NOT null AND borderedRegionJSON.part_of.state <> ''
-                                        THEN borderedRegionJSON.name + ' (' + borderedRegionJSON.part_of.country + ', ' + borderedRegionJSON.part_of.state + ')'
+                                        THEN toLower(trim(borderedRegionJSON.part_of.country)) + '/' + toLower(trim(borderedRegionJSON.part_of.state)) + '/' + toLower(trim(borderedRegionJSON.name))
                                     ELSE null
-                                END AS bordered_district_name
-                            CALL {
-                                WITH borderedRegionJSON, bordered_region_name_postscript
-                                MATCH (borderedRegion: Region)
-                                    WHERE borderedRegion.name STARTS WITH borderedRegionJSON.name + bordered_region_name_postscript
-                                RETURN borderedRegion
-                                    ORDER BY borderedRegion.name
-                                    LIMIT 1
-                            }
+                                END AS bordered_district_key
+                            MATCH (borderedRegion: Region {key: bordered_region_key})
                             CALL apoc.do.case(
                                 [
-                                    bordered_district_name IS NOT null,
+                                    bordered_district_key IS NOT null,
                                     '
-                                        CALL {
-                                            WITH bordered_country_name
-                                            MATCH (country: Region)
-                                                WHERE country.name STARTS WITH bordered_country_name
-                                            RETURN country
-                                                ORDER BY country.name
-                                                LIMIT 1
-                                        }
-                                        CALL {
-                                            WITH bordered_state_name
-                                            MATCH (state: Region)
-                                                WHERE state.name STARTS WITH bordered_state_name
-                                            RETURN state
-                                                ORDER BY state.name
-                                                LIMIT 1
-                                        }
-                                        CALL {
-                                            WITH bordered_district_name
-                                            MATCH (district: Region)
-                                                WHERE district.name STARTS WITH bordered_district_name
-                                            RETURN district
-                                                ORDER BY district.name
-                                                LIMIT 1
-                                        }
+                                        MATCH (country: Region {key: bordered_country_key})
+                                        MATCH (state: Region {key: bordered_state_key})
+                                        MATCH (district: Region {key: bordered_district_key})
                                         MERGE (country)-[:INCLUDE]->(state)
                                         WITH state, district
                                         MERGE (state)-[:INCLUDE]->(district)
                                         RETURN 1  // district
                                     ',
-                                    bordered_state_name IS NOT null,
+                                    bordered_state_key IS NOT null,
                                     '
-                                        CALL {
-                                            WITH bordered_country_name
-                                            MATCH (country: Region)
-                                                WHERE country.name STARTS WITH bordered_country_name
-                                            RETURN country
-                                                ORDER BY country.name
-                                                LIMIT 1
-                                        }
-                                        CALL {
-                                            WITH bordered_state_name
-                                            MATCH (state: Region)
-                                                WHERE state.name STARTS WITH bordered_state_name
-                                            RETURN state
-                                                ORDER BY state.name
-                                                LIMIT 1
-                                        }
+                                        MATCH (country: Region {key: bordered_country_key})
+                                        MATCH (state: Region {key: bordered_state_key})
                                         MERGE (country)-[:INCLUDE]->(state)
                                         RETURN 2  // state
                                     '
@@ -395,9 +380,9 @@ def import_include_from_import_regions(driver, filename="regions.json"):
                                     RETURN 3  // If bordered region is country
                                 ',
                                 {
-                                    bordered_district_name: bordered_district_name,
-                                    bordered_state_name: bordered_state_name,
-                                    bordered_country_name: bordered_country_name
+                                    bordered_district_key: bordered_district_key,
+                                    bordered_state_key: bordered_state_key,
+                                    bordered_country_key: bordered_country_key
                                 }
                             ) YIELD value AS bordered_region_type
                             WITH * 
@@ -413,7 +398,7 @@ def import_include_from_import_regions(driver, filename="regions.json"):
             } IN TRANSACTIONS RETURN res, has_neighbour
             """,
             filename=filename
-        )
+        ).consume()
 
 
 def check_connection(driver):
@@ -426,7 +411,7 @@ def check_connection(driver):
 def import_landmarks(driver, filename):
     filename = f"file:///{filename}"
     with driver.session() as session:
-        session.run(
+        return session.run(
             """
             // Author: Vodohleb04
             // Importing landmarks from json
@@ -440,6 +425,9 @@ def import_landmarks(driver, filename):
                             latitude: toFloat(landmark_json.coordinates.latitude),
                             longitude: toFloat(landmark_json.coordinates.longitude)}
                     )  // CREATE or MATCH landmark (landmark uniqueness is defined by (name, latitude, longitude)) 
+                    SET landmark.location = point({
+                        latitude: landmark.latitude, longitude: landmark.longitude, crs: 'WGS-84'
+                    })  // location is used by landmark_location_point_index (radius and bbox queries)
                     MERGE (category: LandmarkCategory {name: landmark_json.category})
                     MERGE (landmark)-[refer:REFERS]->(category)
                         SET refer.main_category_flag = True
@@ -474,14 +462,12 @@ def import_landmarks(driver, filename):
                             // Located in Minks and other cities of republican subordination
                             // (:State:City)-[:INCLUDE]->(:District)<-[:LOCATED]-(:Landmark)
                             "
-                                 CALL {
-                                    WITH located
-                                    MATCH (district: Region)
-                                        WHERE district.name STARTS WITH located.district + ' (' + located.country + ', ' + located.city + ')'
-                                    RETURN district
-                                        ORDER BY district.name
-                                        LIMIT 1
-                                }
+                                MATCH (
+                                    district: Region {
+                                        key: toLower(trim(located.country)) + '/' + toLower(trim(located.city)) + '/' +
+                                            toLower(trim(located.district))
+                                    }
+                                )
                                 MERGE (landmark)-[:LOCATED]->(district)
                                 RETURN 'state-city'
                             ",
@@ -490,14 +476,12 @@ def import_landmarks(driver, filename):
                             // (:State)-[:INCLUDE]->(:District)<-[:LOCATED]-(:Landmark) or
                             // (:State)-[:INCLUDE]->(:District:City)<-[:LOCATED]-(:Landmark)
                             "
-                                CALL {
-                                    WITH located
-                                    MATCH (district_city: Region)
-                                        WHERE district_city.name STARTS WITH located.city + ' (' + located.country + ', ' + located.state + ')'
-                                    RETURN district_city
-                                        ORDER BY district_city.name
-                                        LIMIT 1
-                                }
+                                MATCH (
+                                    district_city: Region {
+                                        key: toLower(trim(located.country)) + '/' + toLower(trim(located.state)) + '/' +
+                                            toLower(trim(located.city))
+                                    }
+                                )
                                 MERGE (landmark)-[:LOCATED]->(district_city)
                                 RETURN 'district-city'
                             "
@@ -505,16 +489,15 @@ def import_landmarks(driver, filename):
                         // Located in city (:State)-[:INCLUDE]->(:District)-[:INCLUDE]->(:City)<-[:LOCATED]-(:Landmark)
                         // Such cities are created in this script
                         "
-                            CALL {
-                                WITH located
-                                MATCH (district: Region)
-                                    WHERE district.name STARTS WITH located.district + ' (' + located.country + ', ' + located.state + ')'
-                                RETURN district
-                                    ORDER BY district.name
-                                    LIMIT 1
-                            }
+                            MATCH (
+                                district: Region {
+                                    key: toLower(trim(located.country)) + '/' + toLower(trim(located.state)) + '/' +
+                                        toLower(trim(located.district))
+                                }
+                            )
                             MERGE (city: Region {name: located.city + ' (' + located.country + ', ' + located.state + ', ' + located.district + ')'})
                                 ON CREATE SET city:City
+                            SET city.key = district.key + '/' + toLower(trim(located.city))
                             WITH located, landmark, city, district
                             MERGE (district)-[:INCLUDE]->(city)
                             WITH located, landmark, city
@@ -531,24 +514,18 @@ def import_landmarks(driver, filename):
             } IN TRANSACTIONS RETURN subcategory_result, city_type, res;
             """,
             filename=filename
-        )
+        ).consume()
 
 
 def import_map_sectors(driver, filename):
     filename = f"file:///{filename}"
     with driver.session() as session:
-        session.run(
+        return session.run(
             """
             // Imports map seqtors structured in form of quadtree 
             // (it may be not quadtree, but sector is presented in 
             // form of rectangle (top left corner and buttom right corner))
-            CALL {
-                MATCH (country: Region)
-                    WHERE country.name STARTS WITH $country_name
-                RETURN country
-                    ORDER BY country.name
-                    LIMIT 1
-            }
+            MATCH (country: Region {key: $country_key})
             MERGE (country_map_sectors: CountryMapSectors)
             MERGE (country_map_sectors)<-[:DIVIDED_ON_SECTORS]-(country)
             WITH country_map_sectors
@@ -613,41 +590,109 @@ def import_map_sectors(driver, filename):
             WITH *
             RETURN 1 AS res, neighbour_value AS has_neighbour
             """,
-            country_name="Беларусь", filename=filename
-        )
+            country_key=region_key(MAP_SECTORS_COUNTRY_NAME), filename=filename
+        ).consume()
 
 
 def connect_landmarks_with_map_sectors(driver):
+    # Connects all landmarks without sector with their map sectors. Sectors of landmarks are found with
+    # grid index over rectangles of sectors (see sector_index.py), edges are written by batches.
+    # Returns amount of landmarks without sector and summaries of writes
     with driver.session() as session:
-        session.run(
+        sectors = [
+            (
+                record.get("name"),
+                record.get("tl_latitude"), record.get("tl_longitude"),
+                record.get("br_latitude"), record.get("br_longitude")
+            )
+            for record in session.run(
+                """
+                MATCH (mapSector: MapSector)
+                    WHERE mapSector.tl_latitude IS NOT null AND mapSector.br_latitude IS NOT null
+                RETURN
+                    mapSector.name AS name,
+                    mapSector.tl_latitude AS tl_latitude,
+                    mapSector.tl_longitude AS tl_longitude,
+                    mapSector.br_latitude AS br_latitude,
+                    mapSector.br_longitude AS br_longitude
+                """
+            )
+        ]
+        landmarks = [
+            (record.get("name"), record.get("latitude"), record.get("longitude"))
+            for record in session.run(
+                """
+                MATCH (landmark: Landmark)
+                    WHERE NOT (landmark)-[:IN_SECTOR]->(:MapSector)
+                RETURN landmark.name AS name, landmark.latitude AS latitude, landmark.longitude AS longitude
+                """
+            )
+        ]
+
+        landmarks_indexes, sectors_names = SectorGrid(sectors).assign(
+            [landmark[1] for landmark in landmarks], [landmark[2] for landmark in landmarks]
+        )
+        rows = [
+            {
+                "name": landmarks[landmark_index][0],
+                "latitude": landmarks[landmark_index][1],
+                "longitude": landmarks[landmark_index][2],
+                "sector_name": sector_name
+            }
+            for landmark_index, sector_name in zip(landmarks_indexes.tolist(), sectors_names.tolist())
+        ]
+        summaries = []
+        for rows_start in range(0, len(rows), SECTORS_WRITE_BATCH_SIZE):
+            summaries.append(session.run(
+                """
+                UNWIND $rows AS row
+                MATCH (landmark: Landmark {name: row.name, latitude: row.latitude, longitude: row.longitude})
+                MATCH (mapSector: MapSector {name: row.sector_name})
+                MERGE (landmark)-[:IN_SECTOR]->(mapSector)
+                """,
+                rows=rows[rows_start: rows_start + SECTORS_WRITE_BATCH_SIZE]
+            ).consume())
+    return len(landmarks), summaries
+
+
+def write_regions_id_codes(tx, regions_rows):
+    # regions_rows - list of {"key": ..., "id_code": ...}. Regions are matched by unique canonical key
+    summaries = []
+    for rows_start in range(0, len(regions_rows), ENCODING_WRITE_BATCH_SIZE):
+        summaries.append(tx.run(
             """
-            // Connects all landmarks with their map sectors
-            MATCH (landmark: Landmark)
-                WHERE NOT (landmark)-[:IN_SECTOR]->(:MapSector)
-            MATCH (mapSector: MapSector)
-            CALL apoc.do.when(
-                point.withinBBox(
-                    point({latitude: landmark.latitude, longitude: landmark.longitude, crs:'WGS-84'}),
-                    point({latitude: mapSector.br_latitude, longitude: mapSector.tl_longitude, crs:'WGS-84'}),
-                    point({latitude: mapSector.tl_latitude, longitude: mapSector.br_longitude, crs:'WGS-84'})
-                ) = True,
-                "
-                    MERGE (landmark)-[:IN_SECTOR]->(mapSector)
-                    RETURN True;
-                ",
-                "
-                    RETURN False;
-                ",
-                {landmark: landmark, mapSector: mapSector}
-            ) YIELD value AS added_to_sector
-            WITH added_to_sector
-                WHERE added_to_sector = True
-            RETURN count(added_to_sector) AS added_amount
+            UNWIND $rows AS row
+            MATCH (region: Region {key: row.key})
+            SET region.id_code = row.id_code
+            """,
+            rows=regions_rows[rows_start: rows_start + ENCODING_WRITE_BATCH_SIZE]
+        ).consume())
+    return summaries
+
+
+def write_landmarks_id_codes_and_paths(tx, landmarks_rows):
+    # landmarks_rows - list of {"name": ..., "latitude": ..., "longitude": ..., "id_code": ..., "path": ...}.
+    # Landmarks are matched by unique (name, latitude, longitude)
+    summaries = []
+    for rows_start in range(0, len(landmarks_rows), ENCODING_WRITE_BATCH_SIZE):
+        summaries.append(tx.run(
             """
-        )
+            UNWIND $rows AS row
+            MATCH (landmark: Landmark {name: row.name, latitude: toFloat(row.latitude), longitude: toFloat(row.longitude)})
+            SET landmark.id_code = row.id_code, landmark.path = row.path
+            """,
+            rows=landmarks_rows[rows_start: rows_start + ENCODING_WRITE_BATCH_SIZE]
+        ).consume())
+    return summaries
 
 
-def encoding_regions_and_landmarks_change_id_code(driver, base_dir):
+def encode_hierarchy_records_changing_id_codes(
+    base_dir, hierarchy_records, write_region_id_code, write_landmark_id_code_and_path
+):
+    # Counters and steps of encoding_regions_and_landmarks_change_id_code without database.
+    # hierarchy_records - ordered records of the hierarchy walk (neo4j records or dicts),
+    # write_region_id_code(region_key, id_code) and write_landmark_id_code_and_path(name, latitude, longitude,
+    # id_code, path) are called for every assignment of the record. Returns amount of hierarchy records
     country_counter = 0
     current_country_name = ""
     state_counter = 0
@@ -658,41 +703,10 @@ def encoding_regions_and_landmarks_change_id_code(driver, base_dir):
     current_city_name = ""
     landmark_counter = 0
 
-    def write_region_id_code(region_name, id_code):
-        nonlocal session
-        session.run(
-            """
-            MATCH (region: Region)
-                WHERE region.name STARTS WITH $region_name
-            WITH region
-                ORDER BY region.name
-                LIMIT 1
-            SET region.id_code = $id_code
-            """,
-            region_name=region_name, id_code=id_code
-        )
-
-    def write_landmark_id_code_and_path(landmark_name, landmark_latitude, landmark_longitude, id_code, path):
-        nonlocal session
-        session.run(
-            """
-            MATCH (landmark)
-                WHERE landmark.name STARTS WITH $landmark_name 
-                    AND landmark.latitude = toFloat($landmark_latitude)
-                    AND landmark.longitude = toFloat($landmark_longitude)
-            SET landmark.id_code = $id_code, landmark.path = $path
-            """,
-            landmark_name=landmark_name,
-            landmark_latitude=landmark_latitude,
-            landmark_longitude=landmark_longitude,
-            id_code=id_code,
-            path=path
-        )
-
     def step_on_record(record):
         # Name constraints are unique, so there is no need to update current_name_<region_type> and
         # it's enough to update counter only for the next included region_type but not for every
-        nonlocal session, base_dir
+        nonlocal base_dir
         nonlocal country_counter, state_counter, district_counter, city_counter, landmark_counter
         nonlocal current_country_name, current_state_name, current_district_name, current_city_name
 
@@ -701,25 +715,25 @@ def encoding_regions_and_landmarks_change_id_code(driver, base_dir):
             country_counter += 1
             state_counter = 0
             if current_country_name:
-                write_region_id_code(current_country_name, country_counter)
+                write_region_id_code(record.get("country_key"), country_counter)
         if record.get("state_name") != current_state_name:
             current_state_name = record.get("state_name")
             state_counter += 1
             district_counter = 0
             if current_state_name:
-                write_region_id_code(current_state_name, state_counter)
+                write_region_id_code(record.get("state_key"), state_counter)
         if record.get("district_name") != current_district_name:
             current_district_name = record.get("district_name")
             district_counter += 1
             city_counter = 0
             if current_district_name:
-                write_region_id_code(current_district_name, district_counter)
+                write_region_id_code(record.get("district_key"), district_counter)
         if record.get("city_name") != current_city_name:
             current_city_name = record.get("city_name")
             city_counter += 1
             landmark_counter = 1
             if current_city_name:
-                write_region_id_code(current_city_name, city_counter)
+                write_region_id_code(record.get("city_key"), city_counter)
         if record.get("landmark_name"):
             path = os.path.join(
                 base_dir, f"{country_counter if current_country_name else 0}/"
@@ -733,6 +747,43 @@ def encoding_regions_and_landmarks_change_id_code(driver, base_dir):
                 landmark_counter, path
             )
 
+    records_amount = 0
+    for record in hierarchy_records:
+        step_on_record(record)
+        records_amount += 1
+    return records_amount
+
+
+def changed_id_codes_rows(base_dir, hierarchy_records):
+    # Assignments of encode_hierarchy_records_changing_id_codes are collected in memory.
+    # The last assignment of region or landmark wins, as if they were written one by one.
+    # Returns rows of regions, rows of landmarks and amount of hierarchy records
+    regions_id_codes = {}
+    landmarks_id_codes_and_paths = {}
+
+    def write_region_id_code(region_key, id_code):
+        regions_id_codes[region_key] = id_code
+
+    def write_landmark_id_code_and_path(landmark_name, landmark_latitude, landmark_longitude, id_code, path):
+        landmarks_id_codes_and_paths[(landmark_name, landmark_latitude, landmark_longitude)] = (id_code, path)
+
+    records_amount = encode_hierarchy_records_changing_id_codes(
+        base_dir, hierarchy_records, write_region_id_code, write_landmark_id_code_and_path
+    )
+    return (
+        [{"key": key, "id_code": id_code} for key, id_code in regions_id_codes.items()],
+        [
+            {"name": name, "latitude": latitude, "longitude": longitude, "id_code": id_code, "path": path}
+            for (name, latitude, longitude), (id_code, path) in landmarks_id_codes_and_paths.items()
+        ],
+        records_amount
+    )
+
+
+def encoding_regions_and_landmarks_change_id_code(driver, base_dir):
+    # Hierarchy is read at once, id_codes are collected in memory by changed_id_codes_rows and written
+    # with a few UNWIND queries in one transaction. Returns amount of hierarchy records and summaries of writes
+    summaries = []
     with driver.session() as session:
         result = session.run(
             """
@@ -769,9 +820,13 @@ def encoding_regions_and_landmarks_change_id_code(driver, base_dir):
             ) YIELD value
             RETURN DISTINCT
                 country.name AS country_name,
+                country.key AS country_key,
                 state.name AS state_name,
+                state.key AS state_key,
                 district.name AS district_name,
+                district.key AS district_key,
                 city.name AS city_name,
+                city.key AS city_key,
                 value.landmark_name AS landmark_name,
                 value.landmark_latitude AS landmark_latitude,
                 value.landmark_longitude AS landmark_longitude
@@ -783,270 +838,246 @@ def encoding_regions_and_landmarks_change_id_code(driver, base_dir):
                 landmark_name ASC
             """
         )
-        for record in result:
-            step_on_record(record)
+        regions_rows, landmarks_rows, records_amount = changed_id_codes_rows(base_dir, result)
 
+        with session.begin_transaction() as tx:
+            summaries.extend(write_regions_id_codes(tx, regions_rows))
+            summaries.extend(write_landmarks_id_codes_and_paths(tx, landmarks_rows))
+            tx.commit()
+    return records_amount, summaries
 
-def encoding_regions_and_landmarks_no_change_id_code(driver, base_dir):
-    def find_last_used_id_code_country():
-        nonlocal session
-        last_used_id_code_res = session.run(
-            """
-            MATCH (country: Country) RETURN max(country.id_code) AS last_used_id_code;
-            """
-        )
-        last_used_id_code = last_used_id_code_res.single().get("last_used_id_code")
-        if last_used_id_code is None:
-            return 0
-        else:
-            return last_used_id_code
 
-    def find_last_used_id_code_state(country_name: str):
-        nonlocal session
-        last_used_id_code_res = session.run(
-            """
-            MATCH (country: Region)
-                WHERE country.name STARTS WITH $country_name
-            WITH country
-                ORDER BY country.name
-                LIMIT 1
-            OPTIONAL MATCH (country)-[:INCLUDE]->(state: State)
-            RETURN country.name AS country_name, max(state.id_code) AS last_used_id_code;
-            """,
-            country_name=country_name
-        )
-        last_used_id_code = last_used_id_code_res.single().get("last_used_id_code")
-        if last_used_id_code is None:
-            return 0
-        else:
-            return last_used_id_code
+def encode_hierarchy_records(base_dir, regions_records, landmarks_records, hierarchy_records, write_rows):
+    # Single pass over ordered hierarchy of encoding_regions_and_landmarks_no_change_id_code without database.
+    # regions_records and landmarks_records - existing id_codes and parents of members of every counter,
+    # hierarchy_records - ordered records of the hierarchy walk (neo4j records or dicts).
+    # The last used id_code of every parent is kept in memory (the same maximums, which were queried for every record
+    # before), write_rows(regions_rows, landmarks_rows) is called with every full batch of new id_codes and with
+    # the rest after the last record. Returns amount of hierarchy records
+    counters_of_members = {}  # region name or landmark key -> keys of counters, the member is counted by
+    last_used_id_codes = {}  # counter key -> the last used id_code
+    assigned_regions_id_codes = {}
+    assigned_landmarks = set()
+    regions_rows = []
+    landmarks_rows = []
 
-    def find_last_used_id_code_district(state_name: str):
-        nonlocal session
-        last_used_id_code_res = session.run(
-            """
-            MATCH (state: Region)
-                WHERE state.name STARTS WITH $state_name
-            WITH state
-                ORDER BY state.name
-                LIMIT 1
-            OPTIONAL MATCH (state)-[:INCLUDE]->(district: District)
-            RETURN state.name AS state_name, max(district.id_code) AS last_used_id_code;
-            """,
-            state_name=state_name
-        )
-        last_used_id_code = last_used_id_code_res.single().get("last_used_id_code")
-        if last_used_id_code is None:
-            return 0
-        else:
-            return last_used_id_code
+    def use_id_code(member, id_code):
+        if id_code is None:
+            return
+        for counter_key in counters_of_members.get(member, []):
+            if id_code > last_used_id_codes.get(counter_key, 0):
+                last_used_id_codes[counter_key] = id_code
 
-    def find_last_used_id_code_city(district_name: str):
-        nonlocal session
-        last_used_id_code_res = session.run(
-            """
-            MATCH (district: Region)
-                WHERE district.name STARTS WITH $district_name
-            WITH district
-                ORDER BY district.name
-                LIMIT 1
-            OPTIONAL MATCH (district)-[:INCLUDE]->(city: City)
-            RETURN district.name AS district_name, max(city.id_code) AS last_used_id_code;
-            """,
-            district_name=district_name
+    # Counter keys: ("country", None) - all countries, ("state", country_name), ("district", state_name),
+    # ("city", district_name) - regions included in parent, ("landmark", region_name) - landmarks located in region
+    for record in regions_records:
+        counters_keys = []
+        if "Country" in record.get("region_labels"):
+            counters_keys.append(("country", None))
+        for label, level in [("State", "state"), ("District", "district"), ("City", "city")]:
+            if label in record.get("region_labels"):
+                counters_keys.extend((level, parent_name) for parent_name in record.get("parents_names"))
+        counters_of_members[record.get("region_name")] = counters_keys
+        use_id_code(record.get("region_name"), record.get("region_id_code"))
+    for record in landmarks_records:
+        landmark_key = (
+            record.get("landmark_name"), record.get("landmark_latitude"), record.get("landmark_longitude")
         )
-        last_used_id_code = last_used_id_code_res.single().get("last_used_id_code")
-        if last_used_id_code is None:
-            return 0
-        else:
-            return last_used_id_code
+        counters_of_members[landmark_key] = [
+            ("landmark", region_name) for region_name in record.get("regions_names")
+        ]
+        use_id_code(landmark_key, record.get("landmark_id_code"))
 
-    def find_last_used_id_code_landmark(region_name: str):
-        nonlocal session
-        last_used_id_code_res = session.run(
-            """
-            MATCH (region: Region)
-                WHERE region.name STARTS WITH $region_name
-            WITH region
-                ORDER BY region.name
-                LIMIT 1
-            OPTIONAL MATCH (region)<-[:LOCATED]-(landmark: Landmark)
-            RETURN region.name AS region_name, max(landmark.id_code) AS last_used_id_code;
-            """,
-            region_name=region_name
-        )
-        last_used_id_code = last_used_id_code_res.single().get("last_used_id_code")
-        if last_used_id_code is None:
-            return 0
-        else:
-            return last_used_id_code
+    def assign_region_id_code(region_name, region_key, counter_key):
+        id_code = last_used_id_codes.get(counter_key, 0) + 1
+        last_used_id_codes[counter_key] = id_code
+        use_id_code(region_name, id_code)
+        assigned_regions_id_codes[region_name] = id_code
+        regions_rows.append({"key": region_key, "id_code": id_code})
+        return id_code
 
-    def write_region_id_code(region_name, id_code):
-        nonlocal session
-        session.run(
-            """
-            MATCH (region: Region)
-                WHERE region.name STARTS WITH $region_name
-            WITH region
-                ORDER BY region.name
-                LIMIT 1
-            SET region.id_code = $id_code
-            """,
-            region_name=region_name, id_code=id_code
-        )
+    def region_id_code(record, level, counter_key):
+        # Existing id_code, id_code assigned earlier in this pass, new id_code or 0 for absent region
+        region_name = record.get(f"{level}_name")
+        id_code = record.get(f"{level}_id_code")
+        if id_code is None:
+            id_code = assigned_regions_id_codes.get(region_name)
+        if id_code is None:
+            if region_name is None:
+                return 0
+            id_code = assign_region_id_code(region_name, record.get(f"{level}_key"), counter_key)
+        return id_code
 
-    def write_landmark_id_code_and_path(landmark_name, landmark_latitude, landmark_longitude, id_code, path):
-        nonlocal session
-        session.run(
-            """
-            MATCH (landmark)
-                WHERE landmark.name STARTS WITH $landmark_name 
-                    AND landmark.latitude = toFloat($landmark_latitude)
-                    AND landmark.longitude = toFloat($landmark_longitude)
-            SET landmark.id_code = $id_code, landmark.path = $path
-            """,
-            landmark_name=landmark_name,
-            landmark_latitude=landmark_latitude,
-            landmark_longitude=landmark_longitude,
-            id_code=id_code,
-            path=path
-        )
+    def flush_writes(force=False):
+        regions_batch, landmarks_batch = [], []
+        if regions_rows and (force or len(regions_rows) >= ENCODING_WRITE_BATCH_SIZE):
+            regions_batch = regions_rows[:]
+            regions_rows.clear()
+        if landmarks_rows and (force or len(landmarks_rows) >= ENCODING_WRITE_BATCH_SIZE):
+            landmarks_batch = landmarks_rows[:]
+            landmarks_rows.clear()
+        if regions_batch or landmarks_batch:
+            write_rows(regions_batch, landmarks_batch)
 
     def step_on_record(record):
-        # Name constraints are unique, so there is no need to update current_name_<region_type> and
-        # it's enough to update counter only for the next included region_type but not for every
-        nonlocal session, base_dir
-
-        country_id_code = record.get("country_id_code")
-        if country_id_code is None:
-            if record.get("country_name") is not None:
-                last_used_country_id_code = find_last_used_id_code_country()
-                write_region_id_code(record.get("country_name"), last_used_country_id_code + 1)
-                country_id_code = last_used_country_id_code + 1
-
-        state_id_code = record.get("state_id_code")
-        if state_id_code is None:
-            if record.get("state_name") is not None:
-                last_used_state_id_code = find_last_used_id_code_state(record.get("country_name"))
-                write_region_id_code(record.get("state_name"), last_used_state_id_code + 1)
-                state_id_code = last_used_state_id_code + 1
-            else:
-                state_id_code = 0
-
-        district_id_code = record.get("district_id_code")
-        if district_id_code is None:
-            if record.get("district_name") is not None:
-                last_used_district_id_code = find_last_used_id_code_district(record.get("state_name"))
-                write_region_id_code(record.get("district_name"), last_used_district_id_code + 1)
-                district_id_code = last_used_district_id_code + 1
-            else:
-                district_id_code = 0
-
-        city_id_code = record.get("city_id_code")
-        if city_id_code is None:
-            if record.get("city_name") is not None:
-                last_used_city_id_code = find_last_used_id_code_city(record.get("district_name"))
-                write_region_id_code(record.get("city_name"), last_used_city_id_code + 1)
-                city_id_code = last_used_city_id_code + 1
-            else:
-                city_id_code = 0
+        country_id_code = region_id_code(record, "country", ("country", None))
+        state_id_code = region_id_code(record, "state", ("state", record.get("country_name")))
+        district_id_code = region_id_code(record, "district", ("district", record.get("state_name")))
+        city_id_code = region_id_code(record, "city", ("city", record.get("district_name")))
 
-        if record.get("landmark_id_code") is None:
+        landmark_key = (
+            record.get("landmark_name"), record.get("landmark_latitude"), record.get("landmark_longitude")
+        )
+        # Landmark, located in several regions, is encoded only in the first of them
+        if record.get("landmark_id_code") is None and landmark_key not in assigned_landmarks:
             if record.get("landmark_name") is not None:
-                if record.get("city_name") is None: 
-                    last_used_landmark_id_code = find_last_used_id_code_landmark(record.get("district_name"))
+                if record.get("city_name") is None:
+                    counter_key = ("landmark", record.get("district_name"))
                 else:
-                    last_used_landmark_id_code = find_last_used_id_code_landmark(record.get("city_name"))
+                    counter_key = ("landmark", record.get("city_name"))
+                landmark_id_code = last_used_id_codes.get(counter_key, 0) + 1
+                last_used_id_codes[counter_key] = landmark_id_code
+                use_id_code(landmark_key, landmark_id_code)
+                assigned_landmarks.add(landmark_key)
                 path = os.path.join(
                     base_dir, f"{country_id_code}/"
                               f"{state_id_code}/"
                               f"{district_id_code}/"
                               f"{city_id_code}/"
-                              f"{last_used_landmark_id_code + 1}"
-                )
-                write_landmark_id_code_and_path(
-                    record.get("landmark_name"), record.get("landmark_latitude"), record.get("landmark_longitude"),
-                    last_used_landmark_id_code + 1, path
+                              f"{landmark_id_code}"
                 )
+                landmarks_rows.append({
+                    "name": landmark_key[0],
+                    "latitude": landmark_key[1],
+                    "longitude": landmark_key[2],
+                    "id_code": landmark_id_code,
+                    "path": path
+                })
+        flush_writes()
 
-    with driver.session() as session:
-        amount_res = session.run(
+    records_amount = 0
+    for record in hierarchy_records:
+        step_on_record(record)
+        records_amount += 1
+    flush_writes(force=True)
+    return records_amount
+
+
+def encoding_regions_and_landmarks_no_change_id_code(driver, base_dir):
+    # Existing id_codes are read at first, then the ordered hierarchy is walked by encode_hierarchy_records.
+    # Returns amount of hierarchy records and summaries of writes
+    summaries = []
+
+    def write_rows(regions_rows, landmarks_rows):
+        nonlocal write_session
+        summaries.extend(write_regions_id_codes(write_session, regions_rows))
+        summaries.extend(write_landmarks_id_codes_and_paths(write_session, landmarks_rows))
+
+    # Hierarchy is read in one session, while assignments are written in other one
+    with driver.session() as read_session, driver.session() as write_session:
+        regions_records = list(read_session.run(
             """
-            MATCH (landmark: Landmark)
-            WITH count(landmark) AS landmarks_amount
             MATCH (region: Region)
-            RETURN count(region) AS regions_amount, landmarks_amount
+            OPTIONAL MATCH (parent: Region)-[:INCLUDE]->(region)
+            RETURN
+                region.name AS region_name,
+                labels(region) AS region_labels,
+                region.id_code AS region_id_code,
+                collect(parent.name) AS parents_names
             """
-        )
-        amount_record = amount_res.single()
-        landmarks_amount = amount_record.get("landmarks_amount")
-        regions_amount = amount_record.get("regions_amount")
-        for i in range(landmarks_amount + regions_amount):  # max possible amount of records
-            result = session.run(
-                """
-                MATCH (country: Country)
-                OPTIONAL MATCH (state: State)<-[:INCLUDE]-(country) 
-                OPTIONAL MATCH (district: District)<-[:INCLUDE]-(state)
-                OPTIONAL MATCH (city: City)<-[:INCLUDE]-(district)
-                CALL apoc.do.case(
-                    [
-                        city IS NOT null,
-                        "
-                            OPTIONAL MATCH (landmark: Landmark)-[:LOCATED]->(city)
-                            RETURN 
-                                landmark.name AS landmark_name,
-                                landmark.latitude AS landmark_latitude,
-                                landmark.longitude AS landmark_longitude,
-                                landmark.id_code AS landmark_id_code;
-                        ",
-                        district IS NOT null,
-                        "
-                            OPTIONAL MATCH (landmark: Landmark)-[:LOCATED]->(district)
-                            RETURN 
-                                landmark.name AS landmark_name,
-                                landmark.latitude AS landmark_latitude,
-                                landmark.longitude AS landmark_longitude,
-                                landmark.id_code AS landmark_id_code;
-                        "
-                    ],
+        ))
+        landmarks_records = list(read_session.run(
+            """
+            MATCH (landmark: Landmark)-[:LOCATED]->(region: Region)
+            RETURN
+                landmark.name AS landmark_name,
+                landmark.latitude AS landmark_latitude,
+                landmark.longitude AS landmark_longitude,
+                landmark.id_code AS landmark_id_code,
+                collect(region.name) AS regions_names
+            """
+        ))
+        result = read_session.run(
+            """
+            MATCH (country: Country)
+            OPTIONAL MATCH (state: State)<-[:INCLUDE]-(country) 
+            OPTIONAL MATCH (district: District)<-[:INCLUDE]-(state)
+            OPTIONAL MATCH (city: City)<-[:INCLUDE]-(district)
+            CALL apoc.do.case(
+                [
+                    city IS NOT null,
                     "
+                        OPTIONAL MATCH (landmark: Landmark)-[:LOCATED]->(city)
                         RETURN 
-                            null as landmark_name,
-                            null as landmark_latitude,
-                            null as landmark_longitude,
-                            null as landmark_id_code;
+                            landmark.name AS landmark_name,
+                            landmark.latitude AS landmark_latitude,
+                            landmark.longitude AS landmark_longitude,
+                            landmark.id_code AS landmark_id_code;
                     ",
-                    {city: city, district: district}
-                ) YIELD value
-                RETURN DISTINCT
-                    country.name AS country_name,
-                    country.id_code AS country_id_code,
-                    state.name AS state_name,
-                    state.id_code AS state_id_code,
-                    district.name AS district_name,
-                    district.id_code AS district_id_code,
-                    city.name AS city_name,
-                    city.id_code AS city_id_code,
-                    value.landmark_name AS landmark_name,
-                    value.landmark_latitude AS landmark_latitude,
-                    value.landmark_longitude AS landmark_longitude,
-                    value.landmark_id_code AS landmark_id_code
-                ORDER BY 
-                    country_name ASC,
-                    state_name ASC,
-                    district_name ASC,
-                    city_name ASC,
-                    landmark_name ASC
-                SKIP $offset
-                LIMIT 1
-                """,
-                offset=i
-            )
-            record = result.single()
-            if record:
-                step_on_record(record)
-            else:
-                break  # All available records has been used
+                    district IS NOT null,
+                    "
+                        OPTIONAL MATCH (landmark: Landmark)-[:LOCATED]->(district)
+                        RETURN 
+                            landmark.name AS landmark_name,
+                            landmark.latitude AS landmark_latitude,
+                            landmark.longitude AS landmark_longitude,
+                            landmark.id_code AS landmark_id_code;
+                    "
+                ],
+                "
+                    RETURN 
+                        null as landmark_name,
+                        null as landmark_latitude,
+                        null as landmark_longitude,
+                        null as landmark_id_code;
+                ",
+                {city: city, district: district}
+            ) YIELD value
+            RETURN DISTINCT
+                country.name AS country_name,
+                country.key AS country_key,
+                country.id_code AS country_id_code,
+                state.name AS state_name,
+                state.key AS state_key,
+                state.id_code AS state_id_code,
+                district.name AS district_name,
+                district.key AS district_key,
+                district.id_code AS district_id_code,
+                city.name AS city_name,
+                city.key AS city_key,
+                city.id_code AS city_id_code,
+                value.landmark_name AS landmark_name,
+                value.landmark_latitude AS landmark_latitude,
+                value.landmark_longitude AS landmark_longitude,
+                value.landmark_id_code AS landmark_id_code
+            ORDER BY 
+                country_name ASC,
+                state_name ASC,
+                district_name ASC,
+                city_name ASC,
+                landmark_name ASC
+            """
+        )
+        records_amount = encode_hierarchy_records(
+            base_dir, regions_records, landmarks_records, result, write_rows
+        )
+    return records_amount, summaries
+
+
+def encoding_new_landmarks(driver, base_dir, delta_stats):
+    # Only landmarks without id_code are encoded, all regions must be already encoded.
+    # Returns amount of records and summaries of writes or None, if full encoding is needed
+    with driver.session() as session:
+        if delta_import.needs_full_encoding(session, delta_stats):
+            return None
+        new_landmarks = delta_import.new_landmarks_id_codes(session, base_dir)
+        if new_landmarks is None:
+            return None
+        landmarks_rows, records_amount = new_landmarks
+        with session.begin_transaction() as tx:
+            summaries = write_landmarks_id_codes_and_paths(tx, landmarks_rows)
+            tx.commit()
+    return records_amount, summaries
 
 
 def run_cypher_scripts(
@@ -1054,71 +1085,194 @@ def run_cypher_scripts(
     regions_filename, landmarks_filename, map_sectors_filename,
     base_dir,
     save_existing_id_codes,
-    start_time
+    start_time,
+    metrics,
+    import_engine="apoc",
+    workers=1
 ):
+    success = False
     try:
-        last_operation = datetime.datetime.now()
-
         print("Creating constraints...", flush=True)
-        create_constraints(driver)
-        print(f"Constraints are created in {datetime.datetime.now() - last_operation}", flush=True)
-        last_operation = datetime.datetime.now()
+        with metrics.stage("create_constraints") as stage:
+            stage.add_neo4j_summary(create_constraints(driver))
+        print(f"Constraints are created in {datetime.timedelta(seconds=stage.duration)}", flush=True)
 
         print("Creating indexes...", flush=True)
-        create_indexes(driver)
-        print(f"Indexes created in {datetime.datetime.now() - last_operation}", flush=True)
-        last_operation = datetime.datetime.now()
-
-        print(f"Importing regions from \"file:///{regions_filename}\"...", flush=True)
-        import_regions(driver, regions_filename)
-        print(f"Regions have been imported in {datetime.datetime.now() - last_operation}", flush=True)
-        last_operation = datetime.datetime.now()
-
-        print(f"Importing hierarchy of regions from \"file:///{regions_filename}\"...", flush=True)
-        import_include_from_import_regions(driver, regions_filename)
-        print(f"Hierarchy of regions have been imported in {datetime.datetime.now() - last_operation}", flush=True)
-        last_operation = datetime.datetime.now()
-
-        print(f"Importing map sectors from \"file:///{map_sectors_filename}\"...", flush=True)
-        import_map_sectors(driver, map_sectors_filename)
-        print(f"Map sectors have been imported in {datetime.datetime.now() - last_operation}", flush=True)
-        last_operation = datetime.datetime.now()
-
-        print(f"Importing landmarks from \"file:///{landmarks_filename}\"...", flush=True)
-        import_landmarks(driver, landmarks_filename)
-        print(f"Landmarks have been imported in {datetime.datetime.now() - last_operation}", flush=True)
-        last_operation = datetime.datetime.now()
+        with metrics.stage("create_indexes") as stage:
+            stage.add_neo4j_summary(create_indexes(driver))
+        print(f"Indexes created in {datetime.timedelta(seconds=stage.duration)}", flush=True)
+
+        if import_engine in ["python", "delta"]:
+            print("Parsing json files...", flush=True)
+            with metrics.stage("parse_json") as stage:
+                regions_json = unwind_import.load_json(regions_filename)
+                landmarks_json = unwind_import.load_json(landmarks_filename)
+                map_sectors_json = unwind_import.load_json(map_sectors_filename)
+                stage.add_rows(len(regions_json) + len(landmarks_json) + len(map_sectors_json))
+                regions_rows = unwind_import.parse_regions(regions_json)
+                landmarks_rows = unwind_import.parse_landmarks(landmarks_json)
+                map_sectors_rows = unwind_import.parse_map_sectors(map_sectors_json)
+            print(f"Json files have been parsed in {datetime.timedelta(seconds=stage.duration)}", flush=True)
+
+        if import_engine == "delta":
+            print("Importing changed records...", flush=True)
+            with metrics.stage("import_delta") as stage:
+                delta_stats, summaries = delta_import.import_delta(
+                    driver, regions_rows, landmarks_rows, map_sectors_rows, region_key(MAP_SECTORS_COUNTRY_NAME)
+                )
+                stage.add_rows(sum(sum(amounts.values()) for amounts in delta_stats.values()))
+                stage.add_neo4j_summary(summaries)
+            metrics.log_event("delta", **delta_stats)
+            for records_type, amounts in delta_stats.items():
+                print(
+                    f"{records_type}: {amounts['created']} created, {amounts['changed']} changed, "
+                    f"{amounts['removed']} removed",
+                    flush=True
+                )
+            print(f"Changed records have been imported in {datetime.timedelta(seconds=stage.duration)}", flush=True)
+        elif import_engine == "python":
+            print(f"Importing regions from \"{regions_filename}\"...", flush=True)
+            with metrics.stage("import_regions") as stage:
+                stage.add_rows(len(regions_rows["regions"]) + len(regions_rows["neighbours"]))
+                stage.add_neo4j_summary(unwind_import.import_regions(driver, regions_rows))
+            print(f"Regions have been imported in {datetime.timedelta(seconds=stage.duration)}", flush=True)
+
+            print(f"Importing hierarchy of regions from \"{regions_filename}\"...", flush=True)
+            with metrics.stage("import_regions_hierarchy") as stage:
+                stage.add_rows(len(regions_rows["includes"]))
+                stage.add_neo4j_summary(unwind_import.import_regions_hierarchy(driver, regions_rows))
+            print(
+                f"Hierarchy of regions have been imported in {datetime.timedelta(seconds=stage.duration)}",
+                flush=True
+            )
+
+            def import_map_sectors_stage():
+                # Returns True, if map sectors are imported (country exists)
+                print(f"Importing map sectors from \"{map_sectors_filename}\"...", flush=True)
+                with metrics.stage("import_map_sectors") as stage:
+                    stage.add_rows(sum(len(rows) for rows in map_sectors_rows.values()))
+                    if workers > 1:
+                        # IN_SECTOR relationships of explicit coordinates are written after landmarks
+                        imported, summaries = parallel_import.import_map_sectors(
+                            driver, map_sectors_rows, region_key(MAP_SECTORS_COUNTRY_NAME)
+                        )
+                    else:
+                        imported, summaries = True, unwind_import.import_map_sectors(
+                            driver, map_sectors_rows, region_key(MAP_SECTORS_COUNTRY_NAME)
+                        )
+                    stage.add_neo4j_summary(summaries)
+                print(
+                    f"Map sectors have been imported in {datetime.timedelta(seconds=stage.duration)}", flush=True
+                )
+                return imported
+
+            def import_landmarks_stage():
+                print(f"Importing landmarks from \"{landmarks_filename}\"...", flush=True)
+                with metrics.stage("import_landmarks") as stage:
+                    stage.add_rows(sum(len(rows) for rows in landmarks_rows.values()))
+                    if workers > 1:
+                        stage.add_neo4j_summary(parallel_import.import_landmarks(driver, landmarks_rows, workers))
+                    else:
+                        stage.add_neo4j_summary(unwind_import.import_landmarks(driver, landmarks_rows))
+                print(
+                    f"Landmarks have been imported in {datetime.timedelta(seconds=stage.duration)}", flush=True
+                )
+
+            if workers > 1:
+                # Map sectors and landmarks are written concurrently, the only relationships between them
+                # (IN_SECTOR of explicit coordinates) are written after both stages for landmarks,
+                # which exist before import (as in sequential import)
+                sectors_landmarks_rows = parallel_import.find_sectors_landmarks(driver, map_sectors_rows)
+                map_sectors_imported, _ = parallel_import.run_concurrently(
+                    import_map_sectors_stage, import_landmarks_stage
+                )
+                if map_sectors_imported:
+                    with metrics.stage("connect_sectors_landmarks") as stage:
+                        stage.add_rows(len(sectors_landmarks_rows))
+                        stage.add_neo4j_summary(
+                            parallel_import.connect_sectors_landmarks(driver, sectors_landmarks_rows)
+                        )
+            else:
+                import_map_sectors_stage()
+                import_landmarks_stage()
+        else:
+            print(f"Importing regions from \"file:///{regions_filename}\"...", flush=True)
+            with metrics.stage("import_regions") as stage:
+                stage.add_neo4j_summary(import_regions(driver, regions_filename))
+            print(f"Regions have been imported in {datetime.timedelta(seconds=stage.duration)}", flush=True)
+
+            print(f"Importing hierarchy of regions from \"file:///{regions_filename}\"...", flush=True)
+            with metrics.stage("import_regions_hierarchy") as stage:
+                stage.add_neo4j_summary(import_include_from_import_regions(driver, regions_filename))
+            print(
+                f"Hierarchy of regions have been imported in {datetime.timedelta(seconds=stage.duration)}", flush=True
+            )
+
+            print(f"Importing map sectors from \"file:///{map_sectors_filename}\"...", flush=True)
+            with metrics.stage("import_map_sectors") as stage:
+                stage.add_neo4j_summary(import_map_sectors(driver, map_sectors_filename))
+            print(f"Map sectors have been imported in {datetime.timedelta(seconds=stage.duration)}", flush=True)
+
+            print(f"Importing landmarks from \"file:///{landmarks_filename}\"...", flush=True)
+            with metrics.stage("import_landmarks") as stage:
+                stage.add_neo4j_summary(import_landmarks(driver, landmarks_filename))
+            print(f"Landmarks have been imported in {datetime.timedelta(seconds=stage.duration)}", flush=True)
+
         print("Connecting map sectors with landmarks...", flush=True)
-        connect_landmarks_with_map_sectors(driver)
-        print(f"Landmarks have been connected with map sectors in {datetime.datetime.now() - last_operation}", flush=True)
-        last_operation = datetime.datetime.now()
+        with metrics.stage("connect_landmarks_with_map_sectors") as stage:
+            landmarks_amount, summaries = connect_landmarks_with_map_sectors(driver)
+            stage.add_rows(landmarks_amount)
+            stage.add_neo4j_summary(summaries)
+        print(
+            f"Landmarks have been connected with map sectors in {datetime.timedelta(seconds=stage.duration)}",
+            flush=True
+        )
 
         print("Encoding regions and landmarks...", flush=True)
-        if save_existing_id_codes:
-            encoding_regions_and_landmarks_no_change_id_code(driver, base_dir)
-        else:
-            encoding_regions_and_landmarks_change_id_code(driver, base_dir)
-        print(f"Landmarks and regions have been encoded in {datetime.datetime.now() - last_operation}", flush=True)
+        with metrics.stage("encoding_regions_and_landmarks") as stage:
+            encoded = None
+            if save_existing_id_codes and import_engine == "delta":
+                # New landmarks are encoded without walking the whole hierarchy
+                encoded = encoding_new_landmarks(driver, base_dir, delta_stats)
+            if encoded is not None:
+                records_amount, summaries = encoded
+            elif save_existing_id_codes:
+                records_amount, summaries = encoding_regions_and_landmarks_no_change_id_code(driver, base_dir)
+            else:
+                records_amount, summaries = encoding_regions_and_landmarks_change_id_code(driver, base_dir)
+            stage.add_rows(records_amount)
+            stage.add_neo4j_summary(summaries)
+        print(
+            f"Landmarks and regions have been encoded in {datetime.timedelta(seconds=stage.duration)}", flush=True
+        )
 
         print(f"Knowledge bas has been imported. Complete in {datetime.datetime.now() - start_time}", flush=True)
+        success = True
 
     except Exception as e:
         print("ERROR OCCURED!", flush=True)
         print(f"{e.args[0]}, Error type: {type(e)}", flush=True)
+        metrics.log_event("import_failed", error=str(e), error_type=type(e).__name__)
+    finally:
+        metrics.finish(success)
 
 
 def import_function(
         user, password, host, port,
         regions_filename, landmarks_filename, map_sectors_filename,
-        base_dir, save_existing_id_codes
+        base_dir, save_existing_id_codes, metrics_dir=DEFAULT_METRICS_DIR, import_engine="apoc", workers=1
 ):
     start = datetime.datetime.now()
+    metrics = ImportMetrics("neo4j_kb", metrics_dir)
     print("Trying to connect to the knowledge base...", flush=True)
     with GraphDatabase.driver(f'bolt://{host}:{port}', auth=(user, password)) as driver:
         check_connection(driver)
         print("Knowledge base is successfully connected", flush=True)
 
-        run_cypher_scripts(driver, regions_filename, landmarks_filename, map_sectors_filename, base_dir, save_existing_id_codes, start)
+        run_cypher_scripts(
+            driver, regions_filename, landmarks_filename, map_sectors_filename, base_dir, save_existing_id_codes,
+            start, metrics, import_engine, workers
+        )
 
 
 def main():
@@ -1129,20 +1283,29 @@ def main():
             raise AttributeError(
                 f"Invalid argument \"{arg}\"."
             )
-        if arg_pair[0].strip() not in AVAILABLE_ARGS:
+        if arg_pair[0].strip() not in AVAILABLE_ARGS and arg_pair[0].strip() not in OPTIONAL_ARGS:
             raise AttributeError(
                 f"Invalid argument: \"{arg_pair[0]}\". Call \"python3 import_kb.py --help\" or python3 import_kb.py -h for more information"
             )
         else:
             args[arg_pair[0].strip()] = arg_pair[1].strip()
-    if len(AVAILABLE_ARGS) != len(args.keys()):
+    if any(arg not in args.keys() for arg in AVAILABLE_ARGS):
         raise AttributeError("Not all required attributes are given.")
+    for arg, default_value in OPTIONAL_ARGS.items():
+        args.setdefault(arg, default_value)
     if args["save_existing_id_codes"].lower() == "true" or args["save_existing_id_codes"].lower() == 't':
         args["save_existing_id_codes"] = True
     elif args["save_existing_id_codes"].lower() == "false" or args["save_existing_id_codes"].lower() == 'f':
         args["save_existing_id_codes"] = False
     else:
         raise AttributeError("Available values for save_existing_id_codes are: True, T to set param to True; False, F to set param to False (case insensitive).")
+    if args["import_engine"] not in IMPORT_ENGINES:
+        raise AttributeError(f"Available values for import_engine are: {', '.join(IMPORT_ENGINES)}.")
+    if not args["workers"].isdigit() or int(args["workers"]) < 1:
+        raise AttributeError("workers must be positive integer.")
+    args["workers"] = int(args["workers"])
+    if args["workers"] > 1 and args["import_engine"] != "python":
+        raise AttributeError("workers > 1 are available only for import_engine=python.")
     import_function(**args)
 
 
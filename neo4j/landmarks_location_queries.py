@@ -0,0 +1,62 @@
+# Queries of landmarks by location for map view.
+# Both queries are served by landmark_location_point_index (see INDEXES_QUERIES of import_kb.py):
+# point index is used for point.distance(...) <= radius and point.withinBBox(...) predicates on landmark.location
+import neo4j
+
+
+LANDMARKS_WITHIN_DISTANCE_QUERY = """
+    MATCH (landmark: Landmark)
+        WHERE point.distance(
+            landmark.location, point({latitude: $latitude, longitude: $longitude, crs: 'WGS-84'})
+        ) <= $distance
+    WITH landmark, point.distance(
+        landmark.location, point({latitude: $latitude, longitude: $longitude, crs: 'WGS-84'})
+    ) AS distance
+    RETURN landmark.name AS name, landmark.latitude AS latitude, landmark.longitude AS longitude, distance
+    ORDER BY distance
+"""
+LANDMARKS_IN_BBOX_QUERY = """
+    MATCH (landmark: Landmark)
+        WHERE point.withinBBox(
+            landmark.location,
+            point({latitude: $min_latitude, longitude: $min_longitude, crs: 'WGS-84'}),
+            point({latitude: $max_latitude, longitude: $max_longitude, crs: 'WGS-84'})
+        )
+    RETURN landmark.name AS name, landmark.latitude AS latitude, landmark.longitude AS longitude
+"""
+
+
+def _limited(query, limit):
+    if limit is None:
+        return query, {}
+    return query + "    LIMIT $limit\n", {"limit": limit}
+
+
+def find_landmarks_within_distance(driver, latitude, longitude, distance, limit=None):
+    # Returns landmarks not further than distance (metres) from (latitude, longitude), the nearest are the first
+    query, parameters = _limited(LANDMARKS_WITHIN_DISTANCE_QUERY, limit)
+    records, _, _ = driver.execute_query(
+        query,
+        latitude=float(latitude),
+        longitude=float(longitude),
+        distance=float(distance),
+        routing_=neo4j.RoutingControl.READ,
+        **parameters
+    )
+    return [record.data() for record in records]
+
+
+def find_landmarks_in_bbox(driver, min_latitude, min_longitude, max_latitude, max_longitude, limit=None):
+    # Returns landmarks inside of bounding box, borders are inclusive.
+    # Bounding box crosses the antimeridian if min_longitude > max_longitude
+    query, parameters = _limited(LANDMARKS_IN_BBOX_QUERY, limit)
+    records, _, _ = driver.execute_query(
+        query,
+        min_latitude=float(min_latitude),
+        min_longitude=float(min_longitude),
+        max_latitude=float(max_latitude),
+        max_longitude=float(max_longitude),
+        routing_=neo4j.RoutingControl.READ,
+        **parameters
+    )
+    return [record.data() for record in records]
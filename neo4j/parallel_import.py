@@ -0,0 +1,150 @@
+# Parallel execution of stages of python import engine (see unwind_import.py).
+# Map sectors are written concurrently with landmarks, landmarks are written by partitions (landmarks located in one
+# district or in cities of one district are in the same partition), so concurrent transactions don't lock the same
+# regions. REFERS relationships of all partitions would lock the same few categories, so they are written by one
+# sequential pass after partitions. IN_SECTOR relationships of explicit coordinates of sectors connect landmarks
+# with sectors, so they are written after both stages are finished.
+# Neo4j 5.18 has no CALL {} IN CONCURRENT TRANSACTIONS, so partitions are written by importer threads.
+# Every batch is written with managed transaction, which is retried by driver on transient errors (deadlocks)
+from concurrent.futures import ThreadPoolExecutor
+
+import unwind_import
+
+
+EXISTING_SECTORS_LANDMARKS_QUERY = """
+    UNWIND $batch AS row
+    MATCH (landmark: Landmark {latitude: row.latitude, longitude: row.longitude})
+    RETURN
+        row.sector_name AS sector_name,
+        landmark.name AS name,
+        landmark.latitude AS latitude,
+        landmark.longitude AS longitude
+"""
+SECTORS_EXISTING_LANDMARKS_QUERY = """
+    UNWIND $batch AS row
+    MATCH (sector: MapSector {name: row.sector_name})
+    MATCH (landmark: Landmark {name: row.name, latitude: row.latitude, longitude: row.longitude})
+    MERGE (landmark)-[:IN_SECTOR]->(sector)
+"""
+
+
+def run_concurrently(*functions):
+    # Runs functions without arguments in separate threads, returns their results.
+    # The first exception is raised after all functions have finished
+    with ThreadPoolExecutor(max_workers=len(functions)) as executor:
+        futures = [executor.submit(function) for function in functions]
+    return [future.result() for future in futures]
+
+
+def find_sectors_landmarks(driver, map_sectors_rows):
+    # Landmarks, which explicit coordinates of sectors are matched with by sequential import: it writes map sectors
+    # before landmarks, so only landmarks existing before import are connected. They are found before landmarks
+    # are written and connected after concurrent stages, so the graph doesn't depend on timing of threads
+    rows = map_sectors_rows["sectors_landmarks"]
+    with driver.session() as session:
+        return [
+            record.data()
+            for rows_start in range(0, len(rows), unwind_import.IMPORT_WRITE_BATCH_SIZE)
+            for record in session.run(
+                EXISTING_SECTORS_LANDMARKS_QUERY,
+                batch=rows[rows_start: rows_start + unwind_import.IMPORT_WRITE_BATCH_SIZE]
+            )
+        ]
+
+
+def import_map_sectors(driver, map_sectors_rows, country_key):
+    # The same as unwind_import.import_map_sectors without IN_SECTOR relationships, batches are retried.
+    # Returns (True, if sectors are imported, summaries)
+
+    def write_country_map_sectors(tx):
+        result = tx.run(unwind_import.COUNTRY_MAP_SECTORS_QUERY, country_key=country_key)
+        countries_amount = result.single()["countries_amount"]
+        return countries_amount, result.consume()
+
+    with driver.session() as session:
+        countries_amount, summary = session.execute_write(write_country_map_sectors)
+        summaries = [summary]
+        if not countries_amount:
+            return False, summaries
+        summaries.extend(
+            unwind_import.write_batches_retrying(session, unwind_import.MAP_SECTORS_QUERY, map_sectors_rows["sectors"])
+        )
+        summaries.extend(
+            unwind_import.write_batches_retrying(
+                session, unwind_import.NEIGHBOUR_SECTORS_QUERY, map_sectors_rows["neighbours"]
+            )
+        )
+    return True, summaries
+
+
+def connect_sectors_landmarks(driver, sectors_landmarks_rows):
+    # Writes IN_SECTOR relationships of rows of find_sectors_landmarks. Returns summaries
+    with driver.session() as session:
+        return unwind_import.write_batches(session, SECTORS_EXISTING_LANDMARKS_QUERY, sectors_landmarks_rows)
+
+
+def partition_landmarks_rows(landmarks_rows):
+    # Returns list of partitions of landmarks_rows (without categories and REFERS relationships).
+    # Every landmark is written in partition of the first region, which it is located in
+    cities_districts = {row["key"]: row["district_key"] for row in landmarks_rows["cities"]}
+    partitions = {}
+    landmarks_partitions = {}
+
+    def partition(partition_key):
+        return partitions.setdefault(
+            partition_key, {"landmarks": [], "cities": [], "landmarks_located": []}
+        )
+
+    def landmark_key(row):
+        return row["name"], row["latitude"], row["longitude"]
+
+    for row in landmarks_rows["cities"]:
+        partition(row["district_key"])["cities"].append(row)
+    for row in landmarks_rows["landmarks_located"]:
+        partition_key = cities_districts.get(row["region_key"], row["region_key"])
+        landmarks_partitions.setdefault(landmark_key(row), partition_key)
+        partition(partition_key)["landmarks_located"].append(row)
+    for row in landmarks_rows["landmarks"]:
+        partition(landmarks_partitions.get(landmark_key(row)))["landmarks"].append(row)
+    return list(partitions.values())
+
+
+def import_landmarks(driver, landmarks_rows, workers):
+    # Categories are shared by partitions, so they are created before partitions and REFERS relationships
+    # are written after partitions by one session. Nodes of all partitions are created before LOCATED relationships,
+    # because landmark may be located in regions of different partitions
+    partitions = partition_landmarks_rows(landmarks_rows)
+
+    def write_nodes(partition):
+        with driver.session() as session:
+            summaries = unwind_import.write_batches_retrying(
+                session, unwind_import.LANDMARKS_QUERY, partition["landmarks"]
+            )
+            summaries.extend(
+                unwind_import.write_batches_retrying(session, unwind_import.CITIES_QUERY, partition["cities"])
+            )
+        return summaries
+
+    def write_located(partition):
+        with driver.session() as session:
+            return unwind_import.write_batches_retrying(
+                session, unwind_import.LANDMARKS_LOCATED_QUERY, partition["landmarks_located"]
+            )
+
+    with driver.session() as session:
+        summaries = unwind_import.write_batches_retrying(
+            session, unwind_import.LANDMARK_CATEGORIES_QUERY, landmarks_rows["categories"]
+        )
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for partition_summaries in executor.map(write_nodes, partitions):
+            summaries.extend(partition_summaries)
+        for partition_summaries in executor.map(write_located, partitions):
+            summaries.extend(partition_summaries)
+    # Map sectors may be written concurrently, so batches are still retried
+    with driver.session() as session:
+        summaries.extend(
+            unwind_import.write_batches_retrying(
+                session, unwind_import.LANDMARKS_CATEGORIES_QUERY, landmarks_rows["landmarks_categories"]
+            )
+        )
+    return summaries
@@ -0,0 +1,86 @@
+import numpy as np
+
+
+class SectorGrid:
+    # Uniform grid over rectangles of map sectors. Every cell keeps sectors, which rectangles touch the cell,
+    # so point is tested only against sectors of its cell. Borders of sectors are inclusive
+    # (the same as point.withinBBox), point on the common border belongs to both sectors
+
+    def __init__(self, sectors, cell_size=None):
+        # sectors - list of (name, tl_latitude, tl_longitude, br_latitude, br_longitude).
+        # cell_size - size of cell in degrees, median size of sector by default
+        self.names = np.array([sector[0] for sector in sectors], dtype=object)
+        bounds = np.array([sector[1:] for sector in sectors], dtype=np.float64).reshape(-1, 4)
+        self.min_latitudes = np.minimum(bounds[:, 0], bounds[:, 2])
+        self.max_latitudes = np.maximum(bounds[:, 0], bounds[:, 2])
+        self.min_longitudes = np.minimum(bounds[:, 1], bounds[:, 3])
+        self.max_longitudes = np.maximum(bounds[:, 1], bounds[:, 3])
+        if len(sectors) == 0:
+            self.cell_offsets = np.zeros(1, dtype=np.int64)
+            self.cell_sectors = np.zeros(0, dtype=np.int64)
+            return
+
+        if cell_size is None:
+            sizes = np.concatenate([
+                self.max_latitudes - self.min_latitudes, self.max_longitudes - self.min_longitudes
+            ])
+            sizes = sizes[sizes > 0]
+            cell_size = float(np.median(sizes)) if sizes.size else 1.0
+        self.cell_size = cell_size
+        self.origin_latitude = float(self.min_latitudes.min())
+        self.origin_longitude = float(self.min_longitudes.min())
+        self.rows = int((self.max_latitudes.max() - self.origin_latitude) // cell_size) + 1
+        self.columns = int((self.max_longitudes.max() - self.origin_longitude) // cell_size) + 1
+
+        # Sectors of cells are stored in CSR form:
+        # sectors of cell i are cell_sectors[cell_offsets[i]: cell_offsets[i + 1]]
+        first_rows, first_columns = self._cells_coordinates(self.min_latitudes, self.min_longitudes)
+        last_rows, last_columns = self._cells_coordinates(self.max_latitudes, self.max_longitudes)
+        cells, sectors_indexes = [], []
+        for sector_index in range(len(sectors)):
+            sector_rows = np.arange(first_rows[sector_index], last_rows[sector_index] + 1)
+            sector_columns = np.arange(first_columns[sector_index], last_columns[sector_index] + 1)
+            sector_cells = (sector_rows[:, None] * self.columns + sector_columns[None, :]).ravel()
+            cells.append(sector_cells)
+            sectors_indexes.append(np.full(sector_cells.shape[0], sector_index, dtype=np.int64))
+        cells = np.concatenate(cells)
+        sectors_indexes = np.concatenate(sectors_indexes)
+        order = np.argsort(cells, kind="stable")
+        self.cell_sectors = sectors_indexes[order]
+        self.cell_offsets = np.zeros(self.rows * self.columns + 1, dtype=np.int64)
+        np.cumsum(np.bincount(cells, minlength=self.rows * self.columns), out=self.cell_offsets[1:])
+
+    def _cells_coordinates(self, latitudes, longitudes):
+        rows = np.clip(((latitudes - self.origin_latitude) // self.cell_size).astype(np.int64), 0, self.rows - 1)
+        columns = np.clip(
+            ((longitudes - self.origin_longitude) // self.cell_size).astype(np.int64), 0, self.columns - 1
+        )
+        return rows, columns
+
+    def assign(self, latitudes, longitudes):
+        # Returns (indexes of points, names of sectors) for every pair of point and sector, which contains it
+        latitudes = np.asarray(latitudes, dtype=np.float64)
+        longitudes = np.asarray(longitudes, dtype=np.float64)
+        if latitudes.size == 0 or self.cell_sectors.size == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=object)
+
+        # Point without coordinate (None is nan) is not within any sector, as point.withinBBox of null
+        located_indexes = np.flatnonzero(~(np.isnan(latitudes) | np.isnan(longitudes)))
+        rows, columns = self._cells_coordinates(latitudes[located_indexes], longitudes[located_indexes])
+        cells = rows * self.columns + columns
+        candidates_amounts = self.cell_offsets[cells + 1] - self.cell_offsets[cells]
+        points_indexes = np.repeat(located_indexes, candidates_amounts)
+        # Position of every candidate inside sectors list of its cell
+        candidates_starts = np.repeat(np.cumsum(candidates_amounts) - candidates_amounts, candidates_amounts)
+        positions = np.arange(points_indexes.shape[0]) - candidates_starts
+        sectors_indexes = self.cell_sectors[np.repeat(self.cell_offsets[cells], candidates_amounts) + positions]
+
+        point_latitudes = latitudes[points_indexes]
+        point_longitudes = longitudes[points_indexes]
+        inside = (
+            (point_latitudes >= self.min_latitudes[sectors_indexes]) &
+            (point_latitudes <= self.max_latitudes[sectors_indexes]) &
+            (point_longitudes >= self.min_longitudes[sectors_indexes]) &
+            (point_longitudes <= self.max_longitudes[sectors_indexes])
+        )
+        return points_indexes[inside], self.names[sectors_indexes[inside]]
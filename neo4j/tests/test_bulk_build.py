@@ -0,0 +1,102 @@
+# Checks, that id_codes and paths of bulk build are the same as encoding_regions_and_landmarks_no_change_id_code
+# of import_kb.py assigns on empty database. Expected values are derived by hand from the Cypher walk:
+# records are ordered by names of country, state, district, city and landmark (nulls last), city is walked
+# instead of its district (apoc.do.case), every new id_code is the max id_code of members of the same parent + 1.
+# Usage: python3 -m unittest discover -s neo4j/tests
+import os
+import sys
+import pathlib
+import unittest
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+import unwind_import
+from bulk_build import build_graph, encode_hierarchy
+
+
+BASE_DIR = "landmarks_dirs"
+REGIONS_JSON = [
+    {"type": ["country"], "name": "Alpha", "bordered": [{"type": ["country"], "name": "Beta"}]},
+    {"type": ["state"], "name": "North", "part_of": {"country": "Alpha"}},
+    {"type": ["state"], "name": "East", "part_of": {"country": "Alpha"}},
+    {"type": ["district"], "name": "N2", "part_of": {"country": "Alpha", "state": "North"}},
+    {"type": ["district"], "name": "N1", "part_of": {"country": "Alpha", "state": "North"}}
+]
+
+
+def landmark_json(name, coordinate, state, district, city):
+    return {
+        "name": name,
+        "category": "Museums",
+        "subcategory": [],
+        "coordinates": {"latitude": coordinate, "longitude": coordinate},
+        "located": {"country": "Alpha", "state": state, "district": district, "city": city},
+        "summary": ""
+    }
+
+
+LANDMARKS_JSON = [
+    # Cities of N1 are created by import
+    landmark_json("Castle", 1.0, "North", "N1", "Town B"),
+    landmark_json("Abbey", 1.1, "North", "N1", "Town B"),
+    landmark_json("Museum", 1.2, "North", "N1", "Town A"),
+    # Located in Town A and in N2, encoded in Town A (it is walked first), but counted by N2 too
+    landmark_json("Shared", 1.3, "North", "N1", "Town A"),
+    landmark_json("Shared", 1.3, "North", "", "N2"),
+    landmark_json("Bridge", 1.4, "North", "", "N2"),
+    landmark_json("Zoo", 1.5, "North", "", "N2"),
+    # Located in district with cities, so it is never walked and isn't encoded
+    landmark_json("Lost", 1.6, "North", "", "N1")
+]
+
+EXPECTED_REGIONS_ID_CODES = {
+    "Alpha": 1,
+    "Beta": 2,
+    "East (Alpha)": 1,
+    "North (Alpha)": 2,
+    "N1 (Alpha, North)": 1,
+    "N2 (Alpha, North)": 2,
+    "Town A (Alpha, North, N1)": 1,
+    "Town B (Alpha, North, N1)": 2
+}
+EXPECTED_LANDMARKS_PATHS = {
+    # name -> (id_code, path relative to BASE_DIR: country/state/district/city/landmark)
+    "Museum": (1, "1/2/1/1/1"),
+    "Shared": (2, "1/2/1/1/2"),
+    "Abbey": (1, "1/2/1/2/1"),
+    "Castle": (2, "1/2/1/2/2"),
+    # The last id_code of N2 is 2 (Shared), city id_code is 0
+    "Bridge": (3, "1/2/2/0/3"),
+    "Zoo": (4, "1/2/2/0/4")
+}
+
+
+class EncodeHierarchyTest(unittest.TestCase):
+    def setUp(self):
+        self.graph = build_graph(
+            unwind_import.parse_regions(REGIONS_JSON),
+            unwind_import.parse_landmarks(LANDMARKS_JSON),
+            unwind_import.parse_map_sectors([])
+        )
+        self.records_amount = encode_hierarchy(self.graph, BASE_DIR)
+
+    def test_regions_id_codes(self):
+        self.assertEqual(
+            EXPECTED_REGIONS_ID_CODES,
+            {name: region.get("id_code") for name, region in self.graph["regions"].items()}
+        )
+
+    def test_landmarks_id_codes_and_paths(self):
+        landmarks = {landmark["name"]: landmark for landmark in self.graph["landmarks"]}
+        for name, (id_code, path) in EXPECTED_LANDMARKS_PATHS.items():
+            self.assertEqual(id_code, landmarks[name].get("id_code"), name)
+            self.assertEqual(os.path.join(BASE_DIR, path), landmarks[name].get("path"), name)
+        self.assertNotIn("id_code", landmarks["Lost"])
+        self.assertNotIn("path", landmarks["Lost"])
+
+    def test_records_amount(self):
+        # (Alpha, East), Museum, Shared, Abbey, Castle, Bridge, Shared in N2, Zoo, (Beta)
+        self.assertEqual(9, self.records_amount)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,152 @@
+# Checks delta import on parsed rows: only records changed since the previous import are written, and encoding
+# falls back to the full walk, when the delta creates regions (only full encoding assigns id_codes of regions).
+# Neo4j is replaced with fake session, which returns stored fingerprints and keeps written batches.
+# Usage: python3 -m unittest discover -s neo4j/tests
+import sys
+import pathlib
+import unittest
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+import unwind_import
+import delta_import
+
+
+REGIONS_JSON = [
+    {"type": ["country"], "name": "Alpha"},
+    {"type": ["state"], "name": "North", "part_of": {"country": "Alpha"}},
+    {"type": ["district"], "name": "N1", "part_of": {"country": "Alpha", "state": "North"}}
+]
+LANDMARKS_JSON = [
+    {
+        "name": "Castle",
+        "category": "Castles",
+        "subcategory": [],
+        "coordinates": {"latitude": 1.0, "longitude": 1.0},
+        "located": {"country": "Alpha", "state": "North", "district": "", "city": "N1"},
+        "summary": ""
+    }
+]
+# New district without landmarks
+NEW_REGION_JSON = {"type": ["district"], "name": "N2", "part_of": {"country": "Alpha", "state": "North"}}
+
+
+class FakeRecord(dict):
+    pass
+
+
+class FakeResult:
+    def __init__(self, records):
+        self._records = [FakeRecord(record) for record in records]
+
+    def __iter__(self):
+        return iter(self._records)
+
+    def single(self):
+        return self._records[0]
+
+    def consume(self):
+        return None
+
+
+class FakeSession:
+    # Answers reads of delta_import with stored state, keeps rows of every written batch by query
+
+    def __init__(self, stored_regions, stored_landmarks, unencoded_amount=0):
+        self.stored_regions = stored_regions
+        self.stored_landmarks = stored_landmarks
+        self.unencoded_amount = unencoded_amount
+        self.written = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def run(self, query, **parameters):
+        if query == delta_import.REGIONS_HASHES_QUERY:
+            return FakeResult(
+                {"key": key, "source_hash": source_hash} for key, source_hash in self.stored_regions.items()
+            )
+        if query == delta_import.LANDMARKS_HASHES_QUERY:
+            return FakeResult(
+                {"name": name, "latitude": latitude, "longitude": longitude, "source_hash": source_hash}
+                for (name, latitude, longitude), source_hash in self.stored_landmarks.items()
+            )
+        if query == delta_import.MAP_SECTORS_HASHES_QUERY:
+            return FakeResult([])
+        if query == unwind_import.COUNTRY_MAP_SECTORS_QUERY:
+            return FakeResult([{"countries_amount": 1}])
+        if query == delta_import.UNENCODED_REGIONS_QUERY:
+            return FakeResult([{"unencoded_amount": self.unencoded_amount}])
+        self.written.setdefault(query, []).extend(parameters.get("batch", []))
+        return FakeResult([])
+
+
+class FakeDriver:
+    def __init__(self, session):
+        self._session = session
+
+    def session(self):
+        return self._session
+
+
+def parse(regions_json):
+    return (
+        unwind_import.parse_regions(regions_json),
+        unwind_import.parse_landmarks(LANDMARKS_JSON),
+        unwind_import.parse_map_sectors([])
+    )
+
+
+def stored_state(regions_rows, landmarks_rows):
+    # Fingerprints, written by the previous delta import of these rows
+    return (
+        {key: record["source_hash"] for key, record in delta_import.regions_records(regions_rows).items()},
+        {key: record["source_hash"] for key, record in delta_import.landmarks_records(landmarks_rows).items()}
+    )
+
+
+class RegionOnlyDeltaTest(unittest.TestCase):
+    def setUp(self):
+        regions_rows, landmarks_rows, _ = parse(REGIONS_JSON)
+        self.stored_regions, self.stored_landmarks = stored_state(regions_rows, landmarks_rows)
+
+    def import_delta(self, regions_json, unencoded_amount=0):
+        session = FakeSession(self.stored_regions, self.stored_landmarks, unencoded_amount)
+        stats, _ = delta_import.import_delta(
+            FakeDriver(session), *parse(regions_json), unwind_import.region_key("Alpha")
+        )
+        return session, stats
+
+    def test_unchanged_rows_are_not_written(self):
+        session, stats = self.import_delta(REGIONS_JSON)
+        for records_type in ["regions", "landmarks", "map_sectors"]:
+            self.assertEqual({"created": 0, "changed": 0, "removed": 0}, stats[records_type], records_type)
+        self.assertEqual({}, {query: rows for query, rows in session.written.items() if rows})
+        self.assertFalse(delta_import.needs_full_encoding(session, stats))
+
+    def test_created_region_without_landmarks(self):
+        session, stats = self.import_delta(REGIONS_JSON + [NEW_REGION_JSON])
+        new_region_key = unwind_import.region_key("Alpha", "North", "N2")
+        self.assertEqual({"created": 1, "changed": 0, "removed": 0}, stats["regions"])
+        self.assertEqual({"created": 0, "changed": 0, "removed": 0}, stats["landmarks"])
+        self.assertEqual(
+            [new_region_key], [row["key"] for row in session.written[unwind_import.REGIONS_QUERY]]
+        )
+        self.assertIn(
+            {"parent_key": unwind_import.region_key("Alpha", "North"), "key": new_region_key},
+            session.written[unwind_import.INCLUDE_REGIONS_QUERY]
+        )
+        self.assertNotIn(unwind_import.LANDMARKS_QUERY, {query for query, rows in session.written.items() if rows})
+        # No new landmarks are above the new region, but it must get id_code from the full walk
+        self.assertTrue(delta_import.needs_full_encoding(session, stats))
+
+    def test_region_without_id_code(self):
+        session, stats = self.import_delta(REGIONS_JSON, unencoded_amount=1)
+        self.assertFalse(stats["regions"]["created"])
+        self.assertTrue(delta_import.needs_full_encoding(session, stats))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,326 @@
+# Checks, that encode_hierarchy_records of import_kb.py (the walk of encoding_regions_and_landmarks_no_change_id_code)
+# assigns the same id_codes and paths as encode_hierarchy of bulk_build.py on empty and on already encoded graph.
+# The walk is driven by records, which are the same as the queries of import_kb.py return for the graph:
+# regions with their parents, located landmarks with their regions and hierarchy ordered by names (nulls last).
+# Batched writes of both encoding modes are checked against per-record writes with small ENCODING_WRITE_BATCH_SIZE.
+# Usage: python3 -m unittest discover -s neo4j/tests
+import os
+import sys
+import copy
+import pathlib
+import unittest
+from unittest import mock
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+import unwind_import
+import import_kb
+from import_kb import encode_hierarchy_records
+from bulk_build import build_graph, encode_hierarchy, none_last
+from test_bulk_build import BASE_DIR, REGIONS_JSON, LANDMARKS_JSON
+
+
+# Encoded by the previous import: East state, Museum, Abbey and Bridge are new in the current one
+PREVIOUS_REGIONS_JSON = [region_json for region_json in REGIONS_JSON if region_json["name"] != "East"]
+PREVIOUS_LANDMARKS_JSON = [
+    landmark_json for landmark_json in LANDMARKS_JSON if landmark_json["name"] in ["Castle", "Shared", "Zoo"]
+]
+
+
+def parse_graph(regions_json, landmarks_json):
+    return build_graph(
+        unwind_import.parse_regions(regions_json),
+        unwind_import.parse_landmarks(landmarks_json),
+        unwind_import.parse_map_sectors([])
+    )
+
+
+def landmark_key(landmark):
+    return landmark["name"], landmark["latitude"], landmark["longitude"]
+
+
+def regions_records(graph):
+    parents = {}
+    for parent_name, name in graph["includes"]:
+        parents.setdefault(name, []).append(parent_name)
+    return [
+        {
+            "region_name": name,
+            "region_labels": region["labels"],
+            "region_id_code": region.get("id_code"),
+            "parents_names": parents.get(name, [])
+        }
+        for name, region in graph["regions"].items()
+    ]
+
+
+def landmarks_records(graph):
+    regions_names = {}
+    for landmark_index, region_name in graph["landmarks_located"]:
+        regions_names.setdefault(landmark_index, []).append(region_name)
+    return [
+        {
+            "landmark_name": graph["landmarks"][landmark_index]["name"],
+            "landmark_latitude": graph["landmarks"][landmark_index]["latitude"],
+            "landmark_longitude": graph["landmarks"][landmark_index]["longitude"],
+            "landmark_id_code": graph["landmarks"][landmark_index].get("id_code"),
+            "regions_names": names
+        }
+        for landmark_index, names in regions_names.items()
+    ]
+
+
+def hierarchy_records(graph):
+    # Countries with optional states, districts and cities, landmarks of city or of district without cities
+    regions = graph["regions"]
+    children = {}
+    for parent_name, name in graph["includes"]:
+        children.setdefault(parent_name, []).append(name)
+    located = {}
+    for landmark_index, region_name in graph["landmarks_located"]:
+        located.setdefault(region_name, []).append(graph["landmarks"][landmark_index])
+
+    def included(parent_name, label):
+        if parent_name is None:
+            return [None]
+        return [name for name in children.get(parent_name, []) if label in regions[name]["labels"]] or [None]
+
+    def region_fields(level, name):
+        return {
+            f"{level}_name": name,
+            f"{level}_key": None if name is None else regions[name]["key"],
+            f"{level}_id_code": None if name is None else regions[name].get("id_code")
+        }
+
+    records = []
+    for country_name, country in regions.items():
+        if "Country" not in country["labels"]:
+            continue
+        for state_name in included(country_name, "State"):
+            for district_name in included(state_name, "District"):
+                for city_name in included(district_name, "City"):
+                    region_name = city_name if city_name is not None else district_name
+                    for landmark in located.get(region_name, [None]):
+                        records.append({
+                            **region_fields("country", country_name),
+                            **region_fields("state", state_name),
+                            **region_fields("district", district_name),
+                            **region_fields("city", city_name),
+                            "landmark_name": None if landmark is None else landmark["name"],
+                            "landmark_latitude": None if landmark is None else landmark["latitude"],
+                            "landmark_longitude": None if landmark is None else landmark["longitude"],
+                            "landmark_id_code": None if landmark is None else landmark.get("id_code")
+                        })
+    return sorted(
+        records,
+        key=lambda record: [
+            none_last(record[f"{level}_name"]) for level in ["country", "state", "district", "city", "landmark"]
+        ]
+    )
+
+
+def walk(graph):
+    # Returns graph with written id_codes and paths, written rows and amount of records
+    graph = copy.deepcopy(graph)
+    written_regions_rows, written_landmarks_rows = [], []
+
+    def write_rows(regions_rows, landmarks_rows):
+        written_regions_rows.extend(regions_rows)
+        written_landmarks_rows.extend(landmarks_rows)
+
+    records_amount = encode_hierarchy_records(
+        BASE_DIR, regions_records(graph), landmarks_records(graph), hierarchy_records(graph), write_rows
+    )
+    names_by_key = {region["key"]: name for name, region in graph["regions"].items()}
+    for row in written_regions_rows:
+        graph["regions"][names_by_key[row["key"]]]["id_code"] = row["id_code"]
+    landmarks = {landmark_key(landmark): landmark for landmark in graph["landmarks"]}
+    for row in written_landmarks_rows:
+        landmarks[landmark_key(row)].update(id_code=row["id_code"], path=row["path"])
+    return graph, written_regions_rows, written_landmarks_rows, records_amount
+
+
+def encoded_properties(graph):
+    return (
+        {name: region.get("id_code") for name, region in graph["regions"].items()},
+        {landmark_key(landmark): (landmark.get("id_code"), landmark.get("path")) for landmark in graph["landmarks"]}
+    )
+
+
+class EncodeHierarchyRecordsTest(unittest.TestCase):
+    def assert_same_as_bulk_build(self, graph):
+        walked_graph, regions_rows, landmarks_rows, records_amount = walk(graph)
+        bulk_graph = copy.deepcopy(graph)
+        self.assertEqual(encode_hierarchy(bulk_graph, BASE_DIR), records_amount)
+        self.assertEqual(encoded_properties(bulk_graph), encoded_properties(walked_graph))
+        return walked_graph, regions_rows, landmarks_rows
+
+    def test_empty_graph(self):
+        walked_graph, regions_rows, landmarks_rows = self.assert_same_as_bulk_build(
+            parse_graph(REGIONS_JSON, LANDMARKS_JSON)
+        )
+        # Every region is written once, Shared is written only for Town A (not for N2), Lost is never walked
+        self.assertEqual(len(walked_graph["regions"]), len(regions_rows))
+        self.assertEqual(
+            ["Museum", "Shared", "Abbey", "Castle", "Bridge", "Zoo"], [row["name"] for row in landmarks_rows]
+        )
+        landmarks = {landmark["name"]: landmark for landmark in walked_graph["landmarks"]}
+        self.assertEqual(
+            (2, os.path.join(BASE_DIR, "1/2/1/1/2")), (landmarks["Shared"]["id_code"], landmarks["Shared"]["path"])
+        )
+        self.assertEqual(
+            (3, os.path.join(BASE_DIR, "1/2/2/0/3")), (landmarks["Bridge"]["id_code"], landmarks["Bridge"]["path"])
+        )
+
+    def test_existing_id_codes(self):
+        previous_graph, _, _, _ = walk(parse_graph(PREVIOUS_REGIONS_JSON, PREVIOUS_LANDMARKS_JSON))
+        previous_regions, previous_landmarks = encoded_properties(previous_graph)
+        graph = parse_graph(REGIONS_JSON, LANDMARKS_JSON)
+        for name, region in graph["regions"].items():
+            if previous_regions.get(name) is not None:
+                region["id_code"] = previous_regions[name]
+        for landmark in graph["landmarks"]:
+            if landmark_key(landmark) in previous_landmarks:
+                landmark["id_code"], landmark["path"] = previous_landmarks[landmark_key(landmark)]
+
+        walked_graph, regions_rows, landmarks_rows = self.assert_same_as_bulk_build(graph)
+        # Only new members are written, their id_codes follow the existing ones of the same parent:
+        # North is the first state of Alpha before, Shared and Zoo are the first two landmarks of N2
+        self.assertEqual([unwind_import.region_key("Alpha", "East")], [row["key"] for row in regions_rows])
+        self.assertEqual(2, walked_graph["regions"]["East (Alpha)"]["id_code"])
+        self.assertEqual(
+            {
+                "Museum": (2, os.path.join(BASE_DIR, "1/1/1/1/2")),
+                "Abbey": (2, os.path.join(BASE_DIR, "1/1/1/2/2")),
+                "Bridge": (3, os.path.join(BASE_DIR, "1/1/2/0/3"))
+            },
+            {row["name"]: (row["id_code"], row["path"]) for row in landmarks_rows}
+        )
+        for landmark in walked_graph["landmarks"]:
+            if landmark_key(landmark) in previous_landmarks:
+                self.assertEqual(
+                    previous_landmarks[landmark_key(landmark)], (landmark["id_code"], landmark["path"])
+                )
+
+
+class FakeResult:
+    def consume(self):
+        return None
+
+
+class FakeTransaction:
+    # Keeps rows of every UNWIND query of write_regions_id_codes and write_landmarks_id_codes_and_paths
+    def __init__(self):
+        self.regions_batches = []
+        self.landmarks_batches = []
+
+    def run(self, query, **parameters):
+        rows = parameters["rows"]
+        (self.regions_batches if "key" in rows[0] else self.landmarks_batches).append(rows)
+        return FakeResult()
+
+
+def apply_rows(rows, key_fields):
+    # Properties after writes one by one: the last write of the same node wins
+    written = {}
+    for row in rows:
+        written[tuple(row[field] for field in key_fields)] = {
+            field: value for field, value in row.items() if field not in key_fields
+        }
+    return written
+
+
+REGION_KEY_FIELDS = ["key"]
+LANDMARK_KEY_FIELDS = ["name", "latitude", "longitude"]
+
+
+class BatchedWritesTest(unittest.TestCase):
+    def setUp(self):
+        self.graph = parse_graph(REGIONS_JSON, LANDMARKS_JSON)
+        # 8 regions and 6 landmarks are written: batch size 4 fills batches of regions exactly,
+        # batch size 3 fills batches of landmarks exactly and leaves 2 regions for the last batch
+        self.batch_sizes = [1, 3, 4, 1000]
+
+    def assert_batches(self, batches, batch_size):
+        self.assertTrue(all(batches), batches)
+        self.assertTrue(all(len(batch) == batch_size for batch in batches[:-1]), batches)
+        self.assertLessEqual(len(batches[-1]), batch_size)
+
+    def test_changing_id_codes(self):
+        # Baseline walk wrote every assignment of every record with its own query
+        per_record_regions_rows, per_record_landmarks_rows = [], []
+        import_kb.encode_hierarchy_records_changing_id_codes(
+            BASE_DIR, hierarchy_records(self.graph),
+            lambda key, id_code: per_record_regions_rows.append({"key": key, "id_code": id_code}),
+            lambda name, latitude, longitude, id_code, path: per_record_landmarks_rows.append(
+                {"name": name, "latitude": latitude, "longitude": longitude, "id_code": id_code, "path": path}
+            )
+        )
+        # Shared is written in Town A and then in N2
+        self.assertEqual(7, len(per_record_landmarks_rows))
+
+        for batch_size in self.batch_sizes:
+            with self.subTest(batch_size=batch_size), mock.patch.object(
+                import_kb, "ENCODING_WRITE_BATCH_SIZE", batch_size
+            ):
+                regions_rows, landmarks_rows, records_amount = import_kb.changed_id_codes_rows(
+                    BASE_DIR, hierarchy_records(self.graph)
+                )
+                tx = FakeTransaction()
+                import_kb.write_regions_id_codes(tx, regions_rows)
+                import_kb.write_landmarks_id_codes_and_paths(tx, landmarks_rows)
+                self.assertEqual(9, records_amount)
+                self.assert_batches(tx.regions_batches, batch_size)
+                self.assert_batches(tx.landmarks_batches, batch_size)
+                batched_regions_rows = [row for batch in tx.regions_batches for row in batch]
+                batched_landmarks_rows = [row for batch in tx.landmarks_batches for row in batch]
+                # Every node is written once with its last assignment
+                self.assertEqual(8, len(batched_regions_rows))
+                self.assertEqual(6, len(batched_landmarks_rows))
+                self.assertEqual(
+                    apply_rows(per_record_regions_rows, REGION_KEY_FIELDS),
+                    apply_rows(batched_regions_rows, REGION_KEY_FIELDS)
+                )
+                self.assertEqual(
+                    apply_rows(per_record_landmarks_rows, LANDMARK_KEY_FIELDS),
+                    apply_rows(batched_landmarks_rows, LANDMARK_KEY_FIELDS)
+                )
+
+    def keeping_id_codes_batches(self, batch_size):
+        tx = FakeTransaction()
+
+        def write_rows(regions_rows, landmarks_rows):
+            self.assertTrue(regions_rows or landmarks_rows)
+            import_kb.write_regions_id_codes(tx, regions_rows)
+            import_kb.write_landmarks_id_codes_and_paths(tx, landmarks_rows)
+
+        with mock.patch.object(import_kb, "ENCODING_WRITE_BATCH_SIZE", batch_size):
+            encode_hierarchy_records(
+                BASE_DIR, regions_records(self.graph), landmarks_records(self.graph),
+                hierarchy_records(self.graph), write_rows
+            )
+        return tx
+
+    def test_keeping_id_codes(self):
+        # With batch size 1 rows are flushed after every record, as the baseline walk wrote them
+        per_record_tx = self.keeping_id_codes_batches(1)
+        per_record_regions_rows = [row for batch in per_record_tx.regions_batches for row in batch]
+        per_record_landmarks_rows = [row for batch in per_record_tx.landmarks_batches for row in batch]
+        self.assertEqual(8, len(per_record_regions_rows))
+        self.assertEqual(6, len(per_record_landmarks_rows))
+
+        for batch_size in self.batch_sizes:
+            with self.subTest(batch_size=batch_size):
+                tx = self.keeping_id_codes_batches(batch_size)
+                # Record can add several regions, so flushed rows are split by the writer again
+                self.assertTrue(all(len(batch) <= batch_size for batch in tx.regions_batches))
+                self.assertTrue(all(len(batch) <= batch_size for batch in tx.landmarks_batches))
+                if batch_size <= len(per_record_regions_rows):
+                    self.assertIn(batch_size, [len(batch) for batch in tx.regions_batches])
+                self.assertEqual(per_record_regions_rows, [row for batch in tx.regions_batches for row in batch])
+                self.assertEqual(
+                    per_record_landmarks_rows, [row for batch in tx.landmarks_batches for row in batch]
+                )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,117 @@
+# Checks partitions of parallel import: every landmark, city and LOCATED row is written by exactly one partition,
+# cities and landmarks located in them are in the partition of their district, landmarks are written by partition
+# of the first region they are located in and landmarks without regions are in the partition without district.
+# Usage: python3 -m unittest discover -s neo4j/tests
+import sys
+import pathlib
+import unittest
+from collections import Counter
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+import unwind_import
+from parallel_import import partition_landmarks_rows
+
+
+def landmark_json(name, coordinate, located):
+    return {
+        "name": name,
+        "category": "Museums",
+        "subcategory": [],
+        "coordinates": {"latitude": coordinate, "longitude": coordinate},
+        "located": {"country": "Alpha", **located},
+        "summary": ""
+    }
+
+
+LANDMARKS_JSON = [
+    landmark_json("Castle", 1.0, {"state": "North", "district": "N1", "city": "Town A"}),
+    landmark_json("Abbey", 1.1, {"state": "North", "district": "", "city": "N1"}),
+    landmark_json("Museum", 1.2, {"state": "North", "district": "N1", "city": "Town B"}),
+    # Located in two districts, written by partition of N2
+    landmark_json("Shared", 1.3, {"state": "North", "district": "", "city": "N2"}),
+    landmark_json("Shared", 1.3, {"state": "North", "district": "N1", "city": "Town A"}),
+    landmark_json("Bridge", 1.4, {"state": "North", "district": "", "city": "N2"}),
+    # Located in Minsk-like city of country without state
+    landmark_json("Tower", 1.5, {"state": "", "district": "C1", "city": "Capital"}),
+    # No region key, so it isn't located anywhere
+    landmark_json("Lost", 1.6, {"state": "North", "district": None, "city": None})
+]
+N1_KEY = unwind_import.region_key("Alpha", "North", "N1")
+N2_KEY = unwind_import.region_key("Alpha", "North", "N2")
+C1_KEY = unwind_import.region_key("Alpha", "Capital", "C1")
+
+
+def landmark_key(row):
+    return row["name"], row["latitude"], row["longitude"]
+
+
+class PartitionLandmarksRowsTest(unittest.TestCase):
+    def setUp(self):
+        self.landmarks_rows = unwind_import.parse_landmarks(LANDMARKS_JSON)
+        self.partitions = partition_landmarks_rows(self.landmarks_rows)
+        self.cities_districts = {row["key"]: row["district_key"] for row in self.landmarks_rows["cities"]}
+
+    def partition_district(self, partition):
+        # District of all LOCATED rows and cities of partition, None for partition of unlocated landmarks
+        districts = {
+            self.cities_districts.get(row["region_key"], row["region_key"]) for row in partition["landmarks_located"]
+        }
+        districts.update(row["district_key"] for row in partition["cities"])
+        self.assertLessEqual(len(districts), 1, partition)
+        return districts.pop() if districts else None
+
+    def test_every_row_is_in_one_partition(self):
+        for rows_type, row_key in [
+            ("landmarks", landmark_key),
+            ("cities", lambda row: row["key"]),
+            ("landmarks_located", lambda row: (landmark_key(row), row["region_key"]))
+        ]:
+            with self.subTest(rows_type=rows_type):
+                self.assertEqual(
+                    Counter(row_key(row) for row in self.landmarks_rows[rows_type]),
+                    Counter(row_key(row) for partition in self.partitions for row in partition[rows_type])
+                )
+                self.assertEqual(
+                    len(self.landmarks_rows[rows_type]),
+                    sum(len(partition[rows_type]) for partition in self.partitions)
+                )
+
+    def test_partitions_of_districts(self):
+        partitions_districts = [self.partition_district(partition) for partition in self.partitions]
+        # One partition for every district and one for unlocated landmarks
+        self.assertEqual(sorted([N1_KEY, N2_KEY, C1_KEY]), sorted(filter(None, partitions_districts)))
+        self.assertEqual(len(set(partitions_districts)), len(partitions_districts))
+
+        landmarks_districts = {
+            landmark_key(row)[0]: district
+            for partition, district in zip(self.partitions, partitions_districts)
+            for row in partition["landmarks"]
+        }
+        self.assertEqual(
+            {
+                "Castle": N1_KEY, "Abbey": N1_KEY, "Museum": N1_KEY,
+                "Shared": N2_KEY, "Bridge": N2_KEY, "Tower": C1_KEY, "Lost": None
+            },
+            landmarks_districts
+        )
+        cities_districts = {
+            row["name"]: district
+            for partition, district in zip(self.partitions, partitions_districts)
+            for row in partition["cities"]
+        }
+        self.assertEqual(
+            {"Town A (Alpha, North, N1)": N1_KEY, "Town B (Alpha, North, N1)": N1_KEY}, cities_districts
+        )
+
+    def test_unlocated_partition(self):
+        unlocated_partitions = [
+            partition for partition in self.partitions if self.partition_district(partition) is None
+        ]
+        self.assertEqual(1, len(unlocated_partitions))
+        self.assertEqual(["Lost"], [row["name"] for row in unlocated_partitions[0]["landmarks"]])
+        self.assertEqual([], unlocated_partitions[0]["landmarks_located"])
+        self.assertEqual([], unlocated_partitions[0]["cities"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,109 @@
+# Checks SectorGrid.assign against brute force check of every sector rectangle (the same as point.withinBBox):
+# random overlapping sectors and points on their borders and corners, points outside of every sector
+# and points without coordinates. numpy warnings are errors.
+# Usage: python3 -m unittest discover -s neo4j/tests
+import sys
+import random
+import pathlib
+import unittest
+import warnings
+
+import numpy as np
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+from sector_index import SectorGrid
+
+
+def brute_force_assign(sectors, latitudes, longitudes):
+    pairs = set()
+    for point_index, (latitude, longitude) in enumerate(zip(latitudes, longitudes)):
+        if latitude is None or longitude is None:
+            continue
+        for name, tl_latitude, tl_longitude, br_latitude, br_longitude in sectors:
+            if (
+                min(tl_latitude, br_latitude) <= latitude <= max(tl_latitude, br_latitude) and
+                min(tl_longitude, br_longitude) <= longitude <= max(tl_longitude, br_longitude)
+            ):
+                pairs.add((point_index, name))
+    return pairs
+
+
+def grid_assign(sectors, latitudes, longitudes, cell_size=None):
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        points_indexes, sectors_names = SectorGrid(sectors, cell_size).assign(latitudes, longitudes)
+    return set(zip(points_indexes.tolist(), sectors_names.tolist()))
+
+
+def random_sectors(generator, amount):
+    # Bounds are on 0.25 degree grid, so borders of different sectors coincide and points hit them exactly.
+    # Corners are given in any order, the same as top-left and bottom-right of map_sectors.json may be swapped
+    sectors = []
+    for sector_index in range(amount):
+        latitudes = [generator.randint(0, 40) * 0.25 for _ in range(2)]
+        longitudes = [generator.randint(0, 40) * 0.25 for _ in range(2)]
+        sectors.append((f"sector_{sector_index}", latitudes[0], longitudes[0], latitudes[1], longitudes[1]))
+    return sectors
+
+
+def random_points(generator, sectors, amount):
+    points = []
+    for _ in range(amount):
+        kind = generator.choice(["inside", "border", "corner", "outside", "none"])
+        _, tl_latitude, tl_longitude, br_latitude, br_longitude = generator.choice(sectors)
+        if kind == "inside":
+            points.append((generator.uniform(tl_latitude, br_latitude), generator.uniform(tl_longitude, br_longitude)))
+        elif kind == "border":
+            points.append((generator.choice([tl_latitude, br_latitude]), generator.uniform(tl_longitude, br_longitude)))
+        elif kind == "corner":
+            points.append(
+                (generator.choice([tl_latitude, br_latitude]), generator.choice([tl_longitude, br_longitude]))
+            )
+        elif kind == "outside":
+            points.append((generator.uniform(-5.0, 15.0), generator.choice([-0.5, 10.5])))
+        else:
+            points.append(generator.choice([(None, 1.0), (1.0, None), (None, None)]))
+    return [latitude for latitude, _ in points], [longitude for _, longitude in points]
+
+
+class SectorGridTest(unittest.TestCase):
+    def test_random_sectors(self):
+        generator = random.Random(19)
+        for _ in range(50):
+            sectors = random_sectors(generator, generator.randint(1, 30))
+            latitudes, longitudes = random_points(generator, sectors, 300)
+            expected = brute_force_assign(sectors, latitudes, longitudes)
+            for cell_size in [None, 0.1, 0.25, 3.0, 100.0]:
+                with self.subTest(cell_size=cell_size):
+                    self.assertEqual(expected, grid_assign(sectors, latitudes, longitudes, cell_size))
+
+    def test_borders_and_overlaps(self):
+        sectors = [
+            ("west", 2.0, 0.0, 0.0, 1.0),
+            ("east", 2.0, 1.0, 0.0, 2.0),
+            ("middle", 1.5, 0.5, 0.5, 1.5)  # overlaps both
+        ]
+        latitudes = [1.0, 2.0, 0.0, 1.0, 3.0, None, 1.0]
+        longitudes = [1.0, 2.0, 0.5, 0.25, 1.0, 1.0, None]
+        self.assertEqual(
+            {
+                (0, "west"), (0, "east"), (0, "middle"),  # common border of west and east inside middle
+                (1, "east"),  # corner
+                (2, "west"),  # border of west only
+                (3, "west")
+                # 3.0 is above every sector, points without coordinate are skipped
+            },
+            grid_assign(sectors, latitudes, longitudes)
+        )
+
+    def test_no_points_or_sectors(self):
+        self.assertEqual(set(), grid_assign([], [1.0], [1.0]))
+        self.assertEqual(set(), grid_assign([("sector", 1.0, 0.0, 0.0, 1.0)], [], []))
+        self.assertEqual(set(), grid_assign([("sector", 1.0, 0.0, 0.0, 1.0)], [None], [None]))
+        points_indexes, sectors_names = SectorGrid([("sector", 1.0, 0.0, 0.0, 1.0)]).assign([None], [None])
+        self.assertEqual(np.int64, points_indexes.dtype)
+        self.assertEqual(0, sectors_names.size)
+
+
+if __name__ == "__main__":
+    unittest.main()
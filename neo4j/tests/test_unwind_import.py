@@ -0,0 +1,221 @@
+# Checks rows of unwind_import.py parsers, which must give the same graph as apoc queries of import_kb.py:
+# keys of regions, which landmarks with empty located names are linked with, and deduplication of nodes and
+# relationships, which apoc queries MERGE many times (bordered regions, undirected neighbours, duplicate landmarks).
+# Usage: python3 -m unittest discover -s neo4j/tests
+import sys
+import pathlib
+import unittest
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+import unwind_import
+from bulk_build import build_graph
+
+
+REGIONS_JSON = [
+    {"type": ["country"], "name": "Alpha"},
+    {"type": ["state", "city"], "name": "Capital", "part_of": {"country": "Alpha"}},
+    {"type": ["district"], "name": "C1", "part_of": {"country": "Alpha", "state": "Capital"}},
+    {"type": ["state"], "name": "North", "part_of": {"country": "Alpha"}},
+    {"type": ["district"], "name": "N1", "part_of": {"country": "Alpha", "state": "North"}}
+]
+
+
+def landmark_json(name, coordinate, located):
+    return {
+        "name": name,
+        "category": "Museums",
+        "subcategory": [],
+        "coordinates": {"latitude": coordinate, "longitude": coordinate},
+        "located": {"country": "Alpha", **located},
+        "summary": ""
+    }
+
+
+def parse_graph(landmarks_json):
+    return build_graph(
+        unwind_import.parse_regions(REGIONS_JSON),
+        unwind_import.parse_landmarks(landmarks_json),
+        unwind_import.parse_map_sectors([])
+    )
+
+
+class EmptyLocatedNamesTest(unittest.TestCase):
+    # import_landmarks concatenates located names with '/' and keeps empty ones
+
+    def test_without_state_and_district(self):
+        landmarks_json = [
+            landmark_json("Museum", 1.0, {"state": "", "district": "C1", "city": "Capital"}),
+            landmark_json("Lost", 2.0, {"state": "", "district": "", "city": "Capital"})
+        ]
+        landmarks_rows = unwind_import.parse_landmarks(landmarks_json)
+        self.assertEqual(
+            {"Museum": "alpha/capital/c1", "Lost": "alpha/capital/"},
+            {row["name"]: row["region_key"] for row in landmarks_rows["landmarks_located"]}
+        )
+        self.assertEqual([], landmarks_rows["cities"])
+        # "alpha/capital/" matches nothing, so Lost isn't linked with Capital
+        graph = parse_graph(landmarks_json)
+        self.assertEqual([(0, "C1 (Alpha, Capital)")], graph["landmarks_located"])
+
+    def test_without_city(self):
+        landmarks_json = [
+            landmark_json("Museum", 1.0, {"state": "North", "district": "N1", "city": "Town"}),
+            landmark_json("Nameless", 2.0, {"state": "North", "district": "N1", "city": ""})
+        ]
+        landmarks_rows = unwind_import.parse_landmarks(landmarks_json)
+        # City without name is created with its own key, district key stays unique
+        self.assertEqual(
+            [
+                {"name": "Town (Alpha, North, N1)", "key": "alpha/north/n1/town", "district_key": "alpha/north/n1"},
+                {"name": " (Alpha, North, N1)", "key": "alpha/north/n1/", "district_key": "alpha/north/n1"}
+            ],
+            landmarks_rows["cities"]
+        )
+        graph = parse_graph(landmarks_json)
+        keys = [region["key"] for region in graph["regions"].values()]
+        self.assertEqual(len(set(keys)), len(keys))
+        self.assertEqual("alpha/north/n1", graph["regions"]["N1 (Alpha, North)"]["key"])
+        self.assertEqual(
+            [(0, "Town (Alpha, North, N1)"), (1, " (Alpha, North, N1)")], graph["landmarks_located"]
+        )
+        self.assertIn(("N1 (Alpha, North)", " (Alpha, North, N1)"), graph["includes"])
+
+    def test_absent_name(self):
+        # null name makes the whole concatenated key null, it matches no region
+        landmarks_rows = unwind_import.parse_landmarks([
+            landmark_json("Museum", 1.0, {"state": "North", "district": None, "city": None}),
+            landmark_json("Castle", 2.0, {"state": "North", "district": "N1", "city": None})
+        ])
+        self.assertEqual(2, len(landmarks_rows["landmarks"]))
+        self.assertEqual([], landmarks_rows["cities"])
+        self.assertEqual([], landmarks_rows["landmarks_located"])
+
+
+BORDERED_REGIONS_JSON = [
+    {
+        "type": "country",  # not list type is one label, as apoc.create.addLabels takes it
+        "name": "Alpha",
+        "bordered": [{"type": ["country"], "name": "Beta"}, {"type": ["country"], "name": "Gamma"}, None]
+    },
+    {"type": ["country"], "name": "Beta", "bordered": [{"type": "country", "name": "Alpha"}]},
+    {
+        "type": ["state"],
+        "name": "North",
+        "part_of": {"country": "Alpha"},
+        "bordered": [{"type": "state", "name": "South", "part_of": {"country": "Alpha"}}]
+    },
+    {
+        "type": ["state", "city"],
+        "name": "South",
+        "part_of": {"country": "Alpha"},
+        "bordered": [{"type": ["state"], "name": "North", "part_of": {"country": "Alpha"}}]
+    },
+    {"type": ["district"], "name": "N1", "part_of": {"country": "Alpha", "state": "North"}}
+]
+DUPLICATE_LANDMARKS_JSON = [
+    {
+        "name": "Museum",
+        "category": "Museums",
+        "subcategory": ["Galleries"],
+        "coordinates": {"latitude": 1.0, "longitude": 2.0},
+        "located": {"country": "Alpha", "state": "North", "district": "N1", "city": "Town"},
+        "summary": ""
+    },
+    # The same landmark: coordinates are converted to float as toFloat does, the last main category flag wins
+    {
+        "name": "Museum",
+        "category": "Galleries",
+        "subcategory": "Museums",
+        "coordinates": {"latitude": "1.0", "longitude": "2"},
+        "located": {"country": "Alpha", "state": "North", "district": "N1", "city": "Town"},
+        "summary": ""
+    },
+    # The same landmark in other region
+    {
+        "name": "Museum",
+        "category": "Museums",
+        "subcategory": None,
+        "coordinates": {"latitude": 1.0, "longitude": 2.0},
+        "located": {"country": "Alpha", "state": "North", "district": "", "city": "N1"},
+        "summary": ""
+    },
+    # Other landmark with the same name
+    {
+        "name": "Museum",
+        "category": "Museums",
+        "subcategory": [],
+        "coordinates": {"latitude": 1.5, "longitude": 2.0},
+        "located": {"country": "Alpha", "state": "North", "district": "N1", "city": "Town"},
+        "summary": ""
+    }
+]
+
+
+class DeduplicationTest(unittest.TestCase):
+    def test_regions(self):
+        regions_rows = unwind_import.parse_regions(BORDERED_REGIONS_JSON)
+        labels = {
+            row["name"]: [region_type for region_type in unwind_import.REGION_TYPES_LABELS if row[f"is_{region_type}"]]
+            for row in regions_rows["regions"]
+        }
+        # Every mention of region is one node, labels of all mentions are joined
+        self.assertEqual(
+            {
+                "Alpha": ["country"],
+                "Beta": ["country"],
+                "Gamma": ["country"],
+                "North (Alpha)": ["state"],
+                "South (Alpha)": ["state", "city"],
+                "N1 (Alpha, North)": ["district"]
+            },
+            labels
+        )
+        self.assertEqual(len(labels), len(regions_rows["regions"]))
+        # Alpha - Beta and North - South are mentioned from both sides, but they are one undirected pair
+        self.assertEqual(
+            [
+                {"key": "alpha", "neighbour_key": "beta"},
+                {"key": "alpha", "neighbour_key": "gamma"},
+                {"key": "alpha/north", "neighbour_key": "alpha/south"}
+            ],
+            regions_rows["neighbours"]
+        )
+        self.assertEqual(
+            [
+                {"parent_key": "alpha", "key": "alpha/north"},
+                {"parent_key": "alpha", "key": "alpha/south"},
+                {"parent_key": "alpha/north", "key": "alpha/north/n1"}
+            ],
+            regions_rows["includes"]
+        )
+
+    def test_landmarks(self):
+        landmarks_rows = unwind_import.parse_landmarks(DUPLICATE_LANDMARKS_JSON)
+        self.assertEqual(
+            [
+                {"name": "Museum", "latitude": 1.0, "longitude": 2.0},
+                {"name": "Museum", "latitude": 1.5, "longitude": 2.0}
+            ],
+            landmarks_rows["landmarks"]
+        )
+        self.assertEqual([{"name": "Museums"}, {"name": "Galleries"}], landmarks_rows["categories"])
+        self.assertEqual(
+            [
+                ((1.0, "Museums"), True),  # the third mention sets it main again
+                ((1.0, "Galleries"), True),
+                ((1.5, "Museums"), True)
+            ],
+            [
+                ((row["latitude"], row["category_name"]), row["main_category_flag"])
+                for row in landmarks_rows["landmarks_categories"]
+            ]
+        )
+        self.assertEqual(
+            [(1.0, "alpha/north/n1/town"), (1.0, "alpha/north/n1"), (1.5, "alpha/north/n1/town")],
+            [(row["latitude"], row["region_key"]) for row in landmarks_rows["landmarks_located"]]
+        )
+        self.assertEqual(["Town (Alpha, North, N1)"], [row["name"] for row in landmarks_rows["cities"]])
+
+
+if __name__ == "__main__":
+    unittest.main()
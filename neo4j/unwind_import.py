@@ -0,0 +1,331 @@
+# Import engine, which parses json files in python instead of apoc.load.json.
+# Nodes and edges are deduplicated in memory (every bordered region is mentioned many times in regions.json,
+# NEIGHBOUR_REGION and NEIGHBOUR_SECTOR pairs are undirected) and written as flat rows with static
+# "UNWIND $batch" statements, so every statement is planned once and json files are read by importer itself
+# (they are not needed in import directory of neo4j server).
+# Rows produce the same graph as apoc queries of import_kb.py
+import json
+
+
+IMPORT_WRITE_BATCH_SIZE = 5000  # rows written with one UNWIND query
+REGION_TYPES_LABELS = {"country": "Country", "state": "State", "district": "District", "city": "City"}
+
+
+REGIONS_QUERY = """
+    UNWIND $batch AS row
+    MERGE (region: Region {name: row.name})
+        SET region.key = row.key
+    FOREACH (_ IN CASE WHEN row.is_country THEN [1] ELSE [] END | SET region:Country)
+    FOREACH (_ IN CASE WHEN row.is_state THEN [1] ELSE [] END | SET region:State)
+    FOREACH (_ IN CASE WHEN row.is_district THEN [1] ELSE [] END | SET region:District)
+    FOREACH (_ IN CASE WHEN row.is_city THEN [1] ELSE [] END | SET region:City)
+"""
+NEIGHBOUR_REGIONS_QUERY = """
+    UNWIND $batch AS row
+    MATCH (region: Region {key: row.key})
+    MATCH (neighbour: Region {key: row.neighbour_key})
+    MERGE (region)-[:NEIGHBOUR_REGION]-(neighbour)
+"""
+INCLUDE_REGIONS_QUERY = """
+    UNWIND $batch AS row
+    MATCH (parent: Region {key: row.parent_key})
+    MATCH (region: Region {key: row.key})
+    MERGE (parent)-[:INCLUDE]->(region)
+"""
+COUNTRY_MAP_SECTORS_QUERY = """
+    MATCH (country: Region {key: $country_key})
+    MERGE (country_map_sectors: CountryMapSectors)
+    MERGE (country_map_sectors)<-[:DIVIDED_ON_SECTORS]-(country)
+    RETURN count(country) AS countries_amount
+"""
+MAP_SECTORS_QUERY = """
+    MERGE (country_map_sectors: CountryMapSectors)
+    WITH country_map_sectors
+    UNWIND $batch AS row
+    MERGE (sector: MapSector {name: row.name})
+    MERGE (country_map_sectors)-[:INCLUDE_SECTOR]->(sector)
+    SET
+        sector.tl_latitude = row.tl_latitude,
+        sector.tl_longitude = row.tl_longitude,
+        sector.br_latitude = row.br_latitude,
+        sector.br_longitude = row.br_longitude
+"""
+SECTORS_LANDMARKS_QUERY = """
+    UNWIND $batch AS row
+    MATCH (sector: MapSector {name: row.sector_name})
+    MATCH (landmark: Landmark {latitude: row.latitude, longitude: row.longitude})
+    MERGE (landmark)-[:IN_SECTOR]->(sector)
+"""
+NEIGHBOUR_SECTORS_QUERY = """
+    UNWIND $batch AS row
+    MERGE (sector: MapSector {name: row.name})
+    MERGE (neighbour: MapSector {name: row.neighbour_name})
+    MERGE (sector)-[:NEIGHBOUR_SECTOR]-(neighbour)
+"""
+LANDMARKS_QUERY = """
+    UNWIND $batch AS row
+    MERGE (landmark: Landmark {name: row.name, latitude: row.latitude, longitude: row.longitude})
+    SET landmark.location = point({latitude: row.latitude, longitude: row.longitude, crs: 'WGS-84'})
+"""
+LANDMARK_CATEGORIES_QUERY = """
+    UNWIND $batch AS row
+    MERGE (category: LandmarkCategory {name: row.name})
+"""
+LANDMARKS_CATEGORIES_QUERY = """
+    UNWIND $batch AS row
+    MATCH (landmark: Landmark {name: row.name, latitude: row.latitude, longitude: row.longitude})
+    MATCH (category: LandmarkCategory {name: row.category_name})
+    MERGE (landmark)-[refer:REFERS]->(category)
+        SET refer.main_category_flag = row.main_category_flag
+"""
+CITIES_QUERY = """
+    UNWIND $batch AS row
+    MATCH (district: Region {key: row.district_key})
+    MERGE (city: Region {name: row.name})
+        ON CREATE SET city:City
+    SET city.key = row.key
+    MERGE (district)-[:INCLUDE]->(city)
+"""
+LANDMARKS_LOCATED_QUERY = """
+    UNWIND $batch AS row
+    MATCH (landmark: Landmark {name: row.name, latitude: row.latitude, longitude: row.longitude})
+    MATCH (region: Region {key: row.region_key})
+    MERGE (landmark)-[:LOCATED]->(region)
+"""
+
+
+def region_key(*names):
+    # Canonical key of region: normalised names of parent chain and region joined with "/"
+    # (e.g. "беларусь/брэсцкая вобласць/баранавіцкі раён"). Regions are looked up by exact key.
+    # import_regions of import_kb.py builds the same key with
+    # apoc.text.join([... WHERE name IS NOT null AND name <> '' | toLower(trim(name))], '/')
+    return "/".join(name.strip().lower() for name in names if name)
+
+
+def located_region_key(*names):
+    # Key of region, which landmark is located in. import_landmarks of import_kb.py concatenates
+    # toLower(trim(name)) + '/' + ... without skipping empty names, so key with empty name matches no region
+    # (e.g. "беларусь/мінск/" of landmark without district) and absent name makes the whole key null
+    if any(name is None for name in names):
+        return None
+    return "/".join(name.strip().lower() for name in names)
+
+
+def as_list(value):
+    # The same as UNWIND: null is nothing, not list value is list of one element
+    if value is None:
+        return []
+    if isinstance(value, list):
+        return value
+    return [value]
+
+
+def load_json(filename):
+    with open(filename, "r", encoding="utf-8") as json_file:
+        return json.load(json_file)
+
+
+def undirected_pair(first, second):
+    return (first, second) if first <= second else (second, first)
+
+
+def parse_regions(regions_json):
+    # Returns {"regions": [...], "neighbours": [...], "includes": [...]}
+    regions = {}  # name -> row, labels of all mentions of region are joined
+    neighbours = set()
+    includes = {}  # (parent key, key) -> None, dict keeps order of the first mention
+
+    def mention_region(region_json):
+        part_of = region_json.get("part_of") or {}
+        country, state = part_of.get("country"), part_of.get("state")
+        if not country:
+            name = region_json["name"]
+        elif not state:
+            name = f"{region_json['name']} ({country})"
+        else:
+            name = f"{region_json['name']} ({country}, {state})"
+        key = region_key(country, state, region_json["name"])
+        row = regions.setdefault(
+            name,
+            {"name": name, "key": key, "is_country": False, "is_state": False, "is_district": False, "is_city": False}
+        )
+        row["key"] = key
+        for region_type in as_list(region_json.get("type")):
+            if region_type in REGION_TYPES_LABELS:
+                row[f"is_{region_type}"] = True
+
+        # country -[:INCLUDE]-> state -[:INCLUDE]-> district
+        if country and state:
+            includes[(region_key(country), region_key(country, state))] = None
+            includes[(region_key(country, state), key)] = None
+        elif country:
+            includes[(region_key(country), key)] = None
+        return key
+
+    for region_json in regions_json:
+        key = mention_region(region_json)
+        for bordered_region_json in as_list(region_json.get("bordered")):
+            if bordered_region_json is None:
+                continue
+            bordered_key = mention_region(bordered_region_json)
+            neighbours.add(undirected_pair(key, bordered_key))
+
+    return {
+        "regions": list(regions.values()),
+        "neighbours": [{"key": key, "neighbour_key": neighbour_key} for key, neighbour_key in sorted(neighbours)],
+        "includes": [{"parent_key": parent_key, "key": key} for parent_key, key in includes]
+    }
+
+
+def parse_landmarks(landmarks_json):
+    # Returns {"landmarks": [...], "categories": [...], "landmarks_categories": [...],
+    # "cities": [...], "landmarks_located": [...]}
+    landmarks = {}  # (name, latitude, longitude) -> row
+    categories = {}
+    landmarks_categories = {}  # (landmark, category) -> row, the last flag wins as in sequential import
+    cities = {}
+    landmarks_located = {}
+
+    for landmark_json in landmarks_json:
+        landmark = {
+            "name": landmark_json["name"],
+            "latitude": float(landmark_json["coordinates"]["latitude"]),
+            "longitude": float(landmark_json["coordinates"]["longitude"])
+        }
+        landmark_key = (landmark["name"], landmark["latitude"], landmark["longitude"])
+        landmarks[landmark_key] = landmark
+
+        categories_flags = [(landmark_json["category"], True)]
+        categories_flags.extend(
+            (subcategory, False) for subcategory in as_list(landmark_json.get("subcategory"))
+            if subcategory is not None
+        )
+        for category_name, main_category_flag in categories_flags:
+            categories[category_name] = {"name": category_name}
+            landmarks_categories[(landmark_key, category_name)] = {
+                **landmark, "category_name": category_name, "main_category_flag": main_category_flag
+            }
+
+        located = landmark_json["located"]
+        if not located.get("state"):
+            # Located in Minks and other cities of republican subordination
+            region_key_of_landmark = located_region_key(located["country"], located["city"], located["district"])
+        elif not located.get("district"):
+            # Located in district or in city of state subordination
+            region_key_of_landmark = located_region_key(located["country"], located["state"], located["city"])
+        else:
+            # Located in city, which is created by import. City without name gets its own key
+            # (district key with trailing "/"), as import_landmarks creates it
+            city_name = f"{located['city']} ({located['country']}, {located['state']}, {located['district']})"
+            region_key_of_landmark = located_region_key(
+                located["country"], located["state"], located["district"], located["city"]
+            )
+            if region_key_of_landmark is not None:
+                cities[city_name] = {
+                    "name": city_name,
+                    "key": region_key_of_landmark,
+                    "district_key": located_region_key(located["country"], located["state"], located["district"])
+                }
+        if region_key_of_landmark is not None:  # null key matches no region
+            landmarks_located[(landmark_key, region_key_of_landmark)] = {
+                **landmark, "region_key": region_key_of_landmark
+            }
+
+    return {
+        "landmarks": list(landmarks.values()),
+        "categories": list(categories.values()),
+        "landmarks_categories": list(landmarks_categories.values()),
+        "cities": list(cities.values()),
+        "landmarks_located": list(landmarks_located.values())
+    }
+
+
+def parse_map_sectors(map_sectors_json):
+    # Returns {"sectors": [...], "sectors_landmarks": [...], "neighbours": [...]}
+    sectors = {}
+    sectors_landmarks = {}
+    neighbours = set()
+
+    for sector_json in map_sectors_json:
+        sectors[sector_json["name"]] = {
+            "name": sector_json["name"],
+            "tl_latitude": float(sector_json["TL"]["latitude"]),
+            "tl_longitude": float(sector_json["TL"]["longitude"]),
+            "br_latitude": float(sector_json["BR"]["latitude"]),
+            "br_longitude": float(sector_json["BR"]["longitude"])
+        }
+        for coordinates in as_list(sector_json.get("coordinates")):
+            if coordinates is None:
+                continue
+            row = {
+                "sector_name": sector_json["name"],
+                "latitude": float(coordinates["latitude"]),
+                "longitude": float(coordinates["longitude"])
+            }
+            sectors_landmarks[(row["sector_name"], row["latitude"], row["longitude"])] = row
+        for neighbour_name in as_list(sector_json.get("neighbours")):
+            if neighbour_name is not None:
+                neighbours.add(undirected_pair(sector_json["name"], neighbour_name))
+
+    return {
+        "sectors": list(sectors.values()),
+        "sectors_landmarks": list(sectors_landmarks.values()),
+        "neighbours": [{"name": name, "neighbour_name": neighbour_name} for name, neighbour_name in sorted(neighbours)]
+    }
+
+
+def write_batches(session, query, rows, batch_size=IMPORT_WRITE_BATCH_SIZE):
+    # Every batch is written in its own transaction. Returns summaries of batches
+    return [
+        session.run(query, batch=rows[rows_start: rows_start + batch_size]).consume()
+        for rows_start in range(0, len(rows), batch_size)
+    ]
+
+
+def write_batches_retrying(session, query, rows, batch_size=IMPORT_WRITE_BATCH_SIZE):
+    # Every batch is written with managed transaction, so transient errors of concurrent writes
+    # (e.g. DeadlockDetected) are retried by driver. Returns summaries of batches
+    return [
+        session.execute_write(
+            lambda tx, batch: tx.run(query, batch=batch).consume(), rows[rows_start: rows_start + batch_size]
+        )
+        for rows_start in range(0, len(rows), batch_size)
+    ]
+
+
+def import_regions(driver, regions_rows):
+    with driver.session() as session:
+        summaries = write_batches(session, REGIONS_QUERY, regions_rows["regions"])
+        summaries.extend(write_batches(session, NEIGHBOUR_REGIONS_QUERY, regions_rows["neighbours"]))
+    return summaries
+
+
+def import_regions_hierarchy(driver, regions_rows):
+    with driver.session() as session:
+        return write_batches(session, INCLUDE_REGIONS_QUERY, regions_rows["includes"])
+
+
+def import_map_sectors(driver, map_sectors_rows, country_key):
+    # Sectors are imported only if country exists (as in apoc import)
+    with driver.session() as session:
+        result = session.run(COUNTRY_MAP_SECTORS_QUERY, country_key=country_key)
+        countries_amount = result.single()["countries_amount"]
+        summaries = [result.consume()]
+        if not countries_amount:
+            return summaries
+        summaries.extend(write_batches(session, MAP_SECTORS_QUERY, map_sectors_rows["sectors"]))
+        summaries.extend(write_batches(session, SECTORS_LANDMARKS_QUERY, map_sectors_rows["sectors_landmarks"]))
+        summaries.extend(write_batches(session, NEIGHBOUR_SECTORS_QUERY, map_sectors_rows["neighbours"]))
+    return summaries
+
+
+def import_landmarks(driver, landmarks_rows):
+    with driver.session() as session:
+        summaries = write_batches(session, LANDMARKS_QUERY, landmarks_rows["landmarks"])
+        summaries.extend(write_batches(session, LANDMARK_CATEGORIES_QUERY, landmarks_rows["categories"]))
+        summaries.extend(
+            write_batches(session, LANDMARKS_CATEGORIES_QUERY, landmarks_rows["landmarks_categories"])
+        )
+        summaries.extend(write_batches(session, CITIES_QUERY, landmarks_rows["cities"]))
+        summaries.extend(write_batches(session, LANDMARKS_LOCATED_QUERY, landmarks_rows["landmarks_located"]))
+    return summaries
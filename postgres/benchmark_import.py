@@ -0,0 +1,397 @@
+# Benchmark of embedding import stages on synthetic (or given) landmarks json.
+# Stages are timed one after another on the same landmarks: json load, tokenization, inference,
+# neo4j resolution and postgres write. Without connection args database stages run against in-process stand-ins,
+# which execute the same code of import_db.py, but keep the data in memory (no network and no database work).
+# Results of every run are appended to output_path, so runs can be compared.
+# Usage: python3 postgres/benchmark_import.py landmarks_amount=5000 summary_words_median=60
+import sys
+import os
+import json
+import math
+import random
+import resource
+import tempfile
+import threading
+import time
+import types
+import datetime
+import platform
+import sqlalchemy
+import neo4j
+
+from embedding_settings import MODEL_NAME, DEFAULT_BATCH_SIZE, INFERENCE_BACKENDS, DEFAULT_ONNX_MODEL_PATH
+from import_db import (
+    iterate_json_array, iterate_batches, find_landmarks_in_neo4j, write_landmarks_batch, create_postgres_scheme,
+    json_landmark_key, WRITE_MODES, DEFAULT_PIPELINE_BATCH_SIZE
+)
+
+
+POSTGRES_ARGS = ["postgres_host", "postgres_port", "postgres_user", "postgres_password"]
+NEO4J_ARGS = ["neo4j_host", "neo4j_port", "neo4j_user", "neo4j_password"]
+SUMMARY_LENGTH_DISTRIBUTIONS = ["lognormal", "uniform", "fixed"]
+OPTIONAL_ARGS = {
+    "json_path": "",  # landmarks json to benchmark on, synthetic landmarks are generated, if empty
+    "landmarks_amount": "1000",  # amount of synthetic landmarks
+    "summary_length_distribution": "lognormal",  # distribution of amount of words in synthetic summaries
+    "summary_words_median": "40",  # median of words in synthetic summary (landmarks.json has about 36)
+    "summary_words_max": "2000",
+    "seed": "0",
+    "output_path": "benchmark_results.json",  # list of runs, the result of this run is appended
+    "batch_size": str(DEFAULT_BATCH_SIZE),
+    "pipeline_batch_size": str(DEFAULT_PIPELINE_BATCH_SIZE),
+    "model_store_dir": "",
+    "inference_backend": "eager",
+    "onnx_model_path": DEFAULT_ONNX_MODEL_PATH,
+    "write_mode": "copy",
+    # Real databases are used, if all their args are given. Benchmark writes synthetic landmarks to postgres,
+    # so use disposable database
+    **{arg: "" for arg in POSTGRES_ARGS + NEO4J_ARGS}
+}
+LOGNORMAL_SIGMA = 0.8
+RSS_SAMPLING_INTERVAL = 0.01  # seconds between samples of resident memory during stage
+SYNTHETIC_WORDS = [
+    "музей", "церковь", "костёл", "замок", "усадьба", "парк", "памятник", "площадь", "улица", "река", "озеро",
+    "город", "деревня", "век", "года", "построен", "архитектура", "барокко", "готика", "классицизм", "история",
+    "памятник", "архитектуры", "расположен", "центре", "берегу", "в", "на", "и", "с", "по", "из", "был", "была",
+    "восстановлен", "разрушен", "войны", "культуры", "наследия", "Беларуси", "Минска", "Гродно", "Бреста",
+    "Витебска", "Гомеля", "Могилёва", "князя", "Радзивиллов", "Сапегов", "коллекция", "экспозиция", "выставка",
+    "каменный", "деревянный", "старинный", "известный", "главный", "фасад", "башня", "колокольня", "алтарь"
+]
+
+
+def generate_summary(words_amount, rng):
+    words = [rng.choice(SYNTHETIC_WORDS) for _ in range(words_amount)]
+    words[0] = words[0].capitalize()
+    return " ".join(words) + "."
+
+
+def generate_summary_words_amount(distribution, median_words, max_words, rng):
+    if distribution == "fixed":
+        words_amount = median_words
+    elif distribution == "uniform":
+        words_amount = rng.randint(1, 2 * median_words)
+    else:
+        words_amount = round(rng.lognormvariate(math.log(median_words), LOGNORMAL_SIGMA))
+    return min(max(words_amount, 1), max_words)
+
+
+def generate_synthetic_landmarks(
+    json_path, landmarks_amount, distribution="lognormal", median_words=40, max_words=2000, seed=0
+):
+    # Landmarks are written in the format of landmarks.json one by one, so huge files are generated in constant memory
+    rng = random.Random(seed)
+    with open(json_path, "w", encoding="utf-8") as json_file:
+        json_file.write("[")
+        for landmark_index in range(landmarks_amount):
+            if landmark_index:
+                json_file.write(",\n")
+            json.dump(
+                {
+                    "name": f"Синтетическая достопримечательность {landmark_index}",
+                    "category": "Синтетические достопримечательности",
+                    "subcategory": [],
+                    "coordinates": {
+                        "latitude": round(rng.uniform(51.3, 56.1), 5),
+                        "longitude": round(rng.uniform(23.2, 32.7), 5)
+                    },
+                    "located": {"country": "Беларусь", "state": "", "district": "", "city": ""},
+                    "summary": generate_summary(
+                        generate_summary_words_amount(distribution, median_words, max_words, rng), rng
+                    )
+                },
+                json_file,
+                ensure_ascii=False
+            )
+        json_file.write("]")
+
+
+class Neo4jStandIn:
+    # Answers resolution queries of find_landmarks_in_neo4j as if every landmark were stored in neo4j
+
+    def execute_query(self, query, landmarks):
+        return types.SimpleNamespace(
+            records=[
+                {
+                    "json_name": landmark["name"],
+                    "json_latitude": landmark["latitude"],
+                    "json_longitude": landmark["longitude"],
+                    "landmark_name": landmark["name"],
+                    "landmark_latitude": landmark["latitude"],
+                    "landmark_longitude": landmark["longitude"]
+                }
+                for landmark in landmarks
+            ]
+        )
+
+
+class PostgresStandIn:
+    # Transaction for write_landmarks_batch: statements are skipped, COPY data is read and counted
+
+    def __init__(self):
+        self.copied_bytes = 0
+        self.executed_statements = 0
+        self.connection = self
+
+    def execute(self, statement, parameters=None):
+        self.executed_statements += 1
+
+    def cursor(self):
+        return self
+
+    def copy_expert(self, sql, file):
+        self.copied_bytes += len(file.read().encode("utf-8"))
+
+    def close(self):
+        pass
+
+    def commit(self):
+        pass
+
+
+def peak_rss_mb():
+    # Peak of the whole process since its start, ru_maxrss is in kilobytes on linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def current_rss_mb():
+    # Current resident memory of process (VmRSS), None if /proc is not available
+    try:
+        with open("/proc/self/status", "r") as status_file:
+            for line in status_file:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+class RssSampler:
+    # Samples current resident memory in background thread, while stage runs. Peak of samples belongs to the stage,
+    # unlike ru_maxrss, which never decreases and repeats peak of the heaviest previous stage
+
+    def __init__(self, interval=RSS_SAMPLING_INTERVAL):
+        self.interval = interval
+        self.peak_mb = None
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._sample, name="rss-sampler", daemon=True)
+
+    def _update_peak(self):
+        rss_mb = current_rss_mb()
+        if rss_mb is not None and (self.peak_mb is None or rss_mb > self.peak_mb):
+            self.peak_mb = rss_mb
+
+    def _sample(self):
+        while not self._stopped.wait(self.interval):
+            self._update_peak()
+
+    def start(self):
+        self._update_peak()
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+        self._update_peak()
+        return self.peak_mb
+
+
+def run_benchmark(args, json_path, postgres_engine=None, neo4j_driver=None):
+    import torch
+    from transformers import BertTokenizerFast
+    from embedding_engine import tokenize_summaries, embed_chunks, gather_summaries_embeddings, define_torch_device
+    from inference_backends import load_inference_model
+
+    stages = {}
+    rss_sampler = None
+
+    def start_stage():
+        nonlocal rss_sampler
+        rss_sampler = RssSampler().start()
+        return time.perf_counter()
+
+    def finish_stage(stage_name, started, landmarks_amount):
+        seconds = time.perf_counter() - started
+        stage_peak_rss_mb = rss_sampler.stop()
+        stages[stage_name] = {
+            "seconds": round(seconds, 4),
+            "landmarks_per_second": round(landmarks_amount / seconds, 2) if seconds > 0 else None,
+            "stage_peak_rss_mb": round(stage_peak_rss_mb, 1) if stage_peak_rss_mb is not None else None,
+            "process_peak_rss_mb": round(peak_rss_mb(), 1)
+        }
+        print(f"{stage_name}: {seconds:.3f} s", flush=True)
+
+    started = start_stage()
+    json_landmarks = list(iterate_json_array(json_path))
+    finish_stage("json_load", started, len(json_landmarks))
+    batches = list(iterate_batches(json_landmarks, args['pipeline_batch_size']))
+
+    started = start_stage()
+    model_source = args['model_store_dir'] or MODEL_NAME
+    device = define_torch_device() if args['inference_backend'] == "eager" else torch.device("cpu")
+    tokenizer = BertTokenizerFast.from_pretrained(model_source)
+    model = load_inference_model(model_source, args['inference_backend'], device, args['onnx_model_path'])
+    finish_stage("model_load", started, len(json_landmarks))
+
+    started = start_stage()
+    tokenized_batches = [
+        tokenize_summaries([json_landmark["summary"] for json_landmark in batch], tokenizer) for batch in batches
+    ]
+    finish_stage("tokenization", started, len(json_landmarks))
+    chunks_amount = sum(len(chunks) for chunks, _ in tokenized_batches)
+    tokens_amount = sum(len(chunk) for chunks, _ in tokenized_batches for chunk in chunks)
+
+    started = start_stage()
+    embeddings_batches = [
+        gather_summaries_embeddings(
+            embed_chunks(chunks, model, device, tokenizer.pad_token_id, args['batch_size']), chunks_owners, len(batch)
+        )
+        for batch, (chunks, chunks_owners) in zip(batches, tokenized_batches)
+    ]
+    finish_stage("inference", started, len(json_landmarks))
+
+    started = start_stage()
+    resolver = neo4j_driver if neo4j_driver is not None else Neo4jStandIn()
+    found_batches = []
+    resolved_amount = 0
+    for batch, embeddings in zip(batches, embeddings_batches):
+        found_landmarks, _ = find_landmarks_in_neo4j(resolver, batch)
+        resolved_amount += len(found_landmarks)
+        # Landmarks, absent in real neo4j (e.g. synthetic ones), are written with their json keys,
+        # so write stage always processes all landmarks
+        found_batches.append([
+            (
+                json_landmark,
+                found_landmarks.get(json_landmark_key(json_landmark)) or dict(zip(
+                    ["landmark_name", "landmark_latitude", "landmark_longitude"], json_landmark_key(json_landmark)
+                )),
+                embedding
+            )
+            for json_landmark, embedding in zip(batch, embeddings)
+        ])
+    finish_stage("neo4j_resolution", started, len(json_landmarks))
+
+    started = start_stage()
+    copied_bytes = None
+    if postgres_engine is not None:
+        create_postgres_scheme(postgres_engine)
+        with postgres_engine.connect() as connection:
+            for found_batch in found_batches:
+                write_landmarks_batch(connection, found_batch, args['write_mode'])
+            connection.commit()
+    else:
+        postgres_stand_in = PostgresStandIn()
+        for found_batch in found_batches:
+            write_landmarks_batch(postgres_stand_in, found_batch, args['write_mode'])
+        copied_bytes = postgres_stand_in.copied_bytes
+    finish_stage("postgres_write", started, len(json_landmarks))
+
+    total_seconds = sum(stage["seconds"] for stage_name, stage in stages.items() if stage_name != "model_load")
+    return {
+        "landmarks": len(json_landmarks),
+        "chunks": chunks_amount,
+        "tokens": tokens_amount,
+        "resolved_in_neo4j": resolved_amount,
+        "copied_bytes": copied_bytes,
+        "stages": stages,
+        "total_seconds": round(total_seconds, 4),  # without model_load
+        "landmarks_per_second": round(len(json_landmarks) / total_seconds, 2) if total_seconds > 0 else None,
+        "process_peak_rss_mb": round(peak_rss_mb(), 1)
+    }
+
+
+def save_benchmark_result(output_path, result):
+    results = []
+    if os.path.isfile(output_path):
+        with open(output_path, "r", encoding="utf-8") as output_file:
+            results = json.load(output_file)
+    results.append(result)
+    with open(output_path + ".tmp", "w", encoding="utf-8") as output_file:
+        json.dump(results, output_file, ensure_ascii=False, indent=2)
+    os.replace(output_path + ".tmp", output_path)
+
+
+def parse_args():
+    args = dict(OPTIONAL_ARGS)
+    for arg in sys.argv[1:]:
+        arg_pair = arg.split("=")
+        if len(arg_pair) != 2:
+            raise AttributeError(f"Invalid argument \"{arg}\".")
+        if arg_pair[0].strip() not in OPTIONAL_ARGS:
+            raise AttributeError(f"Invalid argument: \"{arg_pair[0]}\".")
+        args[arg_pair[0].strip()] = arg_pair[1].strip()
+    for arg in [
+        "landmarks_amount", "summary_words_median", "summary_words_max", "seed", "batch_size", "pipeline_batch_size"
+    ]:
+        try:
+            args[arg] = int(args[arg])
+        except ValueError:
+            raise AttributeError(f"Argument {arg} must be integer.")
+    for arg in ["landmarks_amount", "summary_words_median", "summary_words_max", "batch_size", "pipeline_batch_size"]:
+        if args[arg] < 1:
+            raise AttributeError(f"Argument {arg} must be positive.")
+    if args["summary_length_distribution"] not in SUMMARY_LENGTH_DISTRIBUTIONS:
+        raise AttributeError(
+            f"Available values for summary_length_distribution are: {', '.join(SUMMARY_LENGTH_DISTRIBUTIONS)}."
+        )
+    if args["inference_backend"] not in INFERENCE_BACKENDS:
+        raise AttributeError(f"Available values for inference_backend are: {', '.join(INFERENCE_BACKENDS)}.")
+    if args["write_mode"] not in WRITE_MODES:
+        raise AttributeError(f"Available values for write_mode are: {', '.join(WRITE_MODES)}.")
+    for database_args in [POSTGRES_ARGS, NEO4J_ARGS]:
+        given_args = [arg for arg in database_args if args[arg]]
+        if given_args and len(given_args) != len(database_args):
+            raise AttributeError(f"Arguments {', '.join(database_args)} must be given together.")
+    if args["json_path"] and not os.path.isfile(args["json_path"]):
+        raise AttributeError(f"File \"{args['json_path']}\" doesn't exist.")
+    return args
+
+
+def main():
+    args = parse_args()
+
+    postgres_engine = None
+    if args['postgres_host']:
+        postgres_engine = sqlalchemy.create_engine(
+            f"postgresql://{args['postgres_user']}:{args['postgres_password']}@{args['postgres_host']}:{args['postgres_port']}/postgres"
+        )
+    neo4j_driver = None
+    if args['neo4j_host']:
+        neo4j_driver = neo4j.GraphDatabase.driver(
+            f"bolt://{args['neo4j_host']}:{args['neo4j_port']}", auth=(args['neo4j_user'], args['neo4j_password'])
+        )
+
+    with tempfile.TemporaryDirectory() as temporary_dir:
+        json_path = args['json_path']
+        if not json_path:
+            json_path = os.path.join(temporary_dir, "synthetic_landmarks.json")
+            print(f"Generating {args['landmarks_amount']} synthetic landmarks...", flush=True)
+            generate_synthetic_landmarks(
+                json_path, args['landmarks_amount'], args['summary_length_distribution'],
+                args['summary_words_median'], args['summary_words_max'], args['seed']
+            )
+        result = {
+            "started_at": datetime.datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "cpu_count": os.cpu_count(),
+            "config": {
+                arg: value for arg, value in args.items()
+                if arg not in POSTGRES_ARGS + NEO4J_ARGS and arg != "output_path"
+            },
+            "postgres": "real" if postgres_engine is not None else "stand-in",
+            "neo4j": "real" if neo4j_driver is not None else "stand-in",
+            **run_benchmark(args, json_path, postgres_engine, neo4j_driver)
+        }
+
+    if neo4j_driver is not None:
+        neo4j_driver.close()
+    save_benchmark_result(args['output_path'], result)
+    print(
+        f"{result['landmarks']} landmarks, {result['landmarks_per_second']} landmarks/s, "
+        f"peak RSS {result['process_peak_rss_mb']} MB. Results are saved to \"{args['output_path']}\".",
+        flush=True
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+import array
+import hashlib
+import os
+import sqlite3
+import time
+
+from embedding_settings import MAX_CHUNK_LENGTH, CHUNK_STRIDE
+
+
+# Changing of pooling or chunking must change cache keys, so previously cached embeddings are not used
+POOLING_NAME = "masked_mean_of_chunks"
+DEFAULT_CACHE_MAX_SIZE_MB = 512
+
+
+def embedding_cache_key(model_name, summary, max_length=MAX_CHUNK_LENGTH, stride=CHUNK_STRIDE):
+    key_hash = hashlib.sha256()
+    for key_part in (model_name, str(max_length), str(stride), POOLING_NAME):
+        key_hash.update(key_part.encode("utf-8"))
+        key_hash.update(b"\0")
+    key_hash.update(hashlib.sha256(summary.encode("utf-8")).digest())
+    return key_hash.hexdigest()
+
+
+class EmbeddingCache:
+    # On disk cache of embeddings (sqlite file). Least recently used entries are evicted,
+    # when size of stored embeddings exceeds max_size_bytes
+
+    def __init__(self, path, model_name, max_size_bytes=DEFAULT_CACHE_MAX_SIZE_MB * 1024 * 1024):
+        # model_name must identify the model, which computes embeddings (including inference backend)
+        self.path = path
+        self.model_name = model_name
+        self.max_size_bytes = max_size_bytes
+        cache_dir = os.path.dirname(os.path.abspath(path))
+        os.makedirs(cache_dir, exist_ok=True)
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL;")
+        self._connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS embeddings(
+                key         TEXT PRIMARY KEY,
+                embedding   BLOB NOT NULL,
+                size        INTEGER NOT NULL,
+                last_access REAL NOT NULL
+            );
+            """
+        )
+        self._connection.execute("CREATE INDEX IF NOT EXISTS embeddings_last_access ON embeddings(last_access);")
+        self._connection.commit()
+
+    def key(self, summary):
+        return embedding_cache_key(self.model_name, summary)
+
+    def get_many(self, keys):
+        # Returns dict {key: embedding} for keys, that are cached
+        found = {}
+        keys = list(set(keys))
+        for keys_start in range(0, len(keys), 500):
+            keys_part = keys[keys_start: keys_start + 500]
+            rows = self._connection.execute(
+                f"SELECT key, embedding FROM embeddings WHERE key IN ({', '.join('?' * len(keys_part))});",
+                keys_part
+            ).fetchall()
+            for key, blob in rows:
+                embedding = array.array("f")
+                embedding.frombytes(blob)
+                found[key] = embedding.tolist()
+        if found:
+            now = time.time()
+            self._connection.executemany(
+                "UPDATE embeddings SET last_access = ? WHERE key = ?;", ((now, key) for key in found.keys())
+            )
+            self._connection.commit()
+        return found
+
+    def put_many(self, keys_embeddings):
+        now = time.time()
+        rows = []
+        for key, embedding in keys_embeddings:
+            blob = array.array("f", embedding).tobytes()
+            rows.append((key, blob, len(blob), now))
+        if not rows:
+            return
+        self._connection.executemany(
+            "INSERT OR REPLACE INTO embeddings(key, embedding, size, last_access) VALUES (?, ?, ?, ?);", rows
+        )
+        self._connection.commit()
+        self.evict()
+
+    def size(self):
+        return self._connection.execute("SELECT COALESCE(SUM(size), 0) FROM embeddings;").fetchone()[0]
+
+    def evict(self):
+        overflow = self.size() - self.max_size_bytes
+        if overflow <= 0:
+            return
+        evicted_keys = []
+        for key, size in self._connection.execute("SELECT key, size FROM embeddings ORDER BY last_access ASC;"):
+            if overflow <= 0:
+                break
+            evicted_keys.append((key,))
+            overflow -= size
+        self._connection.executemany("DELETE FROM embeddings WHERE key = ?;", evicted_keys)
+        self._connection.commit()
+
+    def close(self):
+        self._connection.close()
@@ -0,0 +1,150 @@
+import os
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import torch
+from transformers import BertTokenizerFast
+
+from embedding_settings import MAX_CHUNK_LENGTH, CHUNK_STRIDE, DEFAULT_BATCH_SIZE
+
+
+def define_torch_device():
+    if torch.cuda.is_available():
+        print("Running on GPU")
+        return torch.device("cuda:0")
+    else:
+        print("Running on CPU")
+        return torch.device("cpu")
+
+
+def tokenize_summaries(summaries, tokenizer, max_length=MAX_CHUNK_LENGTH, stride=CHUNK_STRIDE):
+    # Summaries are tokenized without padding, long summaries are split on overlapping chunks.
+    # Returns list of chunks (list of token ids) and list of indexes of summaries, chunks belong to
+    tokenized_summaries = tokenizer(
+        list(summaries),
+        padding=False, truncation=True,
+        max_length=max_length, stride=stride,
+        return_overflowing_tokens=True,
+        return_attention_mask=False, return_token_type_ids=False
+    )
+    return tokenized_summaries["input_ids"], tokenized_summaries["overflow_to_sample_mapping"]
+
+
+def iterate_length_buckets(chunks, batch_size):
+    # Chunks of close length are put in one batch, so batch is padded only to the longest chunk of the bucket
+    chunks_order = sorted(range(len(chunks)), key=lambda chunk_index: len(chunks[chunk_index]), reverse=True)
+    for batch_start in range(0, len(chunks_order), batch_size):
+        yield chunks_order[batch_start: batch_start + batch_size]
+
+
+def pad_batch(batch_chunks, pad_token_id, device):
+    batch_length = max(len(chunk) for chunk in batch_chunks)
+    input_ids = torch.full((len(batch_chunks), batch_length), pad_token_id, dtype=torch.int32)
+    attention_mask = torch.zeros((len(batch_chunks), batch_length), dtype=torch.int32)
+    for row, chunk in enumerate(batch_chunks):
+        input_ids[row, :len(chunk)] = torch.tensor(chunk, dtype=torch.int32)
+        attention_mask[row, :len(chunk)] = 1
+    return input_ids.to(device), attention_mask.to(device)
+
+
+def embed_chunks(chunks, model, device, pad_token_id, batch_size=DEFAULT_BATCH_SIZE):
+    # Returns tensor (chunks_amount, hidden_size) on cpu, rows are in the order of chunks
+    chunks_embeddings = None
+    with torch.no_grad():
+        for batch_indexes in iterate_length_buckets(chunks, batch_size):
+            input_ids, attention_mask = pad_batch([chunks[i] for i in batch_indexes], pad_token_id, device)
+            last_hidden_state = model(input_ids=input_ids, attention_mask=attention_mask).last_hidden_state
+
+            # mean of last hidden state of model (padding tokens are excluded) is used as chunk embedding
+            mask = attention_mask.unsqueeze(-1).type(last_hidden_state.dtype)
+            batch_embeddings = (last_hidden_state * mask).sum(dim=1) / mask.sum(dim=1)
+
+            if chunks_embeddings is None:
+                chunks_embeddings = torch.empty((len(chunks), batch_embeddings.shape[1]), dtype=torch.float32)
+            chunks_embeddings[batch_indexes] = batch_embeddings.detach().cpu().type(torch.float32)
+    return chunks_embeddings
+
+
+def gather_summaries_embeddings(chunks_embeddings, chunks_owners, summaries_amount):
+    # Embedding of summary is mean of embeddings of its chunks
+    owners = torch.tensor(chunks_owners, dtype=torch.int64)
+    sums = torch.zeros((summaries_amount, chunks_embeddings.shape[1]), dtype=torch.float32)
+    sums.index_add_(0, owners, chunks_embeddings)
+    counts = torch.bincount(owners, minlength=summaries_amount).clamp(min=1).unsqueeze(-1)
+    return (sums / counts).tolist()
+
+
+def find_summaries_embeddings(summaries, tokenizer, model, device, batch_size=DEFAULT_BATCH_SIZE):
+    summaries = list(summaries)
+    if not summaries:
+        return []
+    chunks, chunks_owners = tokenize_summaries(summaries, tokenizer)
+    chunks_embeddings = embed_chunks(chunks, model, device, tokenizer.pad_token_id, batch_size)
+    return gather_summaries_embeddings(chunks_embeddings, chunks_owners, len(summaries))
+
+
+# State of embedding worker process (model is loaded once per process in init_embedding_worker)
+_worker_tokenizer = None
+_worker_model = None
+
+
+def define_threads_per_worker(workers, threads_per_worker=0):
+    # Cores are divided between workers, so intra-op threads of different workers don't compete
+    if threads_per_worker > 0:
+        return threads_per_worker
+    return max(1, (os.cpu_count() or 1) // workers)
+
+
+def init_embedding_worker(model_name, threads_amount, inference_backend="eager", onnx_model_path=None):
+    from inference_backends import load_inference_model  # inference_backends imports this module
+
+    global _worker_tokenizer, _worker_model
+    torch.set_num_threads(threads_amount)
+    torch.set_num_interop_threads(1)
+    _worker_tokenizer = BertTokenizerFast.from_pretrained(model_name)
+    _worker_model = load_inference_model(
+        model_name, inference_backend, torch.device("cpu"), onnx_model_path, threads_amount
+    )
+
+
+def embed_summaries_in_worker(summaries, batch_size):
+    return find_summaries_embeddings(summaries, _worker_tokenizer, _worker_model, torch.device("cpu"), batch_size)
+
+
+class ShardedEmbedder:
+    # Summaries are sharded between processes of pool, every process has its own copy of model.
+    # Results are gathered in order of given summaries
+
+    def __init__(
+        self, model_name, workers, threads_per_worker=0, batch_size=DEFAULT_BATCH_SIZE,
+        inference_backend="eager", onnx_model_path=None
+    ):
+        self.workers = workers
+        self.batch_size = batch_size
+        self._pool = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),  # forked torch threads pools are not safe
+            initializer=init_embedding_worker,
+            initargs=(
+                model_name, define_threads_per_worker(workers, threads_per_worker), inference_backend, onnx_model_path
+            )
+        )
+
+    def __call__(self, summaries):
+        summaries = list(summaries)
+        if not summaries:
+            return []
+        # Summaries of close length are spread between shards round-robin, so every worker gets equal work
+        order = sorted(range(len(summaries)), key=lambda summary_index: len(summaries[summary_index]))
+        shards = [order[shard_start::self.workers] for shard_start in range(self.workers)]
+        futures = [
+            self._pool.submit(embed_summaries_in_worker, [summaries[i] for i in shard], self.batch_size)
+            for shard in shards if shard
+        ]
+        embeddings = [None] * len(summaries)
+        for shard, future in zip((shard for shard in shards if shard), futures):
+            for summary_index, embedding in zip(shard, future.result()):
+                embeddings[summary_index] = embedding
+        return embeddings
+
+    def close(self):
+        self._pool.shutdown()
@@ -0,0 +1,381 @@
+# In-process nearest neighbour index over ostis_govno.landmarks_embeddings.
+# Embeddings are exported into memory mapped file (L2 normalised float32 matrix), so every worker process,
+# which opens the index, shares the same pages of page cache. Landmark keys are kept in json sidecar.
+# Usage (build or update): python3 postgres/embedding_index.py index_dir=./embedding_index postgres_host=...
+import sys
+import os
+import json
+import math
+import glob
+import threading
+import numpy as np
+import sqlalchemy
+
+from landmarks_embeddings_queries import EMBEDDING_DIMENSION, decode_embedding, DEFAULT_SIMILAR_LANDMARKS_AMOUNT
+
+
+REQUIRED_ARGS = [
+    "index_dir",
+    "postgres_host",
+    "postgres_port",
+    "postgres_user",
+    "postgres_password"
+]
+OPTIONAL_ARGS = {
+    "full_rebuild": "False"  # export all embeddings again, instead of fetching only new and changed ones
+}
+
+METADATA_FILE_NAME = "metadata.json"
+FETCH_CHUNK_SIZE = 1000
+EARTH_RADIUS_KM = 6371.0088
+
+
+def embeddings_file_name(generation):
+    return f"embeddings.{generation}.f32"
+
+
+def coordinates_file_name(generation):
+    return f"coordinates.{generation}.f64"
+
+
+def read_index_metadata(index_dir):
+    metadata_path = os.path.join(index_dir, METADATA_FILE_NAME)
+    if not os.path.isfile(metadata_path):
+        return None
+    with open(metadata_path, "r", encoding="utf-8") as metadata_file:
+        return json.load(metadata_file)
+
+
+def open_index_files(index_dir, metadata, mode="r"):
+    # Returns (embeddings, coordinates) memory maps of the generation, described by metadata
+    landmarks_amount = len(metadata["landmarks"])
+    if landmarks_amount == 0:
+        return (
+            np.zeros((0, metadata["dimension"]), dtype=np.float32),
+            np.zeros((0, 2), dtype=np.float64)
+        )
+    embeddings = np.memmap(
+        os.path.join(index_dir, embeddings_file_name(metadata["generation"])),
+        dtype=np.float32, mode=mode, shape=(landmarks_amount, metadata["dimension"])
+    )
+    coordinates = np.memmap(
+        os.path.join(index_dir, coordinates_file_name(metadata["generation"])),
+        dtype=np.float64, mode=mode, shape=(landmarks_amount, 2)
+    )
+    return embeddings, coordinates
+
+
+def find_stored_landmarks_hashes(postgres_connection):
+    # Returns list of (landmark_name, landmark_latitude, landmark_longitude, summary_hash, embedding_hash)
+    # in stable order. embedding_hash is computed from stored embedding columns, so embedding, which is changed
+    # without change of summary (other model, inference backend, storage or PCA basis), is fetched again
+    return [
+        tuple(row) for row in postgres_connection.execute(
+            sqlalchemy.text(
+                """
+                SELECT
+                    landmark_name, landmark_latitude, landmark_longitude, summary_hash,
+                    md5(concat_ws(
+                        '|', embedding_encoding, embedding_pca_id::text, embedding_scale::text,
+                        embedding::text, md5(embedding_packed)
+                    )) AS embedding_hash
+                FROM ostis_govno.landmarks_embeddings
+                WHERE embedding IS NOT NULL OR embedding_packed IS NOT NULL
+                ORDER BY landmark_name, landmark_latitude, landmark_longitude;
+                """
+            )
+        )
+    ]
+
+
+def fetch_landmarks_embeddings(postgres_connection, landmarks_keys):
+    # Returns dict {(landmark_name, landmark_latitude, landmark_longitude): embedding}
+    embeddings = {}
+    for chunk_start in range(0, len(landmarks_keys), FETCH_CHUNK_SIZE):
+        chunk = landmarks_keys[chunk_start: chunk_start + FETCH_CHUNK_SIZE]
+        rows = postgres_connection.execute(
+            sqlalchemy.text(
+                """
+                SELECT
+                    landmarks.landmark_name, landmarks.landmark_latitude, landmarks.landmark_longitude,
+                    landmarks.embedding, landmarks.embedding_packed, landmarks.embedding_scale,
+                    landmarks.embedding_encoding, landmarks.embedding_pca_id
+                FROM ostis_govno.landmarks_embeddings AS landmarks
+                JOIN unnest(
+                    CAST(:landmark_names AS TEXT[]),
+                    CAST(:landmark_latitudes AS FLOAT[]),
+                    CAST(:landmark_longitudes AS FLOAT[])
+                ) AS keys(landmark_name, landmark_latitude, landmark_longitude)
+                    ON
+                        landmarks.landmark_name = keys.landmark_name AND
+                        landmarks.landmark_latitude = keys.landmark_latitude AND
+                        landmarks.landmark_longitude = keys.landmark_longitude;
+                """
+            ),
+            {
+                "landmark_names": [landmark_key[0] for landmark_key in chunk],
+                "landmark_latitudes": [landmark_key[1] for landmark_key in chunk],
+                "landmark_longitudes": [landmark_key[2] for landmark_key in chunk]
+            }
+        ).fetchall()
+        for row in rows:
+            embeddings[(row.landmark_name, row.landmark_latitude, row.landmark_longitude)] = decode_embedding(
+                postgres_connection, row
+            )
+    return embeddings
+
+
+def normalize_rows(matrix):
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def build_embedding_index(postgres_engine, index_dir, full_rebuild=False):
+    # Writes the next generation of index files. Rows of landmarks with the same summary hash and stored embedding
+    # are copied from the previous generation, only new and changed embeddings are fetched from postgres.
+    # metadata.json is replaced atomically, so readers see either the old or the new generation.
+    # Returns dict with amounts of reused, fetched and removed landmarks
+    os.makedirs(index_dir, exist_ok=True)
+    previous_metadata = read_index_metadata(index_dir)
+    previous_rows = {}
+    previous_embeddings = None
+    if not full_rebuild and previous_metadata is not None and previous_metadata["dimension"] == EMBEDDING_DIMENSION:
+        previous_embeddings, _ = open_index_files(index_dir, previous_metadata)
+        for row_index, previous_landmark in enumerate(previous_metadata["landmarks"]):
+            # Landmarks of generations without embedding hash are fetched again
+            landmark_name, landmark_latitude, landmark_longitude, landmark_summary_hash = previous_landmark[:4]
+            embedding_hash = previous_landmark[4] if len(previous_landmark) > 4 else None
+            previous_rows[(landmark_name, landmark_latitude, landmark_longitude)] = (
+                row_index, (landmark_summary_hash, embedding_hash)
+            )
+
+    # Keys and embeddings are read from the same snapshot of the table
+    with postgres_engine.connect().execution_options(isolation_level="REPEATABLE READ") as connection:
+        stored_landmarks = find_stored_landmarks_hashes(connection)
+        # Landmarks without summary hash (written before hashes were stored) are always fetched again
+        changed_keys = [
+            (landmark_name, landmark_latitude, landmark_longitude)
+            for landmark_name, landmark_latitude, landmark_longitude, landmark_summary_hash, embedding_hash
+            in stored_landmarks
+            if landmark_summary_hash is None or
+            previous_rows.get((landmark_name, landmark_latitude, landmark_longitude), (None, None))[1] !=
+            (landmark_summary_hash, embedding_hash)
+        ]
+        fetched_embeddings = fetch_landmarks_embeddings(connection, changed_keys)
+
+    generation = previous_metadata["generation"] + 1 if previous_metadata is not None else 1
+    metadata = {"generation": generation, "dimension": EMBEDDING_DIMENSION, "landmarks": []}
+    landmarks_amount = len(stored_landmarks)
+    if landmarks_amount > 0:
+        metadata["landmarks"] = [list(stored_landmark) for stored_landmark in stored_landmarks]
+        embeddings, coordinates = open_index_files(index_dir, metadata, mode="w+")
+        for row_index, (landmark_name, landmark_latitude, landmark_longitude, *_) in enumerate(stored_landmarks):
+            landmark_key = (landmark_name, landmark_latitude, landmark_longitude)
+            if landmark_key in fetched_embeddings:
+                embedding = np.asarray(fetched_embeddings[landmark_key], dtype=np.float32)
+                embeddings[row_index] = normalize_rows(embedding)
+            else:
+                embeddings[row_index] = previous_embeddings[previous_rows[landmark_key][0]]
+            coordinates[row_index] = (landmark_latitude, landmark_longitude)
+        embeddings.flush()
+        coordinates.flush()
+        del embeddings, coordinates
+    del previous_embeddings
+
+    metadata_path = os.path.join(index_dir, METADATA_FILE_NAME)
+    with open(metadata_path + ".tmp", "w", encoding="utf-8") as metadata_file:
+        json.dump(metadata, metadata_file, ensure_ascii=False)
+    os.replace(metadata_path + ".tmp", metadata_path)
+
+    # The previous generation is kept, so reader, which has read the previous metadata, but hasn't opened its files
+    # yet, still finds them. Older generations are removed, processes which still map them keep their pages
+    kept_generations = {generation}
+    if previous_metadata is not None:
+        kept_generations.add(previous_metadata["generation"])
+    for generation_path in glob.glob(os.path.join(index_dir, "*.*.f[0-9][0-9]")):
+        if int(os.path.basename(generation_path).split(".")[1]) not in kept_generations:
+            os.remove(generation_path)
+
+    stored_keys = {tuple(stored_landmark[:3]) for stored_landmark in stored_landmarks}
+    return {
+        "landmarks": landmarks_amount,
+        "reused": landmarks_amount - len(fetched_embeddings),
+        "fetched": len(fetched_embeddings),
+        "removed": sum(1 for previous_key in previous_rows.keys() if previous_key not in stored_keys)
+    }
+
+
+class LandmarksEmbeddingIndex:
+    # Read only view of index files. Queries are vectorised over all landmarks, that pass geo filter:
+    # bbox = (min_latitude, min_longitude, max_latitude, max_longitude) or center = (latitude, longitude) with
+    # radius_km (great circle distance)
+
+    def __init__(self, index_dir):
+        self.index_dir = index_dir
+        self._lock = threading.Lock()
+        self.generation = None
+        self.reload()
+
+    def reload(self):
+        metadata = read_index_metadata(self.index_dir)
+        if metadata is None:
+            raise FileNotFoundError(f"Embedding index \"{self.index_dir}\" doesn't exist. Build it first.")
+        embeddings, coordinates = open_index_files(self.index_dir, metadata)
+        landmarks_keys = [tuple(stored_landmark[:3]) for stored_landmark in metadata["landmarks"]]
+        with self._lock:
+            self._embeddings = embeddings
+            self._coordinates = coordinates
+            self._landmarks_keys = landmarks_keys
+            self._rows = {landmark_key: row_index for row_index, landmark_key in enumerate(landmarks_keys)}
+            self.generation = metadata["generation"]
+
+    def reload_if_changed(self):
+        # Returns True, if the new generation of index is loaded
+        metadata = read_index_metadata(self.index_dir)
+        if metadata is None or metadata["generation"] == self.generation:
+            return False
+        self.reload()
+        return True
+
+    def __len__(self):
+        return len(self._landmarks_keys)
+
+    def get_embedding(self, landmark_key):
+        # Returns normalised embedding of landmark_key = (landmark_name, landmark_latitude, landmark_longitude)
+        row_index = self._rows.get(landmark_key)
+        if row_index is None:
+            return None
+        return np.array(self._embeddings[row_index])
+
+    def _candidate_rows(self, coordinates, bbox=None, center=None, radius_km=None):
+        mask = np.ones(coordinates.shape[0], dtype=bool)
+        if bbox is not None:
+            min_latitude, min_longitude, max_latitude, max_longitude = bbox
+            mask &= (
+                (coordinates[:, 0] >= min_latitude) & (coordinates[:, 0] <= max_latitude) &
+                (coordinates[:, 1] >= min_longitude) & (coordinates[:, 1] <= max_longitude)
+            )
+        if center is not None:
+            if radius_km is None:
+                raise AttributeError("radius_km must be given with center.")
+            # Bounding box of the circle cuts off most of landmarks before haversine is computed
+            latitude_delta = math.degrees(radius_km / EARTH_RADIUS_KM)
+            cos_latitude = math.cos(math.radians(center[0]))
+            longitude_delta = 180.0 if cos_latitude < 1e-9 else min(180.0, latitude_delta / cos_latitude)
+            mask &= (
+                (coordinates[:, 0] >= center[0] - latitude_delta) & (coordinates[:, 0] <= center[0] + latitude_delta)
+            )
+            if longitude_delta < 180.0:
+                longitude_difference = np.abs((coordinates[:, 1] - center[1] + 180.0) % 360.0 - 180.0)
+                mask &= longitude_difference <= longitude_delta
+            rows = np.flatnonzero(mask)
+            latitudes = np.radians(coordinates[rows, 0])
+            longitudes_difference = np.radians(coordinates[rows, 1] - center[1])
+            center_latitude = math.radians(center[0])
+            haversine = (
+                np.sin((latitudes - center_latitude) / 2) ** 2 +
+                math.cos(center_latitude) * np.cos(latitudes) * np.sin(longitudes_difference / 2) ** 2
+            )
+            distances = 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(haversine, 0.0, 1.0)))
+            return rows[distances <= radius_km]
+        return np.flatnonzero(mask)
+
+    def search_many(
+        self, query_embeddings, k=DEFAULT_SIMILAR_LANDMARKS_AMOUNT, bbox=None, center=None, radius_km=None,
+        exclude_keys=None
+    ):
+        # Returns for every query list of dicts (landmark_name, landmark_latitude, landmark_longitude, similarity),
+        # sorted by cosine similarity. exclude_keys - landmark key (or None) for every query, which is skipped
+        with self._lock:
+            embeddings, coordinates, landmarks_keys, rows_of_keys = (
+                self._embeddings, self._coordinates, self._landmarks_keys, self._rows
+            )
+        queries = normalize_rows(np.atleast_2d(np.asarray(query_embeddings, dtype=np.float32)))
+        if exclude_keys is None:
+            exclude_keys = [None] * queries.shape[0]
+        rows = self._candidate_rows(coordinates, bbox, center, radius_km)
+        if rows.size == 0:
+            return [[] for _ in range(queries.shape[0])]
+        if rows.size == embeddings.shape[0]:
+            similarities = queries @ embeddings.T
+        else:
+            similarities = queries @ embeddings[rows].T
+
+        results = []
+        for query_similarities, exclude_key in zip(similarities, exclude_keys):
+            excluded_row = rows_of_keys.get(exclude_key) if exclude_key is not None else None
+            if excluded_row is not None:
+                excluded_positions = np.flatnonzero(rows == excluded_row)
+                query_similarities = query_similarities.copy()
+                query_similarities[excluded_positions] = -np.inf
+            top_amount = min(k, query_similarities.shape[0])
+            top_positions = np.argpartition(-query_similarities, top_amount - 1)[:top_amount]
+            top_positions = top_positions[np.argsort(-query_similarities[top_positions])]
+            query_result = []
+            for position in top_positions:
+                if query_similarities[position] == -np.inf:
+                    continue
+                landmark_name, landmark_latitude, landmark_longitude = landmarks_keys[rows[position]]
+                query_result.append({
+                    "landmark_name": landmark_name,
+                    "landmark_latitude": landmark_latitude,
+                    "landmark_longitude": landmark_longitude,
+                    "similarity": float(query_similarities[position])
+                })
+            results.append(query_result)
+        return results
+
+    def search(self, embedding=None, landmark_key=None, k=DEFAULT_SIMILAR_LANDMARKS_AMOUNT, bbox=None, center=None,
+               radius_km=None):
+        # The same as find_similar_landmarks of landmarks_embeddings_queries, but without postgres round trip
+        if (embedding is None) == (landmark_key is None):
+            raise AttributeError("Exactly one of embedding and landmark_key must be given.")
+        if landmark_key is not None:
+            landmark_key = (landmark_key[0], float(landmark_key[1]), float(landmark_key[2]))
+            embedding = self.get_embedding(landmark_key)
+            if embedding is None:
+                return []
+        return self.search_many([embedding], k, bbox, center, radius_km, [landmark_key])[0]
+
+
+def parse_args():
+    args = {}
+    for arg in sys.argv[1:]:
+        arg_pair = arg.split("=")
+        if len(arg_pair) != 2:
+            raise AttributeError(f"Invalid argument \"{arg}\".")
+        if arg_pair[0].strip() not in REQUIRED_ARGS and arg_pair[0].strip() not in OPTIONAL_ARGS:
+            raise AttributeError(f"Invalid argument: \"{arg_pair[0]}\".")
+        args[arg_pair[0].strip()] = arg_pair[1].strip()
+
+    for arg in REQUIRED_ARGS:
+        if arg not in args.keys():
+            raise AttributeError(f"Argument {arg} is required.")
+    for arg, default_value in OPTIONAL_ARGS.items():
+        args.setdefault(arg, default_value)
+    if args["full_rebuild"].lower() == "true" or args["full_rebuild"].lower() == 't':
+        args["full_rebuild"] = True
+    elif args["full_rebuild"].lower() == "false" or args["full_rebuild"].lower() == 'f':
+        args["full_rebuild"] = False
+    else:
+        raise AttributeError("Available values for full_rebuild are: True, T, False, F (case insensitive).")
+    return args
+
+
+def main():
+    args = parse_args()
+    postgres_engine = sqlalchemy.create_engine(
+        f"postgresql://{args['postgres_user']}:{args['postgres_password']}@{args['postgres_host']}:{args['postgres_port']}/postgres"
+    )
+    print(f"Building embedding index in \"{args['index_dir']}\"...", flush=True)
+    build_stats = build_embedding_index(postgres_engine, args['index_dir'], args['full_rebuild'])
+    print(
+        f"Embedding index is built: {build_stats['landmarks']} landmarks, {build_stats['reused']} reused, "
+        f"{build_stats['fetched']} fetched, {build_stats['removed']} removed.",
+        flush=True
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+import numpy as np
+
+
+PACKED_EMBEDDING_STORAGES = ["float16", "int8"]
+INT8_MAX = 127
+
+
+def pack_embedding(embedding, encoding):
+    # Returns (packed bytes, scale). int8 vectors are quantized symmetrically with per vector scale
+    embedding = np.asarray(embedding, dtype=np.float32)
+    if encoding == "float16":
+        return embedding.astype(np.float16).tobytes(), None
+    if encoding == "int8":
+        max_abs_value = float(np.abs(embedding).max()) if embedding.size else 0.0
+        scale = max_abs_value / INT8_MAX if max_abs_value > 0 else 1.0
+        quantized = np.clip(np.rint(embedding / scale), -INT8_MAX, INT8_MAX).astype(np.int8)
+        return quantized.tobytes(), scale
+    raise ValueError(f"Unknown embedding encoding \"{encoding}\".")
+
+
+def unpack_embedding(packed, scale, encoding):
+    if encoding == "float16":
+        return np.frombuffer(bytes(packed), dtype=np.float16).astype(np.float32)
+    if encoding == "int8":
+        return np.frombuffer(bytes(packed), dtype=np.int8).astype(np.float32) * np.float32(scale)
+    raise ValueError(f"Unknown embedding encoding \"{encoding}\".")
+
+
+class PcaBasis:
+    # Projection of embeddings on the first principal components (fitted on embeddings of imported landmarks)
+
+    def __init__(self, mean, components, basis_id=None):
+        self.mean = np.asarray(mean, dtype=np.float32)
+        self.components = np.asarray(components, dtype=np.float32)  # (dimensions, embedding size)
+        self.basis_id = basis_id
+
+    @property
+    def dimensions(self):
+        return self.components.shape[0]
+
+    @classmethod
+    def fit(cls, embeddings, dimensions):
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        if embeddings.shape[0] < dimensions:
+            raise ValueError(
+                f"PCA with {dimensions} dimensions needs at least {dimensions} embeddings, "
+                f"{embeddings.shape[0]} are given."
+            )
+        mean = embeddings.mean(axis=0)
+        _, _, components = np.linalg.svd(embeddings - mean, full_matrices=False)
+        return cls(mean, components[:dimensions])
+
+    @classmethod
+    def from_bytes(cls, mean_bytes, components_bytes, dimensions, basis_id=None):
+        mean = np.frombuffer(bytes(mean_bytes), dtype=np.float32)
+        components = np.frombuffer(bytes(components_bytes), dtype=np.float32).reshape(dimensions, mean.shape[0])
+        return cls(mean, components, basis_id)
+
+    def project(self, embedding):
+        return (np.asarray(embedding, dtype=np.float32) - self.mean) @ self.components.T
+
+    def reconstruct(self, reduced_embedding):
+        return np.asarray(reduced_embedding, dtype=np.float32) @ self.components + self.mean
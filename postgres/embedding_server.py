@@ -0,0 +1,230 @@
+# Local embedding service: keeps model in memory and embeds texts of concurrent requests in micro batches.
+# Usage: python3 postgres/embedding_server.py host=127.0.0.1 port=8090 model_store_dir=./model_store
+#   POST /embed  {"texts": ["...", ...]}  ->  {"embeddings": [[...], ...]}, 503 if queue of texts is full
+#   GET  /stats  ->  queue depth, batches and latency percentiles
+import sys
+import json
+import time
+import queue
+import threading
+import collections
+import functools
+from concurrent.futures import Future
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from embedding_settings import MODEL_NAME, DEFAULT_BATCH_SIZE, INFERENCE_BACKENDS, DEFAULT_ONNX_MODEL_PATH
+
+
+OPTIONAL_ARGS = {
+    "host": "127.0.0.1",
+    "port": "8090",
+    "model_store_dir": "",  # directory, prepared by model_store.py (model is downloaded, if empty)
+    "inference_backend": "eager",
+    "onnx_model_path": DEFAULT_ONNX_MODEL_PATH,
+    "max_batch_size": "64",  # max amount of texts in one micro batch
+    "max_wait_ms": "5",  # max time the first text of micro batch waits for others
+    "max_queue_depth": "2048",  # max amount of texts waiting for embedding, requests above it are answered with 503
+    "batch_size": str(DEFAULT_BATCH_SIZE)  # max amount of chunks in one model call
+}
+LATENCY_WINDOW = 10000  # amount of the last requests, latency percentiles are computed for
+MAX_REQUEST_TEXTS = 1024
+
+
+class QueueFullError(Exception):
+    pass
+
+
+class MicroBatcher:
+    # Requests are put in queue, the single worker thread takes texts of several requests and embeds them at once.
+    # Queue is bounded by max_queue_depth texts: request, which doesn't fit, is rejected at once instead of
+    # waiting behind the whole backlog, so latency of admitted requests stays bounded under overload
+
+    def __init__(self, embed_summaries, max_batch_size, max_wait_ms, max_queue_depth):
+        self._embed_summaries = embed_summaries
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.max_queue_depth = max_queue_depth
+        self._queue = queue.Queue()
+        self._admission_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._latencies = collections.deque(maxlen=LATENCY_WINDOW)
+        self._batches_amount = 0
+        self._texts_amount = 0
+        self._rejected_amount = 0
+        self._thread = threading.Thread(target=self._work, name="micro-batcher", daemon=True)
+        self._thread.start()
+
+    def embed(self, texts):
+        # Blocks until embeddings of texts are computed, raises QueueFullError, if texts don't fit in queue.
+        # All texts of request are admitted together, the worker only takes texts, so queue never exceeds the limit
+        started = time.perf_counter()
+        futures = []
+        with self._admission_lock:
+            if self._queue.qsize() + len(texts) > self.max_queue_depth:
+                with self._stats_lock:
+                    self._rejected_amount += 1
+                raise QueueFullError(f"Queue of texts is full ({self.max_queue_depth} texts).")
+            for text in texts:
+                future = Future()
+                self._queue.put((text, future))
+                futures.append(future)
+        embeddings = [future.result() for future in futures]
+        with self._stats_lock:
+            self._latencies.append(time.perf_counter() - started)
+        return embeddings
+
+    def _collect_batch(self):
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.perf_counter()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return batch
+
+    def _work(self):
+        while True:
+            batch = self._collect_batch()
+            try:
+                embeddings = self._embed_summaries([text for text, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future), embedding in zip(batch, embeddings):
+                future.set_result(embedding)
+            with self._stats_lock:
+                self._batches_amount += 1
+                self._texts_amount += len(batch)
+
+    def stats(self):
+        with self._stats_lock:
+            latencies = sorted(self._latencies)
+            batches_amount = self._batches_amount
+            texts_amount = self._texts_amount
+            rejected_amount = self._rejected_amount
+
+        def percentile(part):
+            if not latencies:
+                return None
+            return round(latencies[min(len(latencies) - 1, int(part * len(latencies)))] * 1000, 3)
+
+        return {
+            "queue_depth": self._queue.qsize(),
+            "max_queue_depth": self.max_queue_depth,
+            "rejected_requests": rejected_amount,
+            "batches": batches_amount,
+            "texts": texts_amount,
+            "mean_batch_size": texts_amount / batches_amount if batches_amount else None,
+            "latency_ms": {"p50": percentile(0.5), "p90": percentile(0.9), "p99": percentile(0.99)}
+        }
+
+
+def create_request_handler(micro_batcher):
+    class EmbeddingRequestHandler(BaseHTTPRequestHandler):
+        def send_json(self, status, body):
+            encoded_body = json.dumps(body, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(encoded_body)))
+            self.end_headers()
+            self.wfile.write(encoded_body)
+
+        def do_GET(self):
+            if self.path == "/stats":
+                self.send_json(200, micro_batcher.stats())
+            else:
+                self.send_json(404, {"error": "Not found."})
+
+        def do_POST(self):
+            if self.path != "/embed":
+                self.send_json(404, {"error": "Not found."})
+                return
+            try:
+                request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+                texts = request["texts"]
+                if not isinstance(texts, list) or not all(isinstance(text, str) for text in texts):
+                    raise ValueError("texts must be list of strings.")
+                max_request_texts = min(MAX_REQUEST_TEXTS, micro_batcher.max_queue_depth)
+                if len(texts) > max_request_texts:
+                    raise ValueError(f"At most {max_request_texts} texts are allowed in one request.")
+            except (ValueError, KeyError, TypeError) as e:
+                self.send_json(400, {"error": f"Invalid request: {e}"})
+                return
+            try:
+                self.send_json(200, {"embeddings": micro_batcher.embed(texts)})
+            except QueueFullError as e:
+                self.send_json(503, {"error": str(e)})
+            except Exception as e:
+                self.send_json(500, {"error": str(e)})
+
+        def log_message(self, format, *args):
+            pass  # Access log of every request is too expensive for the service
+
+    return EmbeddingRequestHandler
+
+
+def parse_args():
+    args = dict(OPTIONAL_ARGS)
+    for arg in sys.argv[1:]:
+        arg_pair = arg.split("=")
+        if len(arg_pair) != 2:
+            raise AttributeError(f"Invalid argument \"{arg}\".")
+        if arg_pair[0].strip() not in OPTIONAL_ARGS:
+            raise AttributeError(f"Invalid argument: \"{arg_pair[0]}\".")
+        args[arg_pair[0].strip()] = arg_pair[1].strip()
+    for arg in ["port", "max_batch_size", "max_queue_depth", "batch_size"]:
+        try:
+            args[arg] = int(args[arg])
+        except ValueError:
+            raise AttributeError(f"Argument {arg} must be integer.")
+    for arg in ["max_batch_size", "max_queue_depth", "batch_size"]:
+        if args[arg] < 1:
+            raise AttributeError(f"Argument {arg} must be positive.")
+    try:
+        args["max_wait_ms"] = float(args["max_wait_ms"])
+    except ValueError:
+        raise AttributeError("Argument max_wait_ms must be number.")
+    if not args["max_wait_ms"] >= 0:
+        raise AttributeError("Argument max_wait_ms must not be negative.")
+    if args["inference_backend"] not in INFERENCE_BACKENDS:
+        raise AttributeError(f"Available values for inference_backend are: {', '.join(INFERENCE_BACKENDS)}.")
+    return args
+
+
+def main():
+    import torch
+    from transformers import BertTokenizerFast
+    from embedding_engine import find_summaries_embeddings, define_torch_device
+    from inference_backends import load_inference_model
+
+    args = parse_args()
+    model_source = args['model_store_dir'] or MODEL_NAME
+    device = define_torch_device() if args['inference_backend'] == "eager" else torch.device("cpu")
+    print("Loading embedding model...", flush=True)
+    tokenizer = BertTokenizerFast.from_pretrained(model_source)
+    model = load_inference_model(model_source, args['inference_backend'], device, args['onnx_model_path'])
+    embed_summaries = functools.partial(
+        find_summaries_embeddings, tokenizer=tokenizer, model=model, device=device, batch_size=args['batch_size']
+    )
+
+    micro_batcher = MicroBatcher(
+        embed_summaries, args['max_batch_size'], args['max_wait_ms'], args['max_queue_depth']
+    )
+    server = ThreadingHTTPServer((args['host'], args['port']), create_request_handler(micro_batcher))
+    server.daemon_threads = True
+    print(f"Embedding service is listening on http://{args['host']}:{args['port']}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
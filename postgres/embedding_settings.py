@@ -0,0 +1,11 @@
+# Settings of embedding model, shared by modules, that must not import torch and transformers
+MODEL_NAME = "DeepPavlov/rubert-base-cased"
+
+MAX_CHUNK_LENGTH = 384
+CHUNK_STRIDE = 192
+DEFAULT_BATCH_SIZE = 32
+
+INFERENCE_BACKENDS = ["eager", "int8", "onnx"]
+DEFAULT_ONNX_MODEL_PATH = "rubert.onnx"
+DEFAULT_MIN_COSINE_SIMILARITY = 0.99
+DEFAULT_VALIDATION_SIZE = 32
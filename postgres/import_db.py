@@ -1,10 +1,28 @@
 # Author: Vodohleb04
 import sys
+import io
+import csv
 import json
-from transformers import BertTokenizerFast, BertModel
-import torch
+import functools
+import itertools
+import hashlib
+import os
+import pathlib
+import threading
 import sqlalchemy
 import neo4j
+# torch and transformers are imported only when there are landmarks to embed (see load_embedder)
+from embedding_settings import (
+    MODEL_NAME, DEFAULT_BATCH_SIZE,
+    INFERENCE_BACKENDS, DEFAULT_ONNX_MODEL_PATH, DEFAULT_MIN_COSINE_SIMILARITY, DEFAULT_VALIDATION_SIZE
+)
+from embedding_cache import EmbeddingCache, DEFAULT_CACHE_MAX_SIZE_MB
+from embedding_packing import PcaBasis, pack_embedding, PACKED_EMBEDDING_STORAGES
+from landmarks_embeddings_queries import EMBEDDING_DIMENSION, EMBEDDING_STORAGES
+from pipeline import run_pipeline, DEFAULT_QUEUE_SIZE
+
+sys.path.append(str(pathlib.Path(__file__).resolve().parent.parent))  # import_metrics is shared by both importers
+from import_metrics import ImportMetrics, DEFAULT_METRICS_DIR
 
 
 REQUIRED_ARGS = [
@@ -20,7 +38,41 @@ REQUIRED_ARGS = [
 ]
 
 
-def create_postgres_scheme(postgres_db_engine):
+NEO4J_RESOLVE_CHUNK_SIZE = 1000
+COPY_CHUNK_SIZE = 10000
+JSON_READ_SIZE = 1 << 16
+DEFAULT_PIPELINE_BATCH_SIZE = 256
+DEFAULT_COMMIT_EVERY = 1000
+DEFAULT_PCA_FIT_SIZE = 4096
+WRITE_MODES = ["copy", "insert"]
+METRICS_IMPORTER_NAME = "postgres_embeddings"
+
+
+OPTIONAL_ARGS = {
+    "batch_size": str(DEFAULT_BATCH_SIZE),
+    "model_store_dir": "",  # directory, prepared by model_store.py (model is downloaded, if empty)
+    "inference_backend": "eager",  # "int8" - dynamic quantization, "onnx" - onnxruntime (cpu only)
+    "onnx_model_path": DEFAULT_ONNX_MODEL_PATH,  # exported with inference_backend=onnx, again when model changes
+    "min_cosine_similarity": str(DEFAULT_MIN_COSINE_SIMILARITY),  # with eager model, checked for int8 and onnx
+    "workers": "1",  # amount of processes for embedding on cpu
+    "threads_per_worker": "0",  # torch threads of every worker process, 0 - cores are divided between workers
+    "pipeline_batch_size": str(DEFAULT_PIPELINE_BATCH_SIZE),  # landmarks passed between pipeline stages at once
+    "queue_size": str(DEFAULT_QUEUE_SIZE),  # max amount of batches waiting before every pipeline stage
+    "commit_every": str(DEFAULT_COMMIT_EVERY),  # landmarks written between commits
+    "resume": "True",  # continue unfinished import of the same json file, model and embedding storage
+    "incremental": "False",  # embed only new landmarks and landmarks with changed summary
+    "delete_removed": "False",  # with incremental import, delete embeddings of landmarks, absent in json
+    "write_mode": "copy",  # "insert" writes landmarks one by one
+    "embedding_storage": "float_array",  # "vector" - pgvector column with hnsw index, "float16", "int8" - bytea
+    "pca_dimensions": "0",  # with float16 and int8 storages, embeddings are projected on this amount of components
+    "pca_fit_size": str(DEFAULT_PCA_FIT_SIZE),  # amount of the first embeddings, PCA basis is fitted on
+    "embedding_cache_path": "embedding_cache.sqlite3",  # empty value disables the cache
+    "embedding_cache_max_size_mb": str(DEFAULT_CACHE_MAX_SIZE_MB),
+    "metrics_dir": DEFAULT_METRICS_DIR  # prometheus and json log files of import stages, empty - not written
+}
+
+
+def create_postgres_scheme(postgres_db_engine, embedding_storage="float_array"):
     with postgres_db_engine.begin() as tx:
         tx.execute(sqlalchemy.text("CREATE SCHEMA IF NOT EXISTS ostis_govno;"))
         tx.execute(
@@ -47,28 +99,171 @@ def create_postgres_scheme(postgres_db_engine):
                 """
             )
         )
+        # Hash of summary, embedding was computed for (used by incremental import)
+        tx.execute(
+            sqlalchemy.text("ALTER TABLE ostis_govno.landmarks_embeddings ADD COLUMN IF NOT EXISTS summary_hash TEXT;")
+        )
+        create_packed_embedding_storage(tx)
+        if embedding_storage == "vector":
+            create_vector_embedding_storage(tx)
+        else:
+            create_float_array_embedding_storage(tx)
+        create_import_progress_tables(tx)
 
 
-def find_landmark_embedding(json_landmark, tokenizer, model, device):
-    # Get the embedding tensor
-    tokenized_landmark_summary = tokenizer(
-        json_landmark["summary"], 
-        padding="max_length", truncation=True,
-        max_length=384, stride=192,
-        return_tensors='pt', return_overflowing_tokens=True, 
+def create_packed_embedding_storage(postgres_tx):
+    # Compact embeddings (embedding_storage float16 or int8): packed vector with scale of int8 quantization and
+    # id of PCA basis, if vector is projected on principal components. Column embedding is null for them
+    postgres_tx.execute(
+        sqlalchemy.text(
+            """
+            CREATE TABLE IF NOT EXISTS ostis_govno.embeddings_pca_bases(
+                id          BIGSERIAL PRIMARY KEY,
+                model_id    TEXT NOT NULL,
+                dimensions  INTEGER NOT NULL,
+                mean        BYTEA NOT NULL,
+                components  BYTEA NOT NULL,
+                created_at  TIMESTAMPTZ NOT NULL DEFAULT now()
+            );
+            """
+        )
+    )
+    postgres_tx.execute(
+        sqlalchemy.text(
+            """
+            ALTER TABLE ostis_govno.landmarks_embeddings
+                ADD COLUMN IF NOT EXISTS embedding_packed   BYTEA,
+                ADD COLUMN IF NOT EXISTS embedding_scale    REAL,
+                ADD COLUMN IF NOT EXISTS embedding_encoding TEXT,
+                ADD COLUMN IF NOT EXISTS embedding_pca_id   BIGINT REFERENCES ostis_govno.embeddings_pca_bases(id);
+            """
+        )
     )
 
-    tokenized_landmark_summary.pop("overflow_to_sample_mapping")
 
-    for key in tokenized_landmark_summary.keys():
-        tokenized_landmark_summary[key] = tokenized_landmark_summary[key].type(torch.int32).to(device)
+def create_import_progress_tables(postgres_tx):
+    # Progress of import is committed together with embeddings, so interrupted import can be resumed
+    postgres_tx.execute(
+        sqlalchemy.text(
+            """
+            CREATE TABLE IF NOT EXISTS ostis_govno.embeddings_import_runs(
+                id          BIGSERIAL PRIMARY KEY,
+                json_path   TEXT NOT NULL,
+                model_id    TEXT NOT NULL,
+                started_at  TIMESTAMPTZ NOT NULL DEFAULT now(),
+                finished_at TIMESTAMPTZ
+            );
+            """
+        )
+    )
+    # Storage of embeddings, run writes them in. Runs created before these columns have nulls and are never resumed
+    postgres_tx.execute(
+        sqlalchemy.text(
+            """
+            ALTER TABLE ostis_govno.embeddings_import_runs
+                ADD COLUMN IF NOT EXISTS embedding_storage  TEXT,
+                ADD COLUMN IF NOT EXISTS pca_dimensions     INTEGER;
+            """
+        )
+    )
+    postgres_tx.execute(
+        sqlalchemy.text(
+            """
+            CREATE TABLE IF NOT EXISTS ostis_govno.embeddings_import_progress(
+                run_id              BIGINT NOT NULL REFERENCES ostis_govno.embeddings_import_runs(id) ON DELETE CASCADE,
+                landmark_name       TEXT NOT NULL,
+                landmark_latitude   FLOAT NOT NULL,
+                landmark_longitude  FLOAT NOT NULL,
+                summary_hash        TEXT NOT NULL,
+                PRIMARY KEY (run_id, landmark_name, landmark_latitude, landmark_longitude)
+            );
+            """
+        )
+    )
 
-    # mean of last hidden state of model is used as embedding
-    landmark_embedding_torch = model(**tokenized_landmark_summary).last_hidden_state.mean(dim=1).mean(dim=0)
 
-    landmark_embedding = landmark_embedding_torch.detach().cpu().tolist()
-    del landmark_embedding_torch
-    return landmark_embedding
+def find_embedding_column_type(postgres_tx):
+    return postgres_tx.execute(
+        sqlalchemy.text(
+            """
+            SELECT udt_name
+            FROM information_schema.columns
+            WHERE
+                table_schema = 'ostis_govno' AND
+                table_name = 'landmarks_embeddings' AND
+                column_name = 'embedding';
+            """
+        )
+    ).scalar()
+
+
+def create_vector_embedding_storage(postgres_tx):
+    # Embeddings are stored in pgvector column, cosine distance search is served by hnsw index
+    postgres_tx.execute(sqlalchemy.text("CREATE EXTENSION IF NOT EXISTS vector;"))
+    if find_embedding_column_type(postgres_tx) != "vector":
+        postgres_tx.execute(
+            sqlalchemy.text(
+                f"""
+                ALTER TABLE ostis_govno.landmarks_embeddings
+                    ALTER COLUMN embedding TYPE vector({EMBEDDING_DIMENSION})
+                    USING embedding::vector({EMBEDDING_DIMENSION});
+                """
+            )
+        )
+    postgres_tx.execute(
+        sqlalchemy.text(
+            """
+            CREATE INDEX IF NOT EXISTS landmark_embedding_hnsw_cosine_index
+            ON ostis_govno.landmarks_embeddings
+            USING hnsw
+            (embedding vector_cosine_ops)
+            WITH (m = 16, ef_construction = 64);
+            """
+        )
+    )
+
+
+def create_float_array_embedding_storage(postgres_tx):
+    # Converts embedding column back, if it was created with embedding_storage=vector
+    if find_embedding_column_type(postgres_tx) == "vector":
+        postgres_tx.execute(sqlalchemy.text("DROP INDEX IF EXISTS ostis_govno.landmark_embedding_hnsw_cosine_index;"))
+        postgres_tx.execute(
+            sqlalchemy.text(
+                """
+                ALTER TABLE ostis_govno.landmarks_embeddings
+                    ALTER COLUMN embedding TYPE FLOAT[]
+                    USING embedding::REAL[]::FLOAT[];
+                """
+            )
+        )
+
+
+def find_landmark_embedding(json_landmark, tokenizer, model, device):
+    from embedding_engine import find_summaries_embeddings
+
+    return find_summaries_embeddings([json_landmark["summary"]], tokenizer, model, device)[0]
+
+
+def find_landmarks_embeddings(json_landmarks_list, embed_summaries, embedding_cache=None):
+    # embed_summaries is function: list of summaries -> list of embeddings in the same order
+    summaries = [json_landmark["summary"] for json_landmark in json_landmarks_list]
+    if embedding_cache is None:
+        return embed_summaries(summaries)
+
+    keys = [embedding_cache.key(summary) for summary in summaries]
+    cached_embeddings = embedding_cache.get_many(keys)
+    # Only summaries, that are not cached, are tokenized and passed through the model
+    missed = {}
+    for key, summary in zip(keys, summaries):
+        if key not in cached_embeddings:
+            missed.setdefault(key, summary)
+    print(f"Embeddings found in cache: {len(summaries) - len(missed)}/{len(summaries)}", flush=True)
+
+    if missed:
+        missed_embeddings = embed_summaries(list(missed.values()))
+        embedding_cache.put_many(zip(missed.keys(), missed_embeddings))
+        cached_embeddings.update(zip(missed.keys(), missed_embeddings))
+    return [cached_embeddings[key] for key in keys]
 
 
 def find_landmark_in_neo4j(neo4j_driver, json_landmark):
@@ -92,56 +287,786 @@ def find_landmark_in_neo4j(neo4j_driver, json_landmark):
     )
 
 
-def insert_landmark_embedding(postgres_tx, neo4j_landmark, landmark_embedding):
+def json_landmark_key(json_landmark):
+    return (
+        json_landmark["name"],
+        float(json_landmark["coordinates"]["latitude"]),
+        float(json_landmark["coordinates"]["longitude"])
+    )
+
+
+def find_landmarks_in_neo4j(neo4j_driver, json_landmarks_list, chunk_size=NEO4J_RESOLVE_CHUNK_SIZE):
+    # Resolves landmarks with one UNWIND query per chunk.
+    # Returns dict {(json name, latitude, longitude): neo4j record} and list of json keys, that are not found
+    landmarks_keys = list(dict.fromkeys(json_landmark_key(json_landmark) for json_landmark in json_landmarks_list))
+    found_landmarks = {}
+    for chunk_start in range(0, len(landmarks_keys), chunk_size):
+        records = neo4j_driver.execute_query(
+            """
+            UNWIND $landmarks AS json_landmark
+            CALL {
+                WITH json_landmark
+                MATCH (landmark: Landmark)
+                    WHERE
+                        landmark.latitude = json_landmark.latitude AND
+                        landmark.longitude = json_landmark.longitude AND
+                        landmark.name STARTS WITH json_landmark.name
+                RETURN landmark
+                    LIMIT 1
+            }
+            RETURN
+                json_landmark.name AS json_name,
+                json_landmark.latitude AS json_latitude,
+                json_landmark.longitude AS json_longitude,
+                landmark.name AS landmark_name,
+                landmark.latitude AS landmark_latitude,
+                landmark.longitude AS landmark_longitude;
+            """,
+            landmarks=[
+                {"name": name, "latitude": latitude, "longitude": longitude}
+                for name, latitude, longitude in landmarks_keys[chunk_start: chunk_start + chunk_size]
+            ]
+        ).records
+        for record in records:
+            found_landmarks[
+                (record.get("json_name"), record.get("json_latitude"), record.get("json_longitude"))
+            ] = record
+    not_found_landmarks = [key for key in landmarks_keys if key not in found_landmarks]
+    return found_landmarks, not_found_landmarks
+
+
+class EmbeddingEncoder:
+    # Converts embedding to values of embedding columns of landmarks_embeddings according to embedding storage
+
+    def __init__(self, embedding_storage="float_array", model_id=MODEL_NAME, pca_dimensions=0, pca_basis=None):
+        self.embedding_storage = embedding_storage
+        self.model_id = model_id
+        self.pca_dimensions = pca_dimensions
+        self.pca_basis = pca_basis
+
+    @property
+    def needs_pca_fit(self):
+        return self.pca_dimensions > 0 and self.pca_basis is None
+
+    def encode(self, embedding):
+        if self.embedding_storage not in PACKED_EMBEDDING_STORAGES:
+            return {
+                "embedding": embedding, "embedding_packed": None, "embedding_scale": None,
+                "embedding_encoding": None, "embedding_pca_id": None
+            }
+        pca_id = None
+        if self.pca_basis is not None:
+            embedding = self.pca_basis.project(embedding)
+            pca_id = self.pca_basis.basis_id
+        packed_embedding, scale = pack_embedding(embedding, self.embedding_storage)
+        return {
+            "embedding": None, "embedding_packed": packed_embedding, "embedding_scale": scale,
+            "embedding_encoding": self.embedding_storage, "embedding_pca_id": pca_id
+        }
+
+    def is_current_encoding(self, embedding_encoding, embedding_pca_id):
+        # Stored embedding is written in the same storage and PCA basis, as encode writes now
+        if self.embedding_storage not in PACKED_EMBEDDING_STORAGES:
+            return embedding_encoding is None
+        if self.needs_pca_fit:
+            return False
+        pca_id = self.pca_basis.basis_id if self.pca_basis is not None else None
+        return embedding_encoding == self.embedding_storage and embedding_pca_id == pca_id
+
+
+def find_stored_pca_basis(postgres_engine, model_id, dimensions):
+    with postgres_engine.connect() as connection:
+        row = connection.execute(
+            sqlalchemy.text(
+                """
+                SELECT id, dimensions, mean, components
+                FROM ostis_govno.embeddings_pca_bases
+                WHERE model_id = :model_id AND dimensions = :dimensions
+                ORDER BY id DESC
+                LIMIT 1;
+                """
+            ),
+            {"model_id": model_id, "dimensions": dimensions}
+        ).one_or_none()
+    if row is None:
+        return None
+    return PcaBasis.from_bytes(row.mean, row.components, row.dimensions, row.id)
+
+
+def store_pca_basis(postgres_tx, model_id, pca_basis):
+    pca_basis.basis_id = postgres_tx.execute(
+        sqlalchemy.text(
+            """
+            INSERT INTO ostis_govno.embeddings_pca_bases (model_id, dimensions, mean, components)
+                VALUES (:model_id, :dimensions, :mean, :components)
+            RETURNING id;
+            """
+        ),
+        {
+            "model_id": model_id,
+            "dimensions": pca_basis.dimensions,
+            "mean": pca_basis.mean.tobytes(),
+            "components": pca_basis.components.tobytes()
+        }
+    ).scalar()
+
+
+def insert_landmark_embedding(
+    postgres_tx, neo4j_landmark, landmark_embedding, landmark_summary_hash=None, embedding_encoder=None
+):
+    if embedding_encoder is None:
+        embedding_encoder = EmbeddingEncoder()
     postgres_tx.execute(
         sqlalchemy.text(
             """
             INSERT INTO ostis_govno.landmarks_embeddings
-                (landmark_name, landmark_latitude, landmark_longitude, embedding)
-                VALUES (:landmark_name, :landmark_latitude, :landmark_longitude, :embedding)
+                (
+                    landmark_name, landmark_latitude, landmark_longitude, embedding, summary_hash,
+                    embedding_packed, embedding_scale, embedding_encoding, embedding_pca_id
+                )
+                VALUES (
+                    :landmark_name, :landmark_latitude, :landmark_longitude, :embedding, :summary_hash,
+                    :embedding_packed, :embedding_scale, :embedding_encoding, :embedding_pca_id
+                )
                 ON CONFLICT ON CONSTRAINT landmarks_embeddings_landmark_name_landmark_latitude_landma_key 
-                    DO UPDATE SET embedding = :embedding;
+                    DO UPDATE SET
+                        embedding = EXCLUDED.embedding,
+                        summary_hash = EXCLUDED.summary_hash,
+                        embedding_packed = EXCLUDED.embedding_packed,
+                        embedding_scale = EXCLUDED.embedding_scale,
+                        embedding_encoding = EXCLUDED.embedding_encoding,
+                        embedding_pca_id = EXCLUDED.embedding_pca_id;
             """
         ),
         {
             "landmark_name": neo4j_landmark.get("landmark_name"),
             "landmark_latitude": neo4j_landmark.get("landmark_latitude"),
             "landmark_longitude": neo4j_landmark.get("landmark_longitude"),
-            "embedding": landmark_embedding
+            "summary_hash": landmark_summary_hash,
+            **embedding_encoder.encode(landmark_embedding)
+        }
+    )
+
+
+def float_array_literal(values):
+    return "{" + ",".join(repr(float(value)) for value in values) + "}"
+
+
+def copy_landmarks_embeddings(postgres_tx, landmarks_rows, chunk_size=COPY_CHUNK_SIZE, embedding_encoder=None):
+    # landmarks_rows is iterable of (landmark_name, landmark_latitude, landmark_longitude, embedding, summary_hash).
+    # Rows are streamed to staging table with COPY by chunks, then all of them are upserted with one statement
+    postgres_tx.execute(
+        sqlalchemy.text(
+            """
+            CREATE TEMPORARY TABLE IF NOT EXISTS landmarks_embeddings_staging(
+                row_order           BIGSERIAL,
+                landmark_name       TEXT NOT NULL,
+                landmark_latitude   FLOAT NOT NULL,
+                landmark_longitude  FLOAT NOT NULL,
+                embedding           FLOAT[],
+                summary_hash        TEXT,
+                embedding_packed    BYTEA,
+                embedding_scale     REAL,
+                embedding_encoding  TEXT,
+                embedding_pca_id    BIGINT
+            ) ON COMMIT DROP;
+            """
+        )
+    )
+    postgres_tx.execute(sqlalchemy.text("TRUNCATE landmarks_embeddings_staging;"))
+
+    if embedding_encoder is None:
+        embedding_encoder = EmbeddingEncoder()
+    cursor = postgres_tx.connection.cursor()
+    try:
+        chunk = io.StringIO()
+        writer = csv.writer(chunk, lineterminator="\n", quoting=csv.QUOTE_ALL)
+        rows_in_chunk = 0
+        for landmark_name, landmark_latitude, landmark_longitude, embedding, landmark_summary_hash in landmarks_rows:
+            encoded_embedding = embedding_encoder.encode(embedding)
+            writer.writerow(
+                (
+                    landmark_name, repr(float(landmark_latitude)), repr(float(landmark_longitude)),
+                    None if encoded_embedding["embedding"] is None else float_array_literal(embedding),
+                    landmark_summary_hash,
+                    None if encoded_embedding["embedding_packed"] is None
+                    else "\\x" + encoded_embedding["embedding_packed"].hex(),
+                    encoded_embedding["embedding_scale"],
+                    encoded_embedding["embedding_encoding"],
+                    encoded_embedding["embedding_pca_id"]
+                )
+            )
+            rows_in_chunk += 1
+            if rows_in_chunk == chunk_size:
+                copy_staging_chunk(cursor, chunk)
+                chunk.seek(0)
+                chunk.truncate()
+                rows_in_chunk = 0
+        if rows_in_chunk:
+            copy_staging_chunk(cursor, chunk)
+    finally:
+        cursor.close()
+
+    postgres_tx.execute(
+        sqlalchemy.text(
+            """
+            INSERT INTO ostis_govno.landmarks_embeddings
+                (
+                    landmark_name, landmark_latitude, landmark_longitude, embedding, summary_hash,
+                    embedding_packed, embedding_scale, embedding_encoding, embedding_pca_id
+                )
+                SELECT DISTINCT ON (landmark_name, landmark_latitude, landmark_longitude)
+                    landmark_name, landmark_latitude, landmark_longitude, embedding, summary_hash,
+                    embedding_packed, embedding_scale, embedding_encoding, embedding_pca_id
+                FROM landmarks_embeddings_staging
+                ORDER BY landmark_name, landmark_latitude, landmark_longitude, row_order DESC
+                ON CONFLICT ON CONSTRAINT landmarks_embeddings_landmark_name_landmark_latitude_landma_key
+                    DO UPDATE SET
+                        embedding = EXCLUDED.embedding,
+                        summary_hash = EXCLUDED.summary_hash,
+                        embedding_packed = EXCLUDED.embedding_packed,
+                        embedding_scale = EXCLUDED.embedding_scale,
+                        embedding_encoding = EXCLUDED.embedding_encoding,
+                        embedding_pca_id = EXCLUDED.embedding_pca_id;
+            """
+        )
+    )
+
+
+def copy_staging_chunk(cursor, chunk):
+    chunk.seek(0)
+    cursor.copy_expert(
+        """
+        COPY landmarks_embeddings_staging
+            (
+                landmark_name, landmark_latitude, landmark_longitude, embedding, summary_hash,
+                embedding_packed, embedding_scale, embedding_encoding, embedding_pca_id
+            )
+            FROM STDIN WITH (
+                FORMAT csv,
+                FORCE_NULL (
+                    embedding, summary_hash, embedding_packed, embedding_scale, embedding_encoding, embedding_pca_id
+                )
+            );
+        """,
+        chunk
+    )
+
+
+def iterate_json_array(json_path, read_size=JSON_READ_SIZE):
+    # Incremental parsing of json file with list of objects, only current part of file is kept in memory
+    decoder = json.JSONDecoder()
+    with open(json_path, 'r', encoding='utf-8') as json_file:
+        buffer = json_file.read(read_size).lstrip()
+        if not buffer.startswith("["):
+            raise ValueError(f"File \"{json_path}\" doesn't contain json list.")
+        buffer = buffer[1:]
+        end_of_file = False
+        while True:
+            buffer = buffer.lstrip()
+            if buffer.startswith(","):
+                buffer = buffer[1:].lstrip()
+            if buffer.startswith("]"):
+                return
+            try:
+                element, element_end = decoder.raw_decode(buffer)
+            except json.JSONDecodeError:
+                if end_of_file:
+                    raise
+                file_part = json_file.read(read_size)
+                end_of_file = not file_part
+                buffer += file_part
+                continue
+            yield element
+            buffer = buffer[element_end:]
+
+
+def iterate_batches(iterable, batch_size):
+    batch = []
+    for element in iterable:
+        batch.append(element)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def summary_hash(summary):
+    return hashlib.sha256(summary.encode("utf-8")).hexdigest()
+
+
+def start_import_run(
+    postgres_engine, json_path, model_id, resume=True, embedding_storage="float_array", pca_dimensions=0
+):
+    # Returns (run_id, set of (json landmark key, summary hash), that are already written by this run).
+    # Run is resumed only with the same model and storage of embeddings, other unfinished runs of the same json file
+    # are superseded by the returned run and are finished
+    run_settings = {
+        "json_path": json_path,
+        "model_id": model_id,
+        "embedding_storage": embedding_storage,
+        "pca_dimensions": pca_dimensions
+    }
+    with postgres_engine.begin() as tx:
+        run_id = None
+        if resume:
+            run_id = tx.execute(
+                sqlalchemy.text(
+                    """
+                    SELECT id
+                    FROM ostis_govno.embeddings_import_runs
+                    WHERE
+                        json_path = :json_path AND
+                        model_id = :model_id AND
+                        embedding_storage = :embedding_storage AND
+                        pca_dimensions = :pca_dimensions AND
+                        finished_at IS NULL
+                    ORDER BY id DESC
+                    LIMIT 1;
+                    """
+                ),
+                run_settings
+            ).scalar()
+        resumed = run_id is not None
+        if not resumed:
+            run_id = tx.execute(
+                sqlalchemy.text(
+                    """
+                    INSERT INTO ostis_govno.embeddings_import_runs
+                        (json_path, model_id, embedding_storage, pca_dimensions)
+                        VALUES (:json_path, :model_id, :embedding_storage, :pca_dimensions)
+                    RETURNING id;
+                    """
+                ),
+                run_settings
+            ).scalar()
+
+        superseded_runs_ids = tx.execute(
+            sqlalchemy.text(
+                """
+                UPDATE ostis_govno.embeddings_import_runs
+                SET finished_at = now()
+                WHERE json_path = :json_path AND finished_at IS NULL AND id <> :run_id
+                RETURNING id;
+                """
+            ),
+            {"json_path": json_path, "run_id": run_id}
+        ).scalars().all()
+        if superseded_runs_ids:
+            tx.execute(
+                sqlalchemy.text(
+                    "DELETE FROM ostis_govno.embeddings_import_progress WHERE run_id = ANY(:runs_ids);"
+                ),
+                {"runs_ids": list(superseded_runs_ids)}
+            )
+            print(f"Unfinished import runs superseded: {len(superseded_runs_ids)}", flush=True)
+        if not resumed:
+            return run_id, set()
+
+        written_landmarks = {
+            ((row.landmark_name, row.landmark_latitude, row.landmark_longitude), row.summary_hash)
+            for row in tx.execute(
+                sqlalchemy.text(
+                    """
+                    SELECT landmark_name, landmark_latitude, landmark_longitude, summary_hash
+                    FROM ostis_govno.embeddings_import_progress
+                    WHERE run_id = :run_id;
+                    """
+                ),
+                {"run_id": run_id}
+            )
+        }
+        return run_id, written_landmarks
+
+
+def finish_import_run(postgres_engine, run_id):
+    with postgres_engine.begin() as tx:
+        tx.execute(
+            sqlalchemy.text("UPDATE ostis_govno.embeddings_import_runs SET finished_at = now() WHERE id = :run_id;"),
+            {"run_id": run_id}
+        )
+        tx.execute(
+            sqlalchemy.text("DELETE FROM ostis_govno.embeddings_import_progress WHERE run_id = :run_id;"),
+            {"run_id": run_id}
+        )
+
+
+def record_import_progress(postgres_tx, run_id, json_landmarks):
+    if not json_landmarks:
+        return
+    landmarks_keys = [json_landmark_key(json_landmark) for json_landmark in json_landmarks]
+    postgres_tx.execute(
+        sqlalchemy.text(
+            """
+            INSERT INTO ostis_govno.embeddings_import_progress
+                (run_id, landmark_name, landmark_latitude, landmark_longitude, summary_hash)
+                SELECT :run_id, landmark.name, landmark.latitude, landmark.longitude, landmark.summary_hash
+                FROM unnest(
+                    CAST(:names AS TEXT[]),
+                    CAST(:latitudes AS FLOAT[]),
+                    CAST(:longitudes AS FLOAT[]),
+                    CAST(:summaries_hashes AS TEXT[])
+                ) AS landmark(name, latitude, longitude, summary_hash)
+                ON CONFLICT (run_id, landmark_name, landmark_latitude, landmark_longitude)
+                    DO UPDATE SET summary_hash = EXCLUDED.summary_hash;
+            """
+        ),
+        {
+            "run_id": run_id,
+            "names": [key[0] for key in landmarks_keys],
+            "latitudes": [key[1] for key in landmarks_keys],
+            "longitudes": [key[2] for key in landmarks_keys],
+            "summaries_hashes": [summary_hash(json_landmark["summary"]) for json_landmark in json_landmarks]
         }
     )
 
 
-def fill_postgres_db(postgres_tx, neo4j_driver, json_landmarks_list, tokenizer, model, device):
-    for json_landmark in json_landmarks_list:
-        with torch.no_grad():
-            landmark_embedding = find_landmark_embedding(json_landmark, tokenizer, model, device)
-        # Get the correct landmark info from neo4j
+class StoredLandmarksIndex:
+    # Keys and summary hashes of landmarks, that already have embeddings in postgres.
+    # Stored landmark matches json landmark by the same rule, as landmarks are found in neo4j:
+    # equal coordinates and stored name starts with json name.
+    # Landmark is unchanged only if its embedding is stored as embedding_encoder writes it, so switching
+    # embedding storage or PCA dimensions re-embeds landmarks instead of leaving table with mixed storage
 
-        neo4j_landmark = find_landmark_in_neo4j(neo4j_driver, json_landmark)
+    def __init__(self, postgres_engine, embedding_encoder=None):
+        self._landmarks_by_coordinates = {}
+        self._embedding_encoder = embedding_encoder if embedding_encoder is not None else EmbeddingEncoder()
+        self.matched_keys = set()
+        with postgres_engine.connect() as connection:
+            rows = connection.execute(
+                sqlalchemy.text(
+                    """
+                    SELECT
+                        landmark_name, landmark_latitude, landmark_longitude, summary_hash,
+                        embedding_encoding, embedding_pca_id
+                    FROM ostis_govno.landmarks_embeddings;
+                    """
+                )
+            )
+            for row in rows:
+                self._landmarks_by_coordinates.setdefault(
+                    (row.landmark_latitude, row.landmark_longitude), []
+                ).append((row.landmark_name, row.summary_hash, row.embedding_encoding, row.embedding_pca_id))
+
+    def is_unchanged(self, json_landmark):
+        # Stored landmark is marked as matched, so it is not deleted as removed one
+        json_name, latitude, longitude = json_landmark_key(json_landmark)
+        json_summary_hash = summary_hash(json_landmark["summary"])
+        stored_landmarks = sorted(
+            self._landmarks_by_coordinates.get((latitude, longitude), []),
+            key=lambda stored_landmark: stored_landmark[0]
+        )
+        for stored_name, stored_summary_hash, embedding_encoding, embedding_pca_id in stored_landmarks:
+            if stored_name.startswith(json_name):
+                self.matched_keys.add((stored_name, latitude, longitude))
+                return (
+                    stored_summary_hash == json_summary_hash and
+                    self._embedding_encoder.is_current_encoding(embedding_encoding, embedding_pca_id)
+                )
+        return False
 
-        # Write embedding to postgres
-        insert_landmark_embedding(postgres_tx, neo4j_landmark, landmark_embedding)
+    def removed_keys(self):
+        return [
+            (stored_name, latitude, longitude)
+            for (latitude, longitude), stored_landmarks in self._landmarks_by_coordinates.items()
+            for stored_name, *_ in stored_landmarks
+            if (stored_name, latitude, longitude) not in self.matched_keys
+        ]
 
 
-def define_torch_device():
-    if torch.cuda.is_available():
-        print("Running on GPU")
-        return torch.device("cuda:0")
+def delete_landmarks_embeddings(postgres_engine, landmarks_keys):
+    if not landmarks_keys:
+        return
+    with postgres_engine.begin() as tx:
+        tx.execute(
+            sqlalchemy.text(
+                """
+                DELETE FROM ostis_govno.landmarks_embeddings AS landmarks_embeddings
+                USING unnest(
+                    CAST(:names AS TEXT[]),
+                    CAST(:latitudes AS FLOAT[]),
+                    CAST(:longitudes AS FLOAT[])
+                ) AS removed(name, latitude, longitude)
+                WHERE
+                    landmarks_embeddings.landmark_name = removed.name AND
+                    landmarks_embeddings.landmark_latitude = removed.latitude AND
+                    landmarks_embeddings.landmark_longitude = removed.longitude;
+                """
+            ),
+            {
+                "names": [key[0] for key in landmarks_keys],
+                "latitudes": [key[1] for key in landmarks_keys],
+                "longitudes": [key[2] for key in landmarks_keys]
+            }
+        )
+
+
+def embed_landmarks_batch(json_landmarks_batch, embed_summaries, embedding_cache=None):
+    landmarks_embeddings = find_landmarks_embeddings(json_landmarks_batch, embed_summaries, embedding_cache)
+    return json_landmarks_batch, landmarks_embeddings
+
+
+def resolve_landmarks_batch(neo4j_driver, json_landmarks_batch, landmarks_embeddings):
+    # Get the correct landmarks info from neo4j.
+    # Returns list of (json_landmark, neo4j_landmark, landmark_embedding) for landmarks, found in neo4j
+    neo4j_landmarks, not_found_landmarks = find_landmarks_in_neo4j(neo4j_driver, json_landmarks_batch)
+    if not_found_landmarks:
+        print(f"{len(not_found_landmarks)} landmarks are not found in neo4j and skipped:", flush=True)
+        for name, latitude, longitude in not_found_landmarks:
+            print(f"    \"{name}\" ({latitude}, {longitude})", flush=True)
+
+    return [
+        (json_landmark, neo4j_landmarks[json_landmark_key(json_landmark)], landmark_embedding)
+        for json_landmark, landmark_embedding in zip(json_landmarks_batch, landmarks_embeddings)
+        if json_landmark_key(json_landmark) in neo4j_landmarks
+    ]
+
+
+def write_landmarks_batch(
+    postgres_tx, found_landmarks_embeddings, write_mode="copy", run_id=None, embedding_encoder=None
+):
+    # Write embeddings to postgres
+    if write_mode == "copy":
+        copy_landmarks_embeddings(
+            postgres_tx,
+            (
+                (
+                    neo4j_landmark.get("landmark_name"),
+                    neo4j_landmark.get("landmark_latitude"),
+                    neo4j_landmark.get("landmark_longitude"),
+                    landmark_embedding,
+                    summary_hash(json_landmark["summary"])
+                )
+                for json_landmark, neo4j_landmark, landmark_embedding in found_landmarks_embeddings
+            ),
+            embedding_encoder=embedding_encoder
+        )
     else:
-        print("Running on CPU")
-        return torch.device("cpu")
+        for json_landmark, neo4j_landmark, landmark_embedding in found_landmarks_embeddings:
+            insert_landmark_embedding(
+                postgres_tx, neo4j_landmark, landmark_embedding, summary_hash(json_landmark["summary"]),
+                embedding_encoder
+            )
+    if run_id is not None:
+        record_import_progress(
+            postgres_tx, run_id, [json_landmark for json_landmark, _, _ in found_landmarks_embeddings]
+        )
+    return len(found_landmarks_embeddings)
+
+
+def fill_postgres_db(
+    postgres_connection, neo4j_driver, json_landmarks, embed_summaries, embedding_cache=None,
+    write_mode="copy", pipeline_batch_size=DEFAULT_PIPELINE_BATCH_SIZE, queue_size=DEFAULT_QUEUE_SIZE,
+    commit_every=DEFAULT_COMMIT_EVERY, run_id=None, embedding_encoder=None, pca_fit_size=DEFAULT_PCA_FIT_SIZE,
+    metrics=None
+):
+    # Landmarks are passed by batches through pipeline: embedding -> neo4j resolving -> postgres writing.
+    # Every stage works in its own thread, so network stages overlap model inference.
+    # Written embeddings (and progress of import run) are committed every commit_every landmarks.
+    # If PCA basis is needed, but not stored yet, the first pca_fit_size embeddings are kept until basis is fitted
+    if embedding_encoder is None:
+        embedding_encoder = EmbeddingEncoder()
+    if metrics is None:
+        metrics = ImportMetrics(METRICS_IMPORTER_NAME, metrics_dir="")
+    written_amount = 0
+    not_committed_amount = 0
+    pca_fit_batches = []
+
+    # Stages run once per batch, so their metrics are accumulated and logged in summary of import
+    def embed_stage(json_landmarks_batch):
+        with metrics.stage("embedding", log=False) as stage:
+            embedded_batch = embed_landmarks_batch(json_landmarks_batch, embed_summaries, embedding_cache)
+            stage.add_rows(len(json_landmarks_batch))
+        return embedded_batch
+
+    def resolve_stage(embedded_batch):
+        with metrics.stage("neo4j_resolution", log=False) as stage:
+            found_landmarks_embeddings = resolve_landmarks_batch(neo4j_driver, *embedded_batch)
+            stage.add_rows(len(embedded_batch[0]))
+        return found_landmarks_embeddings
+
+    def write_batch(found_landmarks_embeddings):
+        nonlocal written_amount, not_committed_amount
+        with metrics.stage("postgres_write", log=False) as stage:
+            batch_written_amount = write_landmarks_batch(
+                postgres_connection, found_landmarks_embeddings, write_mode, run_id, embedding_encoder
+            )
+            written_amount += batch_written_amount
+            not_committed_amount += batch_written_amount
+            if not_committed_amount >= commit_every:
+                postgres_connection.commit()
+                not_committed_amount = 0
+                print(f"Embeddings written: {written_amount}", flush=True)
+            stage.add_rows(batch_written_amount)
+
+    def fit_pca_basis():
+        embeddings = [
+            landmark_embedding for batch in pca_fit_batches for _, _, landmark_embedding in batch
+        ]
+        print(f"Fitting PCA basis on {len(embeddings)} embeddings...", flush=True)
+        with metrics.stage("pca_fit") as stage:
+            embedding_encoder.pca_basis = PcaBasis.fit(embeddings, embedding_encoder.pca_dimensions)
+            store_pca_basis(postgres_connection, embedding_encoder.model_id, embedding_encoder.pca_basis)
+            stage.add_rows(len(embeddings))
+        for batch in pca_fit_batches:
+            write_batch(batch)
+        pca_fit_batches.clear()
+
+    def write_stage(found_landmarks_embeddings):
+        if not embedding_encoder.needs_pca_fit:
+            write_batch(found_landmarks_embeddings)
+            return
+        pca_fit_batches.append(found_landmarks_embeddings)
+        if sum(len(batch) for batch in pca_fit_batches) >= pca_fit_size:
+            fit_pca_basis()
+
+    run_pipeline(
+        iterate_batches(json_landmarks, pipeline_batch_size), [embed_stage, resolve_stage, write_stage], queue_size
+    )
+    if pca_fit_batches:
+        fit_pca_basis()
+    postgres_connection.commit()
+    print(f"Embeddings written: {written_amount}", flush=True)
+    return written_amount
+
+
+def load_embedder(args, model_source):
+    # Returns (embed_summaries function, sharded embedder or None)
+    from transformers import BertTokenizerFast
+    import torch
+    from embedding_engine import find_summaries_embeddings, define_torch_device, ShardedEmbedder
+    from inference_backends import load_inference_model, validate_inference_model
+
+    if args['inference_backend'] == "eager":
+        device = define_torch_device()
+    else:
+        print(f"Running on CPU with {args['inference_backend']} inference backend", flush=True)
+        device = torch.device("cpu")
+    tokenizer = BertTokenizerFast.from_pretrained(model_source)
+    model = None
+    if args['workers'] == 1 or args['inference_backend'] != "eager":
+        # With several workers model is loaded here only for validation and onnx export
+        model = load_inference_model(model_source, args['inference_backend'], device, args['onnx_model_path'])
+    if args['inference_backend'] != "eager":
+        validation_summaries = [
+            json_landmark["summary"]
+            for json_landmark in itertools.islice(iterate_json_array(args['json_path']), DEFAULT_VALIDATION_SIZE)
+        ]
+        least_similarity = validate_inference_model(
+            model_source, model, tokenizer, validation_summaries, args['batch_size'], args['min_cosine_similarity']
+        )
+        print(f"Inference backend is validated, least cosine similarity: {least_similarity:.5f}", flush=True)
+
+    if args['workers'] > 1:
+        print(f"Running on CPU with {args['workers']} worker processes", flush=True)
+        sharded_embedder = ShardedEmbedder(
+            model_source, args['workers'], args['threads_per_worker'], args['batch_size'],
+            args['inference_backend'], args['onnx_model_path']
+        )
+        return sharded_embedder, sharded_embedder
+    return functools.partial(
+        find_summaries_embeddings, tokenizer=tokenizer, model=model, device=device, batch_size=args['batch_size']
+    ), None
 
 
-def import_actions(postgres_engine, neo4j_driver, json_path, tokenizer, model, device):
+class LazyEmbedder:
+    # Model is loaded on the first call, so nothing is loaded, if all landmarks are skipped or cached
+
+    def __init__(self, args, model_source):
+        self._args = args
+        self._model_source = model_source
+        self._embed_summaries = None
+        self._sharded_embedder = None
+        self._lock = threading.Lock()
+
+    def __call__(self, summaries):
+        with self._lock:
+            if self._embed_summaries is None:
+                print("Loading embedding model...", flush=True)
+                self._embed_summaries, self._sharded_embedder = load_embedder(self._args, self._model_source)
+        return self._embed_summaries(summaries)
+
+    def close(self):
+        if self._sharded_embedder is not None:
+            self._sharded_embedder.close()
+
+
+def check_connections(postgres_engine, neo4j_driver):
+    # Connections are checked before model is loaded, so wrong arguments are reported immediately
+    try:
+        with postgres_engine.connect() as connection:
+            connection.execute(sqlalchemy.text("SELECT 1;"))
+    except sqlalchemy.exc.SQLAlchemyError as e:
+        raise ConnectionError(f"Can't connect to the embedding database: {e}") from e
+    print("Embedding database is connected.\nConnecting to the neo4j...", flush=True)
+    try:
+        neo4j_driver.verify_connectivity()
+    except (neo4j.exceptions.Neo4jError, neo4j.exceptions.DriverError) as e:
+        raise ConnectionError(f"Can't connect to the neo4j: {e}") from e
+    print("neo4j is connected.", flush=True)
+
+
+def import_actions(
+    postgres_engine, neo4j_driver, json_path, embed_summaries, embedding_cache=None,
+    write_mode="copy", embedding_storage="float_array",
+    pipeline_batch_size=DEFAULT_PIPELINE_BATCH_SIZE, queue_size=DEFAULT_QUEUE_SIZE,
+    commit_every=DEFAULT_COMMIT_EVERY, model_id=MODEL_NAME, resume=True, incremental=False, delete_removed=False,
+    pca_dimensions=0, pca_fit_size=DEFAULT_PCA_FIT_SIZE, metrics=None
+):
+    if metrics is None:
+        metrics = ImportMetrics(METRICS_IMPORTER_NAME, metrics_dir="")
     print("Creating database scheme...", flush=True)
-    create_postgres_scheme(postgres_engine)
-    with open(json_path, 'r', encoding='utf-8') as landmarks_file:
-        json_landmarks_list = json.load(landmarks_file)
-    # All process should be a transaction
-    with postgres_engine.begin() as tx:
+    with metrics.stage("create_scheme"):
+        create_postgres_scheme(postgres_engine, embedding_storage)
+
+    embedding_encoder = EmbeddingEncoder(embedding_storage, model_id, pca_dimensions)
+    if pca_dimensions > 0:
+        # Stored embeddings are comparable only in the same basis, so the existing basis is reused
+        embedding_encoder.pca_basis = find_stored_pca_basis(postgres_engine, model_id, pca_dimensions)
+
+    stored_landmarks = None
+    unchanged_amount = 0
+    if incremental:
+        print("Loading keys of stored embeddings...", flush=True)
+        with metrics.stage("load_stored_keys"):
+            stored_landmarks = StoredLandmarksIndex(postgres_engine, embedding_encoder)
+
+    def is_changed(json_landmark):
+        nonlocal unchanged_amount
+        if stored_landmarks is not None and stored_landmarks.is_unchanged(json_landmark):
+            unchanged_amount += 1
+            return False
+        return True
+
+    run_id, written_landmarks = start_import_run(
+        postgres_engine, json_path, model_id, resume, embedding_storage, pca_dimensions
+    )
+    if written_landmarks:
+        print(f"Resuming import, {len(written_landmarks)} landmarks are already written.", flush=True)
+    json_landmarks = (
+        json_landmark for json_landmark in iterate_json_array(json_path)
+        if is_changed(json_landmark) and
+        (json_landmark_key(json_landmark), summary_hash(json_landmark["summary"])) not in written_landmarks
+    )
+    with postgres_engine.connect() as connection:
         print("Filling database content...", flush=True)
-        fill_postgres_db(tx, neo4j_driver, json_landmarks_list, tokenizer, model, device)
+        with metrics.stage("fill_postgres_db") as stage:
+            stage.add_rows(fill_postgres_db(
+                connection, neo4j_driver, json_landmarks, embed_summaries, embedding_cache,
+                write_mode, pipeline_batch_size, queue_size, commit_every, run_id, embedding_encoder, pca_fit_size,
+                metrics
+            ))
+    if incremental:
+        print(f"Unchanged landmarks skipped: {unchanged_amount}", flush=True)
+        metrics.log_event("unchanged_landmarks_skipped", rows=unchanged_amount)
+        if delete_removed:
+            with metrics.stage("delete_removed") as stage:
+                removed_keys = stored_landmarks.removed_keys()
+                delete_landmarks_embeddings(postgres_engine, removed_keys)
+                stage.add_rows(len(removed_keys))
+            print(f"Embeddings of removed landmarks deleted: {len(removed_keys)}", flush=True)
+    finish_import_run(postgres_engine, run_id)
 
 
 def parse_args():
@@ -150,39 +1075,113 @@ def parse_args():
         arg_pair = arg.split("=")
         if len(arg_pair) != 2:
             raise AttributeError(f"Invalid argument \"{arg}\".")
-        if arg_pair[0].strip() not in REQUIRED_ARGS:
+        if arg_pair[0].strip() not in REQUIRED_ARGS and arg_pair[0].strip() not in OPTIONAL_ARGS:
             raise AttributeError(f"Invalid argument: \"{arg_pair[0]}\".")
         args[arg_pair[0].strip()] = arg_pair[1].strip()
 
     for arg in REQUIRED_ARGS:
         if arg not in args.keys():
             raise AttributeError(f"Argument {arg} is required.")
+    for arg, default_value in OPTIONAL_ARGS.items():
+        args.setdefault(arg, default_value)
+
+    for arg in ["batch_size", "pipeline_batch_size", "queue_size", "workers", "commit_every", "pca_fit_size"]:
+        try:
+            args[arg] = int(args[arg])
+        except ValueError:
+            raise AttributeError(f"Argument {arg} must be integer.")
+        if args[arg] < 1:
+            raise AttributeError(f"Argument {arg} must be positive.")
+    for arg in ["threads_per_worker", "pca_dimensions"]:
+        try:
+            args[arg] = int(args[arg])
+        except ValueError:
+            raise AttributeError(f"Argument {arg} must be integer.")
+    for arg in ["resume", "incremental", "delete_removed"]:
+        if args[arg].lower() == "true" or args[arg].lower() == 't':
+            args[arg] = True
+        elif args[arg].lower() == "false" or args[arg].lower() == 'f':
+            args[arg] = False
+        else:
+            raise AttributeError(f"Available values for {arg} are: True, T, False, F (case insensitive).")
+    if args["write_mode"] not in WRITE_MODES:
+        raise AttributeError(f"Available values for write_mode are: {', '.join(WRITE_MODES)}.")
+    if args["embedding_storage"] not in EMBEDDING_STORAGES:
+        raise AttributeError(f"Available values for embedding_storage are: {', '.join(EMBEDDING_STORAGES)}.")
+    if args["pca_dimensions"] < 0 or args["pca_dimensions"] >= EMBEDDING_DIMENSION:
+        raise AttributeError(f"Argument pca_dimensions must be in range [0, {EMBEDDING_DIMENSION}).")
+    if args["pca_dimensions"] > 0:
+        if args["embedding_storage"] not in PACKED_EMBEDDING_STORAGES:
+            raise AttributeError(
+                f"Argument pca_dimensions is available only for storages: {', '.join(PACKED_EMBEDDING_STORAGES)}."
+            )
+        if args["pca_fit_size"] < args["pca_dimensions"]:
+            raise AttributeError("Argument pca_fit_size must not be less than pca_dimensions.")
+    if args["inference_backend"] not in INFERENCE_BACKENDS:
+        raise AttributeError(f"Available values for inference_backend are: {', '.join(INFERENCE_BACKENDS)}.")
+    for arg in ["embedding_cache_max_size_mb", "min_cosine_similarity"]:
+        try:
+            args[arg] = float(args[arg])
+        except ValueError:
+            raise AttributeError(f"Argument {arg} must be number.")
     return args
 
 
 def main():
     print("Importing embedding database...", flush=True)
     args = parse_args()
+    metrics = ImportMetrics(METRICS_IMPORTER_NAME, args['metrics_dir'])
+
+    if not os.path.isfile(args['json_path']):
+        raise AttributeError(f"File \"{args['json_path']}\" doesn't exist.")
+    model_source = MODEL_NAME
+    if args['model_store_dir']:
+        if not os.path.isdir(args['model_store_dir']):
+            raise AttributeError(
+                f"Model store \"{args['model_store_dir']}\" doesn't exist. Create it with postgres/model_store.py"
+            )
+        model_source = args['model_store_dir']
 
     print("Connecting to the embedding database...", flush=True)
     postgres_engine = sqlalchemy.create_engine(
         f"postgresql://{args['postgres_user']}:{args['postgres_password']}@{args['postgres_host']}:{args['postgres_port']}/postgres"
     )
-    print("Embedding database is connected.\nConnecting to the neo4j...", flush=True)
-
     neo4j_driver = neo4j.GraphDatabase.driver(
         f"bolt://{args['neo4j_host']}:{args['neo4j_port']}", auth=(args['neo4j_user'], args['neo4j_password'])
     )
-    print("neo4j is connected.", flush=True)
+    check_connections(postgres_engine, neo4j_driver)
+
+    # Embeddings of different backends differ a bit, so they are cached separately
+    model_id = MODEL_NAME if args['inference_backend'] == "eager" else f"{MODEL_NAME}:{args['inference_backend']}"
+    embedding_cache = None
+    if args['embedding_cache_path']:
+        embedding_cache = EmbeddingCache(
+            args['embedding_cache_path'], model_id, int(args['embedding_cache_max_size_mb'] * 1024 * 1024)
+        )
 
-    device = define_torch_device()
-    tokenizer = BertTokenizerFast.from_pretrained("DeepPavlov/rubert-base-cased")
-    model = BertModel.from_pretrained("DeepPavlov/rubert-base-cased")
-    model = model.to(device)
+    embed_summaries = LazyEmbedder(args, model_source)
+    if args['workers'] > 1:
+        # Every worker should get at least one full batch of summaries from every pipeline batch
+        args['pipeline_batch_size'] = max(args['pipeline_batch_size'], args['workers'] * args['batch_size'])
 
-    import_actions(postgres_engine, neo4j_driver, args['json_path'], tokenizer, model, device)
+    try:
+        import_actions(
+            postgres_engine, neo4j_driver, args['json_path'], embed_summaries,
+            embedding_cache, args['write_mode'], args['embedding_storage'],
+            args['pipeline_batch_size'], args['queue_size'], args['commit_every'], model_id, args['resume'],
+            args['incremental'], args['delete_removed'], args['pca_dimensions'], args['pca_fit_size'], metrics
+        )
+    except Exception as e:
+        metrics.log_event("import_failed", error=str(e), error_type=type(e).__name__)
+        metrics.finish(success=False)
+        raise
+    metrics.finish(success=True)
     print("Import has been finished.", flush=True)
 
+    embed_summaries.close()
+    if embedding_cache is not None:
+        embedding_cache.close()
+
     neo4j_driver.close()
 
 
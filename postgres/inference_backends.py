@@ -0,0 +1,142 @@
+import os
+import json
+import types
+import torch
+from transformers import BertModel, BertConfig
+
+from embedding_engine import find_summaries_embeddings
+from embedding_settings import DEFAULT_ONNX_MODEL_PATH, DEFAULT_MIN_COSINE_SIMILARITY
+
+
+ONNX_OPSET_VERSION = 14
+
+
+class OnnxBertModel:
+    # Runs exported BertModel with onnxruntime, returns output in the same form as BertModel
+
+    def __init__(self, onnx_model_path, threads_amount=0):
+        import onnxruntime
+
+        session_options = onnxruntime.SessionOptions()
+        session_options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads_amount > 0:
+            session_options.intra_op_num_threads = threads_amount
+            session_options.inter_op_num_threads = 1
+        self._session = onnxruntime.InferenceSession(
+            onnx_model_path, session_options, providers=["CPUExecutionProvider"]
+        )
+
+    def __call__(self, input_ids, attention_mask):
+        last_hidden_state, = self._session.run(
+            ["last_hidden_state"],
+            {
+                "input_ids": input_ids.cpu().type(torch.int64).numpy(),
+                "attention_mask": attention_mask.cpu().type(torch.int64).numpy()
+            }
+        )
+        return types.SimpleNamespace(last_hidden_state=torch.from_numpy(last_hidden_state))
+
+
+def export_onnx_model(model, onnx_model_path):
+    dummy_input_ids = torch.ones((2, 16), dtype=torch.int64)
+    dummy_attention_mask = torch.ones((2, 16), dtype=torch.int64)
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            (dummy_input_ids, dummy_attention_mask),
+            onnx_model_path,
+            input_names=["input_ids", "attention_mask"],
+            output_names=["last_hidden_state", "pooler_output"],
+            dynamic_axes={
+                "input_ids": {0: "batch", 1: "sequence"},
+                "attention_mask": {0: "batch", 1: "sequence"},
+                "last_hidden_state": {0: "batch", 1: "sequence"},
+                "pooler_output": {0: "batch"}
+            },
+            opset_version=ONNX_OPSET_VERSION
+        )
+
+
+def onnx_source_path(onnx_model_path):
+    # Sidecar file with identity of the model, onnx graph was exported from
+    return f"{onnx_model_path}.source.json"
+
+
+def define_model_source_id(model_name):
+    # Model name (or local directory) with resolved hub revision and sizes and modification times of local files,
+    # so exported onnx graph isn't reused after model is updated
+    config = BertConfig.from_pretrained(model_name)
+    source_id = {
+        "model_name": os.path.abspath(model_name) if os.path.isdir(model_name) else model_name,
+        "revision": getattr(config, "_commit_hash", None),
+        "onnx_opset_version": ONNX_OPSET_VERSION
+    }
+    if os.path.isdir(model_name):
+        source_id["files"] = [
+            [filename, os.path.getsize(os.path.join(model_name, filename)),
+             os.path.getmtime(os.path.join(model_name, filename))]
+            for filename in sorted(os.listdir(model_name))
+            if os.path.isfile(os.path.join(model_name, filename))
+        ]
+    return source_id
+
+
+def is_onnx_model_actual(onnx_model_path, source_id):
+    if not os.path.exists(onnx_model_path) or not os.path.exists(onnx_source_path(onnx_model_path)):
+        return False
+    try:
+        with open(onnx_source_path(onnx_model_path), "r", encoding="utf-8") as source_file:
+            return json.load(source_file) == source_id
+    except (OSError, ValueError):
+        return False
+
+
+def load_inference_model(
+    model_name, inference_backend="eager", device=torch.device("cpu"),
+    onnx_model_path=DEFAULT_ONNX_MODEL_PATH, threads_amount=0
+):
+    # int8 and onnx backends are cpu only
+    if inference_backend == "onnx":
+        source_id = define_model_source_id(model_name)
+        if not is_onnx_model_actual(onnx_model_path, source_id):
+            print(f"Exporting {model_name} to onnx graph \"{onnx_model_path}\"...", flush=True)
+            # Graph is exported to temporary file, so interrupted export isn't taken for complete one
+            export_onnx_model(BertModel.from_pretrained(model_name).eval(), f"{onnx_model_path}.tmp")
+            os.replace(f"{onnx_model_path}.tmp", onnx_model_path)
+            with open(onnx_source_path(onnx_model_path), "w", encoding="utf-8") as source_file:
+                json.dump(source_id, source_file)
+        return OnnxBertModel(onnx_model_path, threads_amount)
+
+    model = BertModel.from_pretrained(model_name).eval()
+    if inference_backend == "int8":
+        # Weights of Linear layers are quantized to int8, activations are quantized dynamically
+        return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    return model.to(device)
+
+
+def validate_inference_model(
+    model_name, inference_model, tokenizer, summaries, batch_size, min_cosine_similarity=DEFAULT_MIN_COSINE_SIMILARITY
+):
+    # Embeddings of optimised model are compared with embeddings of eager full precision model.
+    # Returns the least cosine similarity, raises ValueError, if it is less than min_cosine_similarity
+    summaries = list(summaries)
+    if not summaries:
+        return 1.0
+    baseline_model = BertModel.from_pretrained(model_name).eval()
+    device = torch.device("cpu")
+    baseline_embeddings = torch.tensor(
+        find_summaries_embeddings(summaries, tokenizer, baseline_model, device, batch_size)
+    )
+    del baseline_model
+    checked_embeddings = torch.tensor(
+        find_summaries_embeddings(summaries, tokenizer, inference_model, device, batch_size)
+    )
+    least_similarity = torch.nn.functional.cosine_similarity(
+        baseline_embeddings, checked_embeddings, dim=1
+    ).min().item()
+    if least_similarity < min_cosine_similarity:
+        raise ValueError(
+            f"Inference backend differs from the baseline model: least cosine similarity is {least_similarity:.5f}, "
+            f"required {min_cosine_similarity}."
+        )
+    return least_similarity
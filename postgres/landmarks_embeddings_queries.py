@@ -0,0 +1,130 @@
+import json
+import threading
+import sqlalchemy
+
+from embedding_packing import PcaBasis, unpack_embedding, PACKED_EMBEDDING_STORAGES
+
+
+EMBEDDING_DIMENSION = 768  # hidden size of DeepPavlov/rubert-base-cased
+EMBEDDING_STORAGES = ["float_array", "vector"] + PACKED_EMBEDDING_STORAGES
+DEFAULT_SIMILAR_LANDMARKS_AMOUNT = 10
+
+
+def vector_literal(embedding):
+    return "[" + ",".join(repr(float(value)) for value in embedding) + "]"
+
+
+# PCA bases are immutable, so they are loaded once per process
+_pca_bases = {}
+_pca_bases_lock = threading.Lock()
+
+
+def load_pca_basis(postgres_connection, basis_id):
+    with _pca_bases_lock:
+        if basis_id not in _pca_bases:
+            row = postgres_connection.execute(
+                sqlalchemy.text(
+                    """
+                    SELECT id, dimensions, mean, components
+                    FROM ostis_govno.embeddings_pca_bases
+                    WHERE id = :basis_id;
+                    """
+                ),
+                {"basis_id": basis_id}
+            ).one()
+            _pca_bases[basis_id] = PcaBasis.from_bytes(row.mean, row.components, row.dimensions, row.id)
+        return _pca_bases[basis_id]
+
+
+def decode_embedding(postgres_connection, row):
+    # row must contain embedding, embedding_packed, embedding_scale, embedding_encoding and embedding_pca_id.
+    # Packed embeddings are dequantized and projected back from PCA space, so list of EMBEDDING_DIMENSION floats
+    # is returned for every storage
+    if row.embedding_packed is None:
+        if row.embedding is None:
+            return None
+        embedding = row.embedding
+        if isinstance(embedding, str):  # vector column is returned as text "[x1,x2,...]"
+            embedding = json.loads(embedding)
+        return [float(value) for value in embedding]
+
+    embedding = unpack_embedding(row.embedding_packed, row.embedding_scale, row.embedding_encoding)
+    if row.embedding_pca_id is not None:
+        embedding = load_pca_basis(postgres_connection, row.embedding_pca_id).reconstruct(embedding)
+    return embedding.tolist()
+
+
+def get_landmark_embedding(postgres_connection, landmark_name, landmark_latitude, landmark_longitude):
+    # Returns embedding as list of floats or None, if landmark has no embedding
+    row = postgres_connection.execute(
+        sqlalchemy.text(
+            """
+            SELECT embedding, embedding_packed, embedding_scale, embedding_encoding, embedding_pca_id
+            FROM ostis_govno.landmarks_embeddings
+            WHERE
+                landmark_name = :landmark_name AND
+                landmark_latitude = :landmark_latitude AND
+                landmark_longitude = :landmark_longitude;
+            """
+        ),
+        {
+            "landmark_name": landmark_name,
+            "landmark_latitude": landmark_latitude,
+            "landmark_longitude": landmark_longitude
+        }
+    ).one_or_none()
+    if row is None:
+        return None
+    return decode_embedding(postgres_connection, row)
+
+
+def find_similar_landmarks(
+    postgres_connection, embedding=None, landmark_key=None, k=DEFAULT_SIMILAR_LANDMARKS_AMOUNT, ef_search=None
+):
+    # Top k landmarks by cosine similarity to the embedding or to the embedding of the landmark, given by
+    # landmark_key = (landmark_name, landmark_latitude, landmark_longitude) (landmark itself is excluded).
+    # Requires embedding_storage=vector, so ORDER BY ... LIMIT is served by hnsw index.
+    if (embedding is None) == (landmark_key is None):
+        raise AttributeError("Exactly one of embedding and landmark_key must be given.")
+    if ef_search is not None:
+        # hnsw.ef_search must be not less than k, otherwise less than k landmarks can be returned
+        postgres_connection.execute(
+            sqlalchemy.text("SELECT set_config('hnsw.ef_search', :ef_search, true);"),
+            {"ef_search": str(max(int(ef_search), k))}
+        )
+
+    landmark_name, landmark_latitude, landmark_longitude = None, None, None
+    if landmark_key is not None:
+        landmark_name, landmark_latitude, landmark_longitude = landmark_key
+        embedding = get_landmark_embedding(postgres_connection, landmark_name, landmark_latitude, landmark_longitude)
+        if embedding is None:
+            return []
+
+    result = postgres_connection.execute(
+        sqlalchemy.text(
+            """
+            SELECT
+                landmark_name,
+                landmark_latitude,
+                landmark_longitude,
+                1 - (embedding <=> CAST(:embedding AS vector)) AS similarity
+            FROM ostis_govno.landmarks_embeddings
+            WHERE
+                CAST(:landmark_name AS TEXT) IS NULL OR NOT (
+                    landmark_name = :landmark_name AND
+                    landmark_latitude = :landmark_latitude AND
+                    landmark_longitude = :landmark_longitude
+                )
+            ORDER BY embedding <=> CAST(:embedding AS vector)
+            LIMIT :k;
+            """
+        ),
+        {
+            "embedding": vector_literal(embedding),
+            "landmark_name": landmark_name,
+            "landmark_latitude": landmark_latitude,
+            "landmark_longitude": landmark_longitude,
+            "k": k
+        }
+    )
+    return [row._asdict() for row in result]
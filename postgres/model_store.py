@@ -0,0 +1,41 @@
+# Snapshots tokenizer and weights of embedding model into local directory (weights are saved as safetensors),
+# so import_db.py loads model quickly and doesn't need network.
+# Usage: python3 postgres/model_store.py model_store_dir=./model_store
+import sys
+import os
+
+from embedding_settings import MODEL_NAME
+
+
+AVAILABLE_ARGS = ["model_store_dir", "model_name"]
+
+
+def create_model_store(model_store_dir, model_name=MODEL_NAME):
+    from transformers import BertTokenizerFast, BertModel
+
+    os.makedirs(model_store_dir, exist_ok=True)
+    tokenizer = BertTokenizerFast.from_pretrained(model_name)
+    tokenizer.save_pretrained(model_store_dir)
+    model = BertModel.from_pretrained(model_name)
+    model.save_pretrained(model_store_dir, safe_serialization=True)
+
+
+def main():
+    args = {"model_name": MODEL_NAME}
+    for arg in sys.argv[1:]:
+        arg_pair = arg.split("=")
+        if len(arg_pair) != 2:
+            raise AttributeError(f"Invalid argument \"{arg}\".")
+        if arg_pair[0].strip() not in AVAILABLE_ARGS:
+            raise AttributeError(f"Invalid argument: \"{arg_pair[0]}\".")
+        args[arg_pair[0].strip()] = arg_pair[1].strip()
+    if "model_store_dir" not in args:
+        raise AttributeError("Argument model_store_dir is required.")
+
+    print(f"Saving {args['model_name']} to \"{args['model_store_dir']}\"...", flush=True)
+    create_model_store(args['model_store_dir'], args['model_name'])
+    print("Model store is created.", flush=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+import queue
+import threading
+
+
+DEFAULT_QUEUE_SIZE = 4
+_QUEUE_POLL_TIMEOUT = 0.1
+_END_OF_STREAM = object()
+
+
+def run_pipeline(source, stages, queue_size=DEFAULT_QUEUE_SIZE):
+    # Every item of source is passed through stages (functions item -> item) one after another.
+    # Source and every stage work in their own threads, connected with bounded queues, so
+    # stages overlap each other and at most queue_size items are waiting before every stage.
+    # First exception, raised in any thread, stops the pipeline and is raised again in caller thread.
+    stop_event = threading.Event()
+    errors = []
+    queues = [queue.Queue(maxsize=queue_size) for _ in stages]
+
+    def put(stage_queue, item):
+        while not stop_event.is_set():
+            try:
+                stage_queue.put(item, timeout=_QUEUE_POLL_TIMEOUT)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def get(stage_queue):
+        while not stop_event.is_set():
+            try:
+                return stage_queue.get(timeout=_QUEUE_POLL_TIMEOUT)
+            except queue.Empty:
+                continue
+        return _END_OF_STREAM
+
+    def fail(error):
+        errors.append(error)
+        stop_event.set()
+
+    def produce():
+        try:
+            for item in source:
+                if not put(queues[0], item):
+                    return
+            put(queues[0], _END_OF_STREAM)
+        except BaseException as e:
+            fail(e)
+
+    def run_stage(stage_index):
+        stage = stages[stage_index]
+        output_queue = queues[stage_index + 1] if stage_index + 1 < len(stages) else None
+        try:
+            while True:
+                item = get(queues[stage_index])
+                if item is _END_OF_STREAM:
+                    break
+                result = stage(item)
+                if output_queue is not None and not put(output_queue, result):
+                    return
+            if output_queue is not None:
+                put(output_queue, _END_OF_STREAM)
+        except BaseException as e:
+            fail(e)
+
+    threads = [threading.Thread(target=produce, name="pipeline-source", daemon=True)]
+    for stage_index, stage in enumerate(stages):
+        stage_name = getattr(stage, "__name__", str(stage_index))
+        threads.append(
+            threading.Thread(target=run_stage, args=(stage_index,), name=f"pipeline-{stage_name}", daemon=True)
+        )
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if errors:
+        raise errors[0]
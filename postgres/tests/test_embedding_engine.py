@@ -0,0 +1,57 @@
+# Checks, that embeddings of chunks don't depend on batching: padding tokens are excluded from mean pooling,
+# so chunk embedded in batch with longer chunks is the same as chunk embedded alone.
+# Model is replaced with lookup of token embeddings (output of token doesn't depend on other tokens).
+# Usage: python3 -m unittest discover -s postgres/tests
+import sys
+import types
+import pathlib
+import unittest
+import torch
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+from embedding_engine import embed_chunks, gather_summaries_embeddings
+
+
+PAD_TOKEN_ID = 0
+VOCABULARY_SIZE = 50
+HIDDEN_SIZE = 8
+CHUNKS = [[5, 6, 7], [1, 2, 3, 4, 5, 6, 7], [9], [10, 11, 12, 13, 14]]
+
+
+class TokenLookupModel:
+    def __init__(self):
+        generator = torch.Generator().manual_seed(0)
+        # Embedding of padding token isn't zero, so it changes the mean, if it is not masked
+        self.token_embeddings = torch.randn((VOCABULARY_SIZE, HIDDEN_SIZE), generator=generator)
+
+    def __call__(self, input_ids, attention_mask):
+        return types.SimpleNamespace(last_hidden_state=self.token_embeddings[input_ids.long()])
+
+
+class MeanPoolingTest(unittest.TestCase):
+    def setUp(self):
+        self.model = TokenLookupModel()
+        self.device = torch.device("cpu")
+
+    def test_batched_equals_unbatched(self):
+        batched = embed_chunks(CHUNKS, self.model, self.device, PAD_TOKEN_ID, batch_size=len(CHUNKS))
+        unbatched = embed_chunks(CHUNKS, self.model, self.device, PAD_TOKEN_ID, batch_size=1)
+        self.assertEqual((len(CHUNKS), HIDDEN_SIZE), tuple(batched.shape))
+        self.assertTrue(torch.allclose(batched, unbatched, atol=1e-6))
+
+    def test_padding_is_ignored(self):
+        embeddings = embed_chunks(CHUNKS, self.model, self.device, PAD_TOKEN_ID, batch_size=len(CHUNKS))
+        for chunk, embedding in zip(CHUNKS, embeddings):
+            expected = self.model.token_embeddings[torch.tensor(chunk)].mean(dim=0)
+            self.assertTrue(torch.allclose(expected, embedding, atol=1e-6))
+
+    def test_summary_is_mean_of_its_chunks(self):
+        chunks_embeddings = embed_chunks(CHUNKS, self.model, self.device, PAD_TOKEN_ID)
+        summaries_embeddings = gather_summaries_embeddings(chunks_embeddings, [0, 0, 1, 0], 2)
+        expected_first = chunks_embeddings[[0, 1, 3]].mean(dim=0)
+        self.assertTrue(torch.allclose(expected_first, torch.tensor(summaries_embeddings[0]), atol=1e-6))
+        self.assertTrue(torch.allclose(chunks_embeddings[2], torch.tensor(summaries_embeddings[1]), atol=1e-6))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,127 @@
+# Checks compact storages of embeddings: float16 and int8 round trip, PCA projection and
+# EmbeddingEncoder, which decides, whether stored embedding is written in the current storage.
+# Usage: python3 -m unittest discover -s postgres/tests
+import sys
+import pathlib
+import unittest
+import numpy as np
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+from embedding_packing import PcaBasis, pack_embedding, unpack_embedding
+
+
+EMBEDDING_SIZE = 768
+
+
+class PackEmbeddingTest(unittest.TestCase):
+    def setUp(self):
+        self.embedding = np.random.default_rng(0).normal(size=EMBEDDING_SIZE).astype(np.float32)
+
+    def test_float16_round_trip(self):
+        packed, scale = pack_embedding(self.embedding, "float16")
+        self.assertIsNone(scale)
+        self.assertEqual(EMBEDDING_SIZE * 2, len(packed))
+        unpacked = unpack_embedding(packed, scale, "float16")
+        self.assertTrue(np.allclose(self.embedding, unpacked, rtol=1e-3, atol=1e-3))
+
+    def test_int8_round_trip(self):
+        packed, scale = pack_embedding(self.embedding, "int8")
+        self.assertEqual(EMBEDDING_SIZE, len(packed))
+        unpacked = unpack_embedding(packed, scale, "int8")
+        # Every value is rounded to the nearest step of quantization
+        self.assertLessEqual(float(np.abs(self.embedding - unpacked).max()), scale / 2 + 1e-6)
+        cosine_similarity = float(
+            self.embedding @ unpacked / (np.linalg.norm(self.embedding) * np.linalg.norm(unpacked))
+        )
+        self.assertGreater(cosine_similarity, 0.999)
+
+    def test_int8_zero_embedding(self):
+        packed, scale = pack_embedding(np.zeros(EMBEDDING_SIZE), "int8")
+        self.assertTrue(np.array_equal(np.zeros(EMBEDDING_SIZE), unpack_embedding(packed, scale, "int8")))
+
+    def test_unknown_encoding(self):
+        with self.assertRaises(ValueError):
+            pack_embedding(self.embedding, "float8")
+
+
+class PcaBasisTest(unittest.TestCase):
+    def setUp(self):
+        self.embeddings = np.random.default_rng(1).normal(size=(64, 32)).astype(np.float32)
+
+    def test_projection_keeps_dimensions(self):
+        basis = PcaBasis.fit(self.embeddings, 8)
+        self.assertEqual(8, basis.dimensions)
+        self.assertEqual((8,), basis.project(self.embeddings[0]).shape)
+        self.assertEqual((64, 8), basis.project(self.embeddings).shape)
+        self.assertEqual((32,), basis.reconstruct(basis.project(self.embeddings[0])).shape)
+
+    def test_full_basis_reconstructs_embedding(self):
+        basis = PcaBasis.fit(self.embeddings, 32)
+        reconstructed = basis.reconstruct(basis.project(self.embeddings[0]))
+        self.assertTrue(np.allclose(self.embeddings[0], reconstructed, atol=1e-4))
+
+    def test_from_bytes(self):
+        basis = PcaBasis.fit(self.embeddings, 8)
+        restored = PcaBasis.from_bytes(basis.mean.tobytes(), basis.components.tobytes(), 8, basis_id=3)
+        self.assertEqual(3, restored.basis_id)
+        self.assertTrue(np.array_equal(basis.project(self.embeddings[1]), restored.project(self.embeddings[1])))
+
+    def test_too_few_embeddings(self):
+        with self.assertRaises(ValueError):
+            PcaBasis.fit(self.embeddings[:4], 8)
+
+
+class EmbeddingEncoderTest(unittest.TestCase):
+    def setUp(self):
+        from import_db import EmbeddingEncoder
+
+        self.encoder_class = EmbeddingEncoder
+        self.embedding = np.random.default_rng(2).normal(size=EMBEDDING_SIZE).astype(np.float32)
+
+    def test_float_array_and_vector(self):
+        for embedding_storage in ["float_array", "vector"]:
+            encoder = self.encoder_class(embedding_storage)
+            encoded = encoder.encode(self.embedding.tolist())
+            self.assertEqual(self.embedding.tolist(), encoded["embedding"])
+            self.assertIsNone(encoded["embedding_packed"])
+            self.assertTrue(encoder.is_current_encoding(None, None))
+            self.assertFalse(encoder.is_current_encoding("float16", None))
+            self.assertFalse(encoder.is_current_encoding("int8", 1))
+
+    def test_packed_without_pca(self):
+        for embedding_storage in ["float16", "int8"]:
+            encoder = self.encoder_class(embedding_storage)
+            encoded = encoder.encode(self.embedding)
+            self.assertIsNone(encoded["embedding"])
+            self.assertEqual(embedding_storage, encoded["embedding_encoding"])
+            self.assertIsNone(encoded["embedding_pca_id"])
+            unpacked = unpack_embedding(encoded["embedding_packed"], encoded["embedding_scale"], embedding_storage)
+            self.assertEqual((EMBEDDING_SIZE,), unpacked.shape)
+            self.assertTrue(encoder.is_current_encoding(embedding_storage, None))
+            self.assertFalse(encoder.is_current_encoding(None, None))
+            self.assertFalse(encoder.is_current_encoding(embedding_storage, 1))
+            other_storage = "int8" if embedding_storage == "float16" else "float16"
+            self.assertFalse(encoder.is_current_encoding(other_storage, None))
+
+    def test_packed_with_pca(self):
+        embeddings = np.random.default_rng(3).normal(size=(32, EMBEDDING_SIZE)).astype(np.float32)
+        basis = PcaBasis.fit(embeddings, 16)
+        basis.basis_id = 7
+        encoder = self.encoder_class("int8", pca_dimensions=16, pca_basis=basis)
+        encoded = encoder.encode(self.embedding)
+        self.assertEqual(7, encoded["embedding_pca_id"])
+        self.assertEqual(16, len(encoded["embedding_packed"]))
+        self.assertTrue(encoder.is_current_encoding("int8", 7))
+        self.assertFalse(encoder.is_current_encoding("int8", None))
+        self.assertFalse(encoder.is_current_encoding("int8", 8))
+
+    def test_pca_basis_is_not_fitted(self):
+        # Embeddings of new basis are not comparable with stored ones, so nothing is current
+        encoder = self.encoder_class("float16", pca_dimensions=16)
+        self.assertTrue(encoder.needs_pca_fit)
+        self.assertFalse(encoder.is_current_encoding("float16", None))
+        self.assertFalse(encoder.is_current_encoding("float16", 7))
+
+
+if __name__ == "__main__":
+    unittest.main()